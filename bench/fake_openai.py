@@ -0,0 +1,152 @@
+"""
+Stand-in for the OpenAI chat completions API, for benchmarks and load tests.
+
+Serves POST /v1/chat/completions (plain and stream=True) from a thread, so
+the service can be pointed at it with OPENAI_BASE_URL and run without an
+API key or network access. The answer is a fixed sentence; latency is
+simulated with a delay before the first byte, drawn from a distribution
+(see latency_sampler), and a fixed delay between streamed tokens.
+
+    base_url = fake_openai.start(latency="lognormal:400:0.5")
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+or as a separate process:
+
+    python bench/fake_openai.py --port 18000 --latency lognormal:400:0.5
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from typing import Callable, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "Based on the provided context, the answer is described in the retrieved documents."
+
+
+def latency_sampler(spec: str) -> Callable[[], float]:
+    """
+    Latency distribution from a spec, as a function returning seconds.
+
+    Specs (all times in ms):
+        200 or fixed:200
+        uniform:100:400          low, high
+        normal:300:50            mean, standard deviation (clipped at 0)
+        lognormal:300:0.5        median, sigma of the underlying normal
+        exp:300                  mean
+    """
+    kind, _, rest = spec.partition(":")
+    if not rest:
+        kind, rest = "fixed", kind
+    params = [float(p) for p in rest.split(":")]
+    rng = random.Random(0)
+    if kind == "fixed":
+        return lambda: params[0] / 1000
+    if kind == "uniform":
+        return lambda: rng.uniform(params[0], params[1]) / 1000
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(params[0], params[1])) / 1000
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(params[0]), params[1]) / 1000
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / params[0]) / 1000 if params[0] else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        words = ANSWER.split(" ")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+        # latency and token_delay are set on the server by start()
+        time.sleep(self.server.latency())
+
+        if not request.get("stream"):
+            self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": ANSWER},
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for i, word in enumerate(words):
+                chunk = dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "finish_reason": None, "delta": {"content": word if i == 0 else " " + word},
+                }])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.server.token_delay)
+            final = dict(base, object="chat.completion.chunk", choices=[], usage=usage)
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream (e.g. a disconnect test)
+            pass
+        self.close_connection = True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 1024
+
+
+def start(port: int = 0, latency_ms: float = 0.0, token_delay_ms: float = 0.0, host: str = "127.0.0.1",
+          latency: Optional[str] = None) -> str:
+    """
+    Serve from a daemon thread; returns the base URL to use as OPENAI_BASE_URL.
+
+    latency is a latency_sampler spec; without one every response waits
+    latency_ms.
+    """
+    server = _Server((host, port), FakeOpenAIHandler)
+    server.latency = latency_sampler(latency or f"fixed:{latency_ms}")
+    server.token_delay = token_delay_ms / 1000
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency", default="fixed:0", help="Delay before the first byte (latency_sampler spec)")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="Delay between streamed tokens")
+    args = parser.parse_args()
+    base_url = start(args.port, token_delay_ms=args.token_delay_ms, host=args.host, latency=args.latency)
+    print(f"Fake OpenAI API at {base_url} (OPENAI_BASE_URL={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
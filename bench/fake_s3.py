@@ -0,0 +1,55 @@
+"""
+In-process fake S3 for load tests, on moto's server mode.
+
+    endpoint = fake_s3.start()
+    fake_s3.put_documents(endpoint, "bench-docs", {"docs/a.txt": b"..."})
+
+Point the service at it with S3_ENDPOINT_URL=<endpoint> and any
+AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY. Needs `pip install "moto[server]"`.
+"""
+import logging
+import socket
+
+import boto3
+
+# moto accepts any credentials; these only have to be consistent
+ACCESS_KEY = "test"
+SECRET_KEY = "test"
+REGION = "us-east-1"
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def start(port: int = 0, host: str = "127.0.0.1") -> str:
+    """Start moto's S3 in a background thread; returns the endpoint URL."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise RuntimeError('The fake S3 needs moto: pip install "moto[server]"') from e
+
+    port = port or _free_port(host)
+    ThreadedMotoServer(ip_address=host, port=port, verbose=False).start()
+    # moto's server logs every request through werkzeug
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    return f"http://{host}:{port}"
+
+
+def client(endpoint: str):
+    return boto3.client(
+        "s3", endpoint_url=endpoint, aws_access_key_id=ACCESS_KEY,
+        aws_secret_access_key=SECRET_KEY, region_name=REGION,
+    )
+
+
+def put_documents(endpoint: str, bucket: str, documents: dict[str, bytes]) -> None:
+    """Create bucket (if needed) and upload key -> bytes documents to it."""
+    s3 = client(endpoint)
+    existing = {b["Name"] for b in s3.list_buckets().get("Buckets", [])}
+    if bucket not in existing:
+        s3.create_bucket(Bucket=bucket)
+    for key, body in documents.items():
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
@@ -0,0 +1,10 @@
+"""
+main:app with hash_embedder installed, for running the service under
+gunicorn on machines without the model weights:
+
+    cd knowledge_svc && gunicorn -c gunicorn.conf.py --pythonpath ../bench hash_app:app
+"""
+import hash_embedder
+from main import app  # noqa: F401
+
+hash_embedder.install()
@@ -0,0 +1,34 @@
+"""
+Deterministic stand-in for the embedding model, for machines without the
+model weights (benchmarks and load tests only).
+
+Vectors are a hashed bag of words, so texts sharing words still score as
+similar and search returns sensible neighbours, at a tiny fraction of the
+model's cost. Install it with install() before the first embedding call.
+"""
+import hashlib
+
+import numpy as np
+
+
+class HashEmbedder:
+    """Embedder backend (see services.embedder) producing hashed bag-of-words vectors."""
+
+    name = "hash-embedder"
+    dimension = 768
+
+    def encode(self, texts: list[str], batch_size: int) -> np.ndarray:
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest()
+                out[row, int.from_bytes(digest, "little") % self.dimension] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.clip(norms, 1e-12, None)
+
+
+def install() -> None:
+    """Make the service's embedder use HashEmbedder in this process."""
+    from services import embedder
+
+    embedder._backend = HashEmbedder()
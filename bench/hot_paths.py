@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the ingestion and query hot paths.
+
+Runs in process on a plain Linux box: synthetic text, PDF and DOCX corpora
+(synthetic.py), the local vector store in a temp directory instead of
+Supabase, and a fake OpenAI server (fake_openai.py) instead of the API.
+S3 is not on any benchmarked path. Query and embedding caches are turned
+off so every run does the full work.
+
+Benchmarks:
+    parse_txt, parse_pdf, parse_docx   file_parser.parse_file
+    chunk_text                         chunker.chunk_text
+    embed_documents, embed_query       the configured embedder
+    build_context                      context_builder.build_context
+    upload_txt, upload_pdf, upload_docx  POST /upload-file, end to end
+    query                              POST /query, end to end
+
+--embedder hash swaps the model for a deterministic hashing stand-in, for
+machines without the model weights; its embed_* numbers then measure the
+stand-in, not the model, and are only comparable with other hash runs.
+
+Results are written as JSON (--out). With --baseline, each benchmark's
+p50 (or --metric) is compared against an earlier result file and the run
+exits with status 1 if any got slower than --tolerance allows. Sub-
+millisecond benchmarks are noisy run to run; compare min_ms for those.
+
+Usage:
+    python bench/hot_paths.py --out bench/results/base.json
+    python bench/hot_paths.py --baseline bench/results/base.json --out bench/results/new.json
+    python bench/hot_paths.py --only parse_pdf chunk_text --pdf-pages 200
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import synthetic
+import hash_embedder
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "knowledge_svc"))
+
+# Inherited by the parse pool's worker processes, so set before they spawn
+os.environ.setdefault("VECTOR_STORE", "local")
+if "LOCAL_STORE_PATH" not in os.environ:
+    os.environ["LOCAL_STORE_PATH"] = tempfile.mkdtemp(prefix="hot-paths-")
+os.environ.setdefault("EMBED_CACHE_ENABLED", "false")
+os.environ.setdefault("QUERY_CACHE_BACKEND", "off")
+# Back-to-back requests from one tenant would trip the per-tenant rate limits
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(os.environ["LOCAL_STORE_PATH"], "jobs.sqlite"))
+os.environ.setdefault("JOBS_SPOOL_DIR", os.path.join(os.environ["LOCAL_STORE_PATH"], "job_uploads"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+BENCHMARKS = [
+    "parse_txt", "parse_pdf", "parse_docx", "chunk_text", "embed_documents", "embed_query",
+    "build_context", "upload_txt", "upload_pdf", "upload_docx", "query",
+]
+
+QUERIES = [
+    "What is the refund policy?",
+    "How long is the warranty on a product?",
+    "Which region stores the backups?",
+    "What water temperature is used for brewing?",
+    "Who can access the audit report?",
+]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the service's per-request prints while timing."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def measure(fn, repeat: int, min_sample: float = 0.05) -> list[float]:
+    """
+    Seconds per call of fn() over repeat samples, after one untimed call.
+
+    Calls faster than min_sample are looped within each sample (as timeit
+    does), so sub-millisecond paths are not lost in timer noise.
+    """
+    with quiet():
+        started = time.perf_counter()
+        fn()
+        first = time.perf_counter() - started
+    number = max(1, math.ceil(min_sample / first)) if first < min_sample else 1
+    timings = []
+    for _ in range(repeat):
+        with quiet():
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            timings.append((time.perf_counter() - started) / number)
+    return timings
+
+
+def summarize(timings: list[float], work: float = 0.0, unit: str = "") -> dict:
+    """Latency summary in ms; work/unit adds a throughput figure at the p50."""
+    p50 = percentile(timings, 50)
+    result = {
+        "n": len(timings),
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+    if work and unit:
+        result["throughput"] = {unit: round(work / p50, 2) if p50 else None}
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(args) -> dict:
+    os.environ.setdefault("OPENAI_BASE_URL", fake_openai_url(args))
+    # Imported only now: llm and vectordb read their settings at import time
+    from fastapi.testclient import TestClient
+
+    from main import app
+    from services import chunker, context_builder, embedder, file_parser
+
+    if args.embedder == "hash":
+        hash_embedder.install()
+
+    selected = args.only or BENCHMARKS
+    corpus = {
+        "txt": synthetic.make_text(args.text_paragraphs).encode("utf-8"),
+        "pdf": synthetic.make_pdf(args.pdf_pages),
+        "docx": synthetic.make_docx(args.docx_paragraphs),
+    }
+    text = corpus["txt"].decode("utf-8")
+    chunks = chunker.chunk_text(text)
+    results = {}
+
+    def record(name: str, timings: list[float], work: float = 0.0, unit: str = "") -> None:
+        results[name] = summarize(timings, work, unit)
+        line = f"  {name:<16} p50={results[name]['p50_ms']:10.2f}ms  p95={results[name]['p95_ms']:10.2f}ms"
+        if "throughput" in results[name]:
+            line += f"  {results[name]['throughput'][unit]:>10} {unit}"
+        print(line)
+
+    print(f"Corpus: txt {len(corpus['txt']) / 1024:.0f} KB ({len(chunks)} chunks), "
+          f"pdf {len(corpus['pdf']) / 1024:.0f} KB ({args.pdf_pages} pages), "
+          f"docx {len(corpus['docx']) / 1024:.0f} KB")
+
+    for kind in ("txt", "pdf", "docx"):
+        if f"parse_{kind}" in selected:
+            data = corpus[kind]
+            timings = measure(lambda: file_parser.parse_file(f"bench.{kind}", data), args.repeat)
+            record(f"parse_{kind}", timings, len(data) / 1e6, "MB/s")
+
+    if "chunk_text" in selected:
+        record("chunk_text", measure(lambda: chunker.chunk_text(text), args.repeat), len(chunks), "chunks/s")
+
+    if "embed_documents" in selected:
+        batch = chunks[:args.embed_chunks]
+        record("embed_documents", measure(lambda: embedder.embed_documents(batch), args.repeat),
+               len(batch), "chunks/s")
+
+    if "embed_query" in selected:
+        queries = itertools.cycle(QUERIES)
+        record("embed_query", measure(lambda: embedder.embed_query(next(queries)), args.repeat))
+
+    if "build_context" in selected:
+        # Top-k hits as search returns them: neighbouring chunks of one document
+        retrieved = [
+            {"text": chunks[i], "source": "bench.txt", "chunk_index": i, "score": 1.0 - i / 100}
+            for i in range(min(args.top_k, len(chunks)))
+        ]
+        record("build_context", measure(lambda: context_builder.build_context(retrieved), args.repeat))
+
+    with TestClient(app) as client:
+        for kind in ("txt", "pdf", "docx"):
+            if f"upload_{kind}" not in selected:
+                continue
+            runs = itertools.count()
+
+            def upload():
+                # A fresh tenant per run, so nothing is skipped as unchanged
+                response = client.post(
+                    "/upload-file",
+                    data={"tenant_id": f"bench-upload-{kind}-{next(runs)}"},
+                    files={"file": (f"bench.{kind}", corpus[kind])},
+                )
+                response.raise_for_status()
+                if response.json()["status"] != "success":
+                    raise RuntimeError(response.json())
+
+            record(f"upload_{kind}", measure(upload, args.repeat), len(corpus[kind]) / 1e6, "MB/s")
+
+        if "query" in selected:
+            with quiet():
+                client.post("/upload-file", data={"tenant_id": "bench-query"},
+                            files={"file": ("bench.txt", corpus["txt"])}).raise_for_status()
+            queries = itertools.cycle(QUERIES)
+
+            def query():
+                response = client.post("/query", json={"tenant_id": "bench-query", "query": next(queries)})
+                response.raise_for_status()
+
+            record("query", measure(query, args.repeat))
+
+    return results
+
+
+def fake_openai_url(args) -> str:
+    import fake_openai
+
+    return fake_openai.start(latency_ms=args.llm_latency_ms)
+
+
+def compare(current: dict, baseline: dict, tolerance: float, metric: str = "p50_ms") -> int:
+    """Print changes in metric against a baseline; returns the number of regressions."""
+    if current["meta"]["params"] != baseline["meta"].get("params"):
+        print("⚠ Baseline was run with different parameters; differences may not be regressions")
+    regressions = 0
+    print(f"\nvs. baseline {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')}), "
+          f"{metric}, tolerance {tolerance:.0%}:")
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"  {name:<16} (not in baseline)")
+            continue
+        ratio = result[metric] / before[metric] if before[metric] else float("inf")
+        if ratio > 1 + tolerance:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            verdict = "faster"
+        else:
+            verdict = "same"
+        print(f"  {name:<16} {before[metric]:10.2f}ms -> {result[metric]:10.2f}ms  {ratio:5.2f}x  {verdict}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--text-paragraphs", type=int, default=400)
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--docx-paragraphs", type=int, default=400)
+    parser.add_argument("--embed-chunks", type=int, default=128, help="Chunks per embed_documents call")
+    parser.add_argument("--top-k", type=int, default=5, help="Chunks given to build_context")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Fake OpenAI response delay")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown vs. baseline")
+    parser.add_argument("--metric", choices=["p50_ms", "p95_ms", "mean_ms", "min_ms"], default="p50_ms",
+                        help="Statistic compared against the baseline")
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in (
+        "repeat", "text_paragraphs", "pdf_pages", "docx_paragraphs", "embed_chunks", "top_k", "embedder",
+        "llm_latency_ms",
+    )}
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+        },
+        "benchmarks": run(args),
+    }
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(output, baseline, args.tolerance, args.metric):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Load test: /health and /query latency while a large PDF ingests.
+
+Samples /health and /query at a fixed rate, first with the service idle
+and then while a generated 200-page PDF is being uploaded via
+/upload-file. With ingestion off the event loop, the "during" percentiles
+should stay close to the "idle" ones.
+
+Usage (service already running):
+    python bench/ingest_latency.py --url http://localhost:8000 --pages 200
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+import synthetic
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def sample(url: str, tenant_id: str, stop: threading.Event, interval: float, out: dict) -> None:
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        session.get(f"{url}/health", timeout=60)
+        out["health"].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        session.post(
+            f"{url}/query",
+            json={"tenant_id": tenant_id, "query": "What is the refund policy?"},
+            timeout=60,
+        )
+        out["query"].append((time.perf_counter() - started) * 1000)
+        time.sleep(interval)
+
+
+def measure(url: str, tenant_id: str, seconds: float, interval: float, during=None) -> dict:
+    out = {"health": [], "query": []}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample, args=(url, tenant_id, stop, interval, out))
+    sampler.start()
+    if during is not None:
+        during()
+    else:
+        time.sleep(seconds)
+    stop.set()
+    sampler.join()
+    return out
+
+
+def report(label: str, out: dict) -> None:
+    for endpoint, values in out.items():
+        print(f"  {label:<7} {endpoint:<7} n={len(values):<5} "
+              f"p50={percentile(values, 50):8.1f}ms  p95={percentile(values, 95):8.1f}ms  "
+              f"p99={percentile(values, 99):8.1f}ms  max={max(values, default=float('nan')):8.1f}ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--tenant", default="bench_latency")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--idle-seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.1, help="Pause between samples (s)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.pages}-page PDF...")
+    pdf = synthetic.make_pdf(args.pages)
+    print(f"  {len(pdf) / 1024:.0f} KB")
+
+    print(f"Baseline for {args.idle_seconds:.0f}s...")
+    idle = measure(args.url, args.tenant, args.idle_seconds, args.interval)
+
+    upload = {}
+
+    def ingest():
+        started = time.perf_counter()
+        response = requests.post(
+            f"{args.url}/upload-file",
+            data={"tenant_id": args.tenant},
+            files={"file": ("bench_200_pages.pdf", pdf, "application/pdf")},
+            timeout=3600,
+        )
+        upload["seconds"] = time.perf_counter() - started
+        upload["response"] = response.json()
+
+    print("Ingesting while sampling...")
+    busy = measure(args.url, args.tenant, 0, args.interval, during=ingest)
+
+    print()
+    print(f"Upload took {upload['seconds']:.1f}s: {upload['response']}")
+    report("idle", idle)
+    report("during", busy)
+
+    ratio = percentile(busy["health"], 99) / max(percentile(idle["health"], 99), 0.001)
+    print(f"\n/health p99 during/idle: {ratio:.1f}x "
+          f"(median {statistics.median(busy['health']):.1f}ms)")
+
+    requests.delete(f"{args.url}/documents/{args.tenant}/bench_200_pages.pdf", timeout=60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
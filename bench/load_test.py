@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Closed-loop HTTP load test: QPS, latency percentiles and errors per
+concurrency level, and the resulting saturation curve.
+
+Each of N virtual users sends a request, waits for the response, and sends
+the next one (plus optional think time). N is stepped through
+--concurrency; at every level the first --warmup seconds are discarded
+and the next --duration seconds are measured. Throughput that stops
+growing while latency keeps rising marks where the service saturates.
+
+Scenarios:
+    query    POST /query; every question is new unless --repeat-queries,
+             so the answer caches only help when asked to
+    upload   POST /upload-file, a synthetic text document per request
+    s3       POST /process-s3, documents already in a (fake) S3 bucket
+
+Run it against any deployment, or against the local stand-in stack:
+
+    python bench/local_stack.py --port 8000 &
+    python bench/load_test.py --url http://localhost:8000 --scenario query upload s3 \\
+        --concurrency 1 2 4 8 16 32 --out bench/results/load.json
+
+Requests answered with a non-2xx status, a {"status": "error"} body, or a
+transport error count as errors; 429 and 503 are reported separately as
+rejections (the service shedding load).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "knowledge_svc"))
+
+from services.metrics import Histogram  # noqa: E402
+
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+QUERIES = [
+    "What is the refund policy?",
+    "How long is the warranty on a product?",
+    "Which region stores the backups?",
+    "What water temperature is used for brewing?",
+    "Who can access the audit report?",
+    "How is billing handled for each quarter?",
+    "What does the security policy say about roles?",
+    "How are support requests tracked?",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+class Scenario:
+    """Builds the requests of one scenario; send() returns the response."""
+
+    name = "base"
+
+    def __init__(self, args):
+        self.args = args
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        pass
+
+    async def send(self, client: httpx.AsyncClient) -> httpx.Response:
+        raise NotImplementedError
+
+
+class QueryScenario(Scenario):
+    name = "query"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.queries = itertools.cycle(QUERIES)
+        self.sent = itertools.count()
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        # Something to retrieve: a few documents in the query tenant
+        for i in range(self.args.seed_documents):
+            response = await client.post(
+                "/upload-file",
+                data={"tenant_id": self.args.tenant},
+                files={"file": (f"load-seed-{i}.txt", synthetic.make_text(40, seed=i).encode("utf-8"))},
+                timeout=600,
+            )
+            response.raise_for_status()
+
+    async def send(self, client: httpx.AsyncClient) -> httpx.Response:
+        query = next(self.queries)
+        if not self.args.repeat_queries:
+            # A distinct string per request misses the query cache
+            query = f"{query} (request {next(self.sent)})"
+        return await client.post("/query", json={"tenant_id": self.args.tenant, "query": query})
+
+
+class UploadScenario(Scenario):
+    name = "upload"
+
+    def __init__(self, args):
+        super().__init__(args)
+        paragraphs = max(1, round(args.upload_kb * 1024 / 900))  # ~900 bytes per synthetic paragraph
+        # A handful of distinct bodies; unique filenames keep every upload a full ingestion
+        self.bodies = itertools.cycle([
+            synthetic.make_text(paragraphs, seed=seed).encode("utf-8") for seed in range(8)
+        ])
+
+    async def send(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            "/upload-file",
+            data={"tenant_id": f"{self.args.tenant}-upload"},
+            files={"file": (f"load-{uuid.uuid4().hex}.txt", next(self.bodies))},
+        )
+
+
+class S3Scenario(Scenario):
+    name = "s3"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.keys = itertools.cycle(f"{args.s3_prefix}{i}.txt" for i in range(args.s3_keys))
+
+    async def send(self, client: httpx.AsyncClient) -> httpx.Response:
+        key = next(self.keys)
+        return await client.post("/process-s3", data={
+            "tenant_id": f"{self.args.tenant}-s3",
+            "s3_bucket": self.args.s3_bucket,
+            "s3_key": key,
+            "filename": os.path.basename(key),
+        })
+
+
+SCENARIOS = {cls.name: cls for cls in (QueryScenario, UploadScenario, S3Scenario)}
+
+
+def classify(response: httpx.Response) -> str:
+    """"ok", "rejected" or an error kind for a response."""
+    if response.status_code in (429, 503):
+        return "rejected"
+    if response.status_code >= 400:
+        return f"http_{response.status_code}"
+    try:
+        body = response.json()
+    except ValueError:
+        return "ok"
+    if isinstance(body, dict) and body.get("status") == "error":
+        return "status_error"
+    return "ok"
+
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int,
+                    warmup: float, duration: float, think: float) -> dict:
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    latencies: list[float] = []
+    outcomes: Counter = Counter()
+    histogram = Histogram(LATENCY_BUCKETS_MS)
+
+    async def user() -> None:
+        while time.perf_counter() < stop_at:
+            sent = time.perf_counter()
+            try:
+                outcome = classify(await scenario.send(client))
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            done = time.perf_counter()
+            # Only requests sent inside the window count, so warmup doesn't leak in
+            if measure_from <= sent and done <= stop_at:
+                latency_ms = (done - sent) * 1000
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(latency_ms)
+                    histogram.observe(latency_ms)
+            if think:
+                await asyncio.sleep(think)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    total = sum(outcomes.values())
+    errors = total - outcomes["ok"] - outcomes["rejected"]
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": outcomes["ok"],
+        "rejected": outcomes["rejected"],
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "rejection_rate": round(outcomes["rejected"] / total, 4) if total else 0.0,
+        "errors_by_kind": {k: v for k, v in outcomes.items() if k not in ("ok", "rejected")},
+        "qps": round(outcomes["ok"] / duration, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies, default=float("nan")), 1),
+        "histogram_ms": histogram.snapshot()["buckets"],
+    }
+
+
+def saturation_point(levels: list[dict], min_gain: float = 0.1) -> int | None:
+    """
+    Lowest concurrency past which more users stop buying throughput.
+
+    That is the level before the first step whose QPS grew by less than
+    min_gain (or whose errors/rejections appeared); None if QPS still
+    scaled at the highest level tried.
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if previous["qps"] <= 0:
+            continue
+        gain = current["qps"] / previous["qps"] - 1
+        if gain < min_gain or (current["errors"] + current["rejected"]) > 0:
+            return previous["concurrency"]
+    return None
+
+
+def print_curve(levels: list[dict]) -> None:
+    peak = max((level["qps"] for level in levels), default=0) or 1
+    print(f"  {'users':>5} {'qps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'err%':>6} {'rej%':>6}")
+    for level in levels:
+        bar = "█" * round(30 * level["qps"] / peak)
+        print(f"  {level['concurrency']:>5} {level['qps']:>8.1f} {level['p50_ms']:>7.0f}ms {level['p95_ms']:>7.0f}ms "
+              f"{level['p99_ms']:>7.0f}ms {level['error_rate'] * 100:>5.1f}% {level['rejection_rate'] * 100:>5.1f}% {bar}")
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    results = {"levels": [], "saturation": {}}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        (await client.get("/health")).raise_for_status()
+        for name in args.scenario:
+            scenario = SCENARIOS[name](args)
+            print(f"\n{name}: setting up...")
+            await scenario.setup(client)
+            levels = []
+            for concurrency in args.concurrency:
+                level = await run_level(client, scenario, concurrency, args.warmup, args.duration, args.think)
+                levels.append(level)
+                print(f"  {concurrency:>3} users: {level['qps']:.1f} qps, p50 {level['p50_ms']:.0f}ms, "
+                      f"p99 {level['p99_ms']:.0f}ms, {level['errors']} errors, {level['rejected']} rejected")
+            results["levels"].extend(levels)
+            results["saturation"][name] = saturation_point(levels)
+            print(f"\n{name}: saturation curve")
+            print_curve(levels)
+            knee = results["saturation"][name]
+            print(f"  saturates at ~{knee} concurrent users" if knee else "  still scaling at the highest level")
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=["query"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3, help="Discarded seconds at the start of each level")
+    parser.add_argument("--think", type=float, default=0.0, help="Pause between a user's requests (s)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--tenant", default="load_test")
+    parser.add_argument("--repeat-queries", action="store_true",
+                        help=f"query: cycle through {len(QUERIES)} fixed questions (answer cache hits)")
+    parser.add_argument("--seed-documents", type=int, default=5, help="query: documents uploaded first")
+    parser.add_argument("--upload-kb", type=float, default=32, help="upload: size of each document")
+    parser.add_argument("--s3-bucket", default="bench-docs")
+    parser.add_argument("--s3-prefix", default="docs/doc-", help="s3: keys are <prefix><i>.txt")
+    parser.add_argument("--s3-keys", type=int, default=20)
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "url": args.url,
+            "client_platform": platform.platform(),
+            "params": {key: getattr(args, key) for key in (
+                "scenario", "concurrency", "duration", "warmup", "think", "upload_kb", "seed_documents",
+                "repeat_queries",
+            )},
+        },
+        **asyncio.run(run(args)),
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
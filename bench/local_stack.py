@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+The knowledge service with local stand-ins for every external dependency.
+
+Starts, in one process and without Docker:
+
+- a fake OpenAI server (fake_openai.py) with a configurable latency
+  distribution, wired in through OPENAI_BASE_URL
+- a fake S3 (fake_s3.py, moto) seeded with synthetic documents, wired in
+  through S3_ENDPOINT_URL (skipped with --no-s3 or when moto is missing)
+- the service itself under uvicorn, on the local vector store in a temp
+  directory, or on Postgres + pgvector with --vector-store postgres
+  (DATABASE_URL must point at it, e.g. `make pgvector-up`)
+
+Any other setting (caches, pools, LLM concurrency, ...) is taken from the
+environment / .env as usual, so a load test measures the service as
+currently configured.
+
+Usage:
+    python bench/local_stack.py --port 8000 --llm-latency lognormal:400:0.5
+    python bench/load_test.py --url http://localhost:8000 --s3-bucket bench-docs
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "knowledge_svc"))
+
+S3_BUCKET = "bench-docs"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--vector-store", choices=["local", "postgres"], default="local")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="hash: deterministic stand-in for machines without the model weights")
+    parser.add_argument("--llm-latency", default="lognormal:400:0.5",
+                        help="Fake OpenAI time to first byte, a fake_openai.latency_sampler spec (ms)")
+    parser.add_argument("--llm-token-delay-ms", type=float, default=10.0, help="Between streamed tokens")
+    parser.add_argument("--no-s3", action="store_true", help="Don't start the fake S3")
+    parser.add_argument("--s3-documents", type=int, default=20, help="Synthetic documents put in the fake S3")
+    args = parser.parse_args()
+
+    import fake_openai
+
+    data_dir = tempfile.mkdtemp(prefix="local-stack-")
+    # Set before the service is imported: its modules read settings at import time
+    os.environ["VECTOR_STORE"] = args.vector_store
+    os.environ.setdefault("LOCAL_STORE_PATH", os.path.join(data_dir, "vector_store"))
+    os.environ.setdefault("JOBS_DB_PATH", os.path.join(data_dir, "jobs.sqlite"))
+    os.environ.setdefault("JOBS_SPOOL_DIR", os.path.join(data_dir, "job_uploads"))
+    os.environ["OPENAI_BASE_URL"] = fake_openai.start(
+        latency=args.llm_latency, token_delay_ms=args.llm_token_delay_ms
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "local-stack")
+    print(f"Fake OpenAI:  {os.environ['OPENAI_BASE_URL']} (latency {args.llm_latency})")
+
+    if not args.no_s3:
+        import fake_s3
+
+        try:
+            endpoint = fake_s3.start()
+        except RuntimeError as e:
+            print(f"Fake S3:      disabled ({e})")
+        else:
+            fake_s3.put_documents(endpoint, S3_BUCKET, {
+                f"docs/doc-{i}.txt": synthetic.make_text(40, seed=i).encode("utf-8")
+                for i in range(args.s3_documents)
+            })
+            os.environ["S3_ENDPOINT_URL"] = endpoint
+            os.environ["AWS_ACCESS_KEY_ID"] = fake_s3.ACCESS_KEY
+            os.environ["AWS_SECRET_ACCESS_KEY"] = fake_s3.SECRET_KEY
+            os.environ["AWS_REGION"] = fake_s3.REGION
+            print(f"Fake S3:      {endpoint} (bucket {S3_BUCKET}, keys docs/doc-0.txt..docs/doc-{args.s3_documents - 1}.txt)")
+
+    os.chdir(os.path.join(ROOT, "knowledge_svc"))
+    import uvicorn
+
+    from main import app
+
+    if args.embedder == "hash":
+        import hash_embedder
+
+        hash_embedder.install()
+    print(f"Vector store: {args.vector_store}" + (f" ({os.environ['LOCAL_STORE_PATH']})"
+                                                 if args.vector_store == "local" else ""))
+    print(f"Service:      http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Memory per worker and throughput per core under gunicorn (gunicorn.conf.py).
+
+For each --workers count the service is started with WEB_CONCURRENCY set
+to it, a closed-loop /query load (load_test.py) is run against it, and
+then the memory of the master and of each worker is read from
+/proc/<pid>/smaps_rollup (Linux only):
+
+    rss   resident pages, counting shared ones in full
+    pss   shared pages divided among the processes sharing them
+    uss   pages private to the process
+
+Copy-on-write sharing of the preloaded model shows up as worker rss well
+above uss; the sum of pss over all processes is what the box really
+spends. The parse pool's processes are not started by the /query load.
+
+The query and embedding caches are turned off so every request embeds the
+question. LLM calls go to fake_openai.py; with the default zero latency
+the load is bound by the embedding model, which is what the worker count
+scales. Documents are uploaded once, through a single worker, before the
+measured runs; with VECTOR_STORE=local (the default here) the workers
+only read that store, so LOCAL_STORE_MULTI_WORKER lets gunicorn start them.
+
+Usage:
+    python bench/multi_worker.py --workers 1 2 4 --concurrency 16 --out bench/results/workers.json
+    DATABASE_URL=... python bench/multi_worker.py --vector-store postgres
+    python bench/multi_worker.py --embedder hash   # mechanics only, no model
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import httpx
+
+import fake_openai
+import load_test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIR = os.path.join(ROOT, "knowledge_svc")
+BENCH_DIR = os.path.join(ROOT, "bench")
+
+
+def smaps_rollup(pid: int) -> dict:
+    """rss, pss and uss of one process in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss_mb": round(fields.get("Rss", 0) / 1024, 1), "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+            "uss_mb": round(uss / 1024, 1)}
+
+
+def children(pid: int) -> list[int]:
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The ppid is the second field after the parenthesised command name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory(master: int) -> dict:
+    workers = [smaps_rollup(pid) | {"pid": pid} for pid in children(master)]
+    master_memory = smaps_rollup(master)
+    return {
+        "master": master_memory,
+        "workers": workers,
+        "total_pss_mb": round(master_memory["pss_mb"] + sum(w["pss_mb"] for w in workers), 1),
+    }
+
+
+def start_service(workers: int, port: int, env: dict, app: str) -> subprocess.Popen:
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--pythonpath", BENCH_DIR, app]
+    env = env | {"WEB_CONCURRENCY": str(workers), "PORT": str(port), "HOST": "127.0.0.1"}
+    return subprocess.Popen(command, cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url: str, workers: int, timeout: float, process: subprocess.Popen) -> None:
+    """Until /ready has answered 200 from every worker (or timeout)."""
+    ready: set = set()
+    deadline = time.monotonic() + timeout
+    while len(ready) < workers:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        if time.monotonic() > deadline:
+            if ready:
+                print(f"  only {len(ready)} of {workers} workers answered /ready; measuring anyway")
+                return
+            raise RuntimeError(f"not ready after {timeout}s")
+        try:
+            # A fresh connection per poll, so the kernel spreads them over the workers
+            response = httpx.get(f"{url}/ready", timeout=5)
+            if response.status_code == 200:
+                ready.add(response.json()["pid"])
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+
+
+def stop_service(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def query_load(url: str, args, seed: bool) -> dict:
+    scenario_args = SimpleNamespace(tenant="multi_worker", repeat_queries=False, seed_documents=args.seed_documents)
+    scenario = load_test.QueryScenario(scenario_args)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        if seed:
+            await scenario.setup(client)
+            return {}
+        return await load_test.run_level(client, scenario, args.concurrency, args.warmup, args.duration, 0.0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /query users")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=5, help="Discarded seconds before measuring")
+    parser.add_argument("--seed-documents", type=int, default=5)
+    parser.add_argument("--vector-store", choices=["local", "postgres"], default="local")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="hash: deterministic stand-in; memory and throughput then say nothing about the model")
+    parser.add_argument("--llm-latency", default="fixed:0", help="Fake OpenAI latency (fake_openai.latency_sampler spec)")
+    parser.add_argument("--port", type=int, default=18200)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="multi-worker-")
+    env = dict(os.environ) | {
+        "VECTOR_STORE": args.vector_store,
+        "LOCAL_STORE_MULTI_WORKER": "true",
+        "OPENAI_BASE_URL": fake_openai.start(latency=args.llm_latency),
+        "QUERY_CACHE_BACKEND": "off",
+        "EMBED_CACHE_ENABLED": "false",
+        "SEMANTIC_CACHE_ENABLED": "false",
+        # Capacity, not the per-tenant limits, is what's measured
+        "ADMISSION_ENABLED": "false",
+    }
+    env.setdefault("OPENAI_API_KEY", "multi-worker")
+    env.setdefault("LOCAL_STORE_PATH", os.path.join(data_dir, "vector_store"))
+    env.setdefault("JOBS_DB_PATH", os.path.join(data_dir, "jobs.sqlite"))
+    env.setdefault("JOBS_SPOOL_DIR", os.path.join(data_dir, "job_uploads"))
+    app = "hash_app:app" if args.embedder == "hash" else "main:app"
+    url = f"http://127.0.0.1:{args.port}"
+    cores = os.cpu_count() or 1
+
+    print(f"Seeding {args.seed_documents} documents through one worker...")
+    process = start_service(1, args.port, env, app)
+    try:
+        wait_ready(url, 1, args.ready_timeout, process)
+        asyncio.run(query_load(url, args, seed=True))
+    finally:
+        stop_service(process)
+
+    runs = []
+    for workers in args.workers:
+        process = start_service(workers, args.port, env, app)
+        try:
+            wait_ready(url, workers, args.ready_timeout, process)
+            level = asyncio.run(query_load(url, args, seed=False))
+            usage = memory(process.pid)
+        finally:
+            stop_service(process)
+        run = {
+            "workers": workers,
+            "qps": level["qps"],
+            "qps_per_core": round(level["qps"] / min(workers, cores), 2),
+            "p50_ms": level["p50_ms"],
+            "p99_ms": level["p99_ms"],
+            "errors": level["errors"],
+            "memory": usage,
+        }
+        runs.append(run)
+        print(f"  {workers} workers: {run['qps']:.1f} qps, p50 {run['p50_ms']:.0f}ms, p99 {run['p99_ms']:.0f}ms, "
+              f"total pss {usage['total_pss_mb']:.0f} MB")
+
+    print("\n| workers | qps | qps/core | p50 ms | p99 ms | worker rss MB | worker uss MB | total pss MB |")
+    print("|---|---|---|---|---|---|---|---|")
+    for run in runs:
+        workers_memory = run["memory"]["workers"] or [{"rss_mb": 0, "uss_mb": 0}]
+        rss = sum(w["rss_mb"] for w in workers_memory) / len(workers_memory)
+        uss = sum(w["uss_mb"] for w in workers_memory) / len(workers_memory)
+        print(f"| {run['workers']} | {run['qps']:.1f} | {run['qps_per_core']:.1f} | {run['p50_ms']:.0f} | "
+              f"{run['p99_ms']:.0f} | {rss:.0f} | {uss:.0f} | {run['memory']['total_pss_mb']:.0f} |")
+
+    if args.out:
+        output = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "platform": platform.platform(),
+                "cpu_count": cores,
+                "params": {key: getattr(args, key) for key in (
+                    "workers", "concurrency", "duration", "warmup", "vector_store", "embedder", "llm_latency",
+                )},
+            },
+            "runs": runs,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
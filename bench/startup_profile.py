@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Startup profile: what importing the service costs, and how long a fresh
+process takes to answer /health and then /ready.
+
+1. Imports: `python -X importtime -c "import main"` in a clean interpreter,
+   reported as the total and the slowest third-party packages (cumulative,
+   i.e. including everything they import, counted where the service or
+   another package first imports them). Anything heavy here is paid by
+   every process before it can serve a request.
+2. Readiness: local_stack.py (fake OpenAI, local vector store, no S3) is
+   started as a subprocess and polled; time to the first 200 from /health
+   (process up) and from /ready (warm-up finished), plus the per-step
+   warm-up timings /ready reports.
+
+Usage:
+    python bench/startup_profile.py
+    python bench/startup_profile.py --embedder hash --out bench/results/startup.json
+    python bench/startup_profile.py --imports-only
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIR = os.path.join(ROOT, "knowledge_svc")
+
+# The service's own modules: their time is attributed to what they import
+OWN_PACKAGES = {"main", "api", "services"}
+STDLIB = set(sys.stdlib_module_names) | {"site", "_frozen_importlib_external"}
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def service_env() -> dict:
+    """Settings that keep startup off the network (no Supabase, no OpenAI)."""
+    data_dir = tempfile.mkdtemp(prefix="startup-profile-")
+    env = dict(os.environ)
+    env.setdefault("VECTOR_STORE", "local")
+    env.setdefault("LOCAL_STORE_PATH", os.path.join(data_dir, "vector_store"))
+    env.setdefault("JOBS_DB_PATH", os.path.join(data_dir, "jobs.sqlite"))
+    env.setdefault("JOBS_SPOOL_DIR", os.path.join(data_dir, "job_uploads"))
+    return env
+
+
+def profile_imports(top: int) -> dict:
+    """Parse -X importtime output for `import main` into per-package cumulative times."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=SERVICE_DIR, env=service_env(), capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{completed.stderr[-2000:]}")
+
+    # Children are printed before their parent, one indent level deeper
+    stack: list = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        level = len(indent) // 2
+        children = []
+        while stack and stack[-1]["level"] > level:
+            children.insert(0, stack.pop())
+        stack.append({"name": name, "level": level, "us": int(cumulative), "children": children})
+
+    total_us = sum(node["us"] for node in stack)
+    by_package: dict = defaultdict(int)
+
+    def attribute(node: dict, parent_package: str) -> None:
+        # A package's time is counted where another package first pulls it in
+        package = node["name"].split(".")[0]
+        if package != parent_package and package not in OWN_PACKAGES and package not in STDLIB:
+            by_package[package] += node["us"]
+        for child in node["children"]:
+            attribute(child, package)
+
+    for node in stack:
+        attribute(node, "")
+
+    slowest = sorted(by_package.items(), key=lambda item: -item[1])[:top]
+    return {
+        "wall_s": round(wall, 3),
+        "import_s": round(total_us / 1e6, 3),
+        "slowest_packages": [{"package": name, "cumulative_ms": round(us / 1000, 1)} for name, us in slowest],
+    }
+
+
+def profile_readiness(args) -> dict:
+    """Start the service and time /health and /ready from process launch."""
+    command = [sys.executable, os.path.join(ROOT, "bench", "local_stack.py"),
+               "--port", str(args.port), "--no-s3", "--embedder", args.embedder]
+    url = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=service_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"health_s": None, "ready_s": None, "warmup": None}
+    try:
+        with httpx.Client(base_url=url, timeout=2) as client:
+            while time.perf_counter() - started < args.timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"service exited with status {process.returncode}")
+                try:
+                    if result["health_s"] is None and client.get("/health").status_code == 200:
+                        result["health_s"] = round(time.perf_counter() - started, 3)
+                    if result["health_s"] is not None:
+                        response = client.get("/ready")
+                        result["warmup"] = response.json()
+                        if response.status_code == 200:
+                            result["ready_s"] = round(time.perf_counter() - started, 3)
+                            break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(args.poll)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="Slowest packages to list")
+    parser.add_argument("--imports-only", action="store_true", help="Skip starting the service")
+    parser.add_argument("--port", type=int, default=18123)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="hash: deterministic stand-in for machines without the model weights")
+    parser.add_argument("--timeout", type=float, default=300, help="Give up on /ready after this many seconds")
+    parser.add_argument("--poll", type=float, default=0.05, help="Seconds between polls")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    imports = profile_imports(args.top)
+    print(f"import main: {imports['import_s']:.2f}s of imports ({imports['wall_s']:.2f}s wall incl. interpreter)")
+    for entry in imports["slowest_packages"]:
+        print(f"  {entry['package']:<28} {entry['cumulative_ms']:9.1f}ms")
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embedder": args.embedder,
+        },
+        "imports": imports,
+    }
+
+    if not args.imports_only:
+        readiness = profile_readiness(args)
+        output["readiness"] = readiness
+        print(f"\n/health 200 after {readiness['health_s']}s, /ready 200 after {readiness['ready_s']}s")
+        steps = (readiness["warmup"] or {}).get("steps", {})
+        for name, step in steps.items():
+            detail = f"{step['seconds']:.3f}s" if "seconds" in step else step.get("error", step["status"])
+            print(f"  {name:<14} {detail}")
+        if readiness["ready_s"] is None:
+            print(f"⚠ Not ready within {args.timeout}s")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0 if args.imports_only or output["readiness"]["ready_s"] is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Synthetic documents for benchmarks and load tests.
+
+Everything is generated deterministically from a seed so runs are
+comparable across machines and commits.
+"""
+import io
+import random
+
+_WORDS = (
+    "policy refund customer order shipping invoice account billing support "
+    "warranty product service request contract tenant document upload query "
+    "vector search index embedding latency throughput region storage backup "
+    "retention security access role permission audit report quarter revenue "
+    "coffee espresso brewing ratio water temperature grind roast bean storage"
+).split()
+
+
+def make_text(paragraphs: int, seed: int = 0, words_per_paragraph: int = 120) -> str:
+    """Plain text made of pseudo-random English-ish paragraphs."""
+    rng = random.Random(seed)
+    out = []
+    for p in range(paragraphs):
+        words = [rng.choice(_WORDS) for _ in range(words_per_paragraph)]
+        words[0] = words[0].capitalize()
+        out.append(f"Section {p + 1}. " + " ".join(words) + ".")
+    return "\n\n".join(out)
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, seed: int = 0, lines_per_page: int = 45, words_per_line: int = 12) -> bytes:
+    """
+    A text PDF with the given number of pages, built without any PDF library.
+
+    Each page holds lines_per_page lines of Helvetica text, which is enough
+    for pdfplumber and PyPDF2 to do real layout/extraction work.
+    """
+    rng = random.Random(seed)
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # filled in once the page ids are known
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Page {p + 1}"]
+        for _ in range(lines_per_page - 1):
+            lines.append(" ".join(rng.choice(_WORDS) for _ in range(words_per_line)))
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref
+    )
+    return bytes(out)
+
+
+def make_docx(paragraphs: int, seed: int = 0, words_per_paragraph: int = 120) -> bytes:
+    """A DOCX with one heading and one body paragraph per section (needs python-docx)."""
+    from docx import Document
+
+    document = Document()
+    for i, paragraph in enumerate(make_text(paragraphs, seed, words_per_paragraph).split("\n\n")):
+        if i % 10 == 0:
+            document.add_heading(f"Part {i // 10 + 1}", level=1)
+        document.add_paragraph(paragraph)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
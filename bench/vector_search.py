@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Vector store search latency, in process (no HTTP, no embedding model).
+
+Fills a tenant with random unit vectors and times search() against the
+configured VECTOR_STORE backend. With VECTOR_STORE=local this measures the
+NumPy / HNSW search itself; with supabase it includes the PostgREST round
+trip.
+
+Usage:
+    VECTOR_STORE=local python bench/vector_search.py --rows 1000 5000 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "knowledge_svc"))
+os.environ.setdefault("VECTOR_STORE", "local")
+if os.environ["VECTOR_STORE"] == "local":
+    # Keep benchmark tenants out of the real local store
+    os.environ.setdefault("LOCAL_STORE_PATH", tempfile.mkdtemp(prefix="vector-bench-"))
+
+from services import vectordb  # noqa: E402
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run(rows: int, dim: int, queries: int, limit: int) -> dict:
+    rng = np.random.default_rng(0)
+    tenant_id = f"bench-{rows}"
+    vectordb.delete_all_documents(tenant_id)
+
+    started = time.perf_counter()
+    for start in range(0, rows, 500):
+        vectors = rng.normal(size=(min(500, rows - start), dim)).astype(np.float32)
+        chunks = [f"chunk {start + i}" for i in range(len(vectors))]
+        vectordb.upsert_chunks(tenant_id, chunks, vectors, source_file="bench.txt", start_index=start)
+    upsert_s = time.perf_counter() - started
+
+    store = vectordb.get_store()
+    timings = []
+    for query in rng.normal(size=(queries, dim)).astype(np.float32):
+        started = time.perf_counter()
+        store.search(tenant_id, query.tolist(), limit)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    vectordb.delete_all_documents(tenant_id)
+    return {
+        "rows": rows,
+        "upsert_rows_per_s": rows / upsert_s,
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Backend: {vectordb.VECTOR_STORE}")
+    print(f"{'rows':>8} {'upsert rows/s':>14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for rows in args.rows:
+        r = run(rows, args.dim, args.queries, args.limit)
+        print(f"{r['rows']:>8} {r['upsert_rows_per_s']:>14.0f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 """
 RAG Client - Drop this into your backend codebase
 """
+import time
 import requests
 from typing import Optional, Dict, List
 
@@ -43,6 +44,51 @@ class RAGClient:
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": str(e)}
     
+    def submit_s3_job(
+        self,
+        tenant_id: str,
+        s3_bucket: str,
+        s3_key: str,
+        filename: str
+    ) -> Dict:
+        """Queue an S3 document for background ingestion; returns a job id"""
+        try:
+            response = requests.post(
+                f"{self.base_url}/jobs/process-s3",
+                data={
+                    "tenant_id": tenant_id,
+                    "s3_bucket": s3_bucket,
+                    "s3_key": s3_key,
+                    "filename": filename
+                },
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"status": "error", "message": str(e)}
+    
+    def get_job(self, job_id: str) -> Dict:
+        """Get status and progress of an ingestion job"""
+        try:
+            response = requests.get(
+                f"{self.base_url}/jobs/{job_id}",
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"status": "error", "message": str(e)}
+    
+    def wait_for_job(self, job_id: str, poll_interval: float = 2.0, timeout: float = 1800) -> Dict:
+        """Poll an ingestion job until it succeeds, fails, or timeout expires"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job.get("status") in ("succeeded", "failed", "error") or time.time() > deadline:
+                return job
+            time.sleep(poll_interval)
+    
     def query(self, tenant_id: str, query: str, limit: int = 5) -> Dict:
         """Query the RAG system"""
         try:
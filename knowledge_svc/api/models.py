@@ -16,6 +16,7 @@ class QueryResponse(BaseModel):
     status: str
     answer: str | None = None
     retrieved_chunks: list[dict] | None = None
+    cached: bool = False
 
 class FileUploadResponse(BaseModel):
     status: str
@@ -23,14 +24,51 @@ class FileUploadResponse(BaseModel):
     filename: str
     chunks_created: int
 
+class FileUpdateResponse(BaseModel):
+    status: str
+    message: str
+    filename: str
+    chunks_total: int = 0
+    chunks_unchanged: int = 0
+    chunks_moved: int = 0
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    embeddings_skipped: int = 0
+
 class FileInfo(BaseModel):
     filename: str
     file_type: str
     upload_date: str
     chunk_count: int
+    byte_size: int | None = None
+    content_hash: str | None = None
+    created_at: str | None = None
 
 class FileListResponse(BaseModel):
     status: str
     tenant_id: str
     files: list[FileInfo]
 
+
+class JobSubmitResponse(BaseModel):
+    status: str
+    job_id: str
+    filename: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    tenant_id: str
+    kind: str
+    filename: str
+    status: str
+    stage: str
+    chunks_total: int
+    chunks_embedded: int
+    chunks_stored: int
+    attempts: int
+    error: str | None = None
+    result: dict | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    updated_at: float
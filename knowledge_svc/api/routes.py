@@ -1,51 +1,120 @@
-from fastapi import APIRouter, UploadFile, File, Form
+import functools
+import json
+import os
+import time
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import List
-from datetime import datetime
 from api.models import (
     UploadRequest, UploadResponse, QueryRequest, QueryResponse,
-    FileUploadResponse, FileListResponse
+    FileUploadResponse, FileUpdateResponse, FileListResponse, JobSubmitResponse, JobStatusResponse
 )
-from services import vectordb, embedder, chunker, context_builder, llm, file_parser
+from services import (
+    vectordb, embedder, chunker, context_builder, llm, metrics, query_batcher, query_cache,
+    semantic_cache, executors, ingest, jobs, pipeline, uploads, warmup, admission
+)
+
+# Chunks retrieved per query
+QUERY_TOP_K = int(os.getenv("QUERY_TOP_K", "5"))
 
 router = APIRouter()
 
+
+def _rejected(e: admission.AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Keeps the request's admission slot until the stream is sent or abandoned."""
+
+    def __init__(self, response: StreamingResponse, ticket: admission.Ticket):
+        super().__init__(response.body_iterator, response.status_code, dict(response.headers),
+                         background=response.background)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+def admitted(lane: str, hold_slot: bool = True, cost=None):
+    """
+    Run the route through admission control in the given lane (see
+    services/admission.py). The tenant is the route's tenant_id parameter
+    or request.tenant_id. hold_slot=False applies only the rate limit.
+    cost(kwargs) is how many rate-limit tokens the request takes (default 1).
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            tenant_id = kwargs["tenant_id"] if "tenant_id" in kwargs else kwargs["request"].tenant_id
+            metrics.set_tenant(tenant_id)
+            tokens = cost(kwargs) if cost else 1
+            try:
+                if not hold_slot:
+                    admission.check_rate(lane, tenant_id, tokens)
+                    return await handler(*args, **kwargs)
+                ticket = await admission.acquire(lane, tenant_id, tokens)
+            except admission.AdmissionRejected as e:
+                raise _rejected(e)
+            try:
+                response = await handler(*args, **kwargs)
+            except BaseException:
+                ticket.release()
+                raise
+            if isinstance(response, StreamingResponse):
+                return _AdmittedStreamingResponse(response, ticket)
+            ticket.release()
+            return response
+        return wrapper
+    return decorate
+
+
 @router.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@router.get("/ready")
+async def readiness_check():
+    """200 once startup warm-up has finished (see services/warmup.py), 503 until then."""
+    if warmup.is_ready():
+        return {"status": "ready", **warmup.status()}
+    return JSONResponse(status_code=503, content={"status": "warming_up", **warmup.status()})
+
 @router.post("/upload", response_model=UploadResponse)
+@admitted(admission.BATCH)
 async def upload_text(request: UploadRequest):
     print(f"Received upload for tenant {request.tenant_id}: {len(request.raw_text)} chars")
     
     # 1. Chunking
-    chunks = chunker.chunk_text(request.raw_text)
+    with metrics.span("chunk"):
+        chunks = chunker.chunk_text(request.raw_text)
     print(f"Generated {len(chunks)} chunks")
     
-    # 2. Embedding
-    embeddings = []
-    for chunk in chunks:
-        vector = embedder.embed_document(chunk)
-        embeddings.append(vector)
-    print(f"Generated {len(embeddings)} embeddings")
-    
-    # 3. Storage
-    vectordb.upsert_chunks(request.tenant_id, chunks, embeddings)
+    # 2. Embedding + 3. Storage (off the event loop)
+    await ingest.ingest_chunks(request.tenant_id, chunks)
     
     return UploadResponse(status="processed", message=f"Successfully processed {len(chunks)} chunks")
 
 @router.post("/upload-file", response_model=FileUploadResponse)
+@admitted(admission.BATCH)
 async def upload_file(tenant_id: str = Form(...), file: UploadFile = File(...)):
     """
     Upload a single file (PDF, DOCX, TXT, or Markdown).
     """
     print(f"Received file upload for tenant {tenant_id}: {file.filename}")
     
-    # Read file bytes
-    file_bytes = await file.read()
+    # Spool to disk (bounded memory, MAX_UPLOAD_MB cap)
+    try:
+        path = await uploads.spool_upload(file)
+    except uploads.DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    # Parse file based on extension
+    # Parse → chunk → embed → store, streamed in batches through the worker pools
     try:
-        text = file_parser.parse_file(file.filename, file_bytes)
+        chunks_created = await ingest.ingest_file(tenant_id, file.filename, path)
     except ValueError as e:
         return FileUploadResponse(
             status="error",
@@ -53,71 +122,69 @@ async def upload_file(tenant_id: str = Form(...), file: UploadFile = File(...)):
             filename=file.filename,
             chunks_created=0
         )
+    finally:
+        uploads.discard(path)
     
-    # Process the text
-    chunks = chunker.chunk_text(text)
-    print(f"Generated {len(chunks)} chunks from {file.filename}")
+    return FileUploadResponse(
+        status="success",
+        message=f"Successfully processed {file.filename}",
+        filename=file.filename,
+        chunks_created=chunks_created
+    )
+
+@router.post("/update-file", response_model=FileUpdateResponse)
+@admitted(admission.BATCH)
+async def update_file(tenant_id: str = Form(...), file: UploadFile = File(...)):
+    """
+    Re-index a new version of an already uploaded file.
     
-    # Embed chunks
-    embeddings = []
-    for chunk in chunks:
-        vector = embedder.embed_document(chunk)
-        embeddings.append(vector)
+    Only chunks whose text changed are embedded and inserted; unchanged
+    chunks that shifted position are renumbered in place and chunks that
+    disappeared are deleted. The response reports how much work was skipped.
+    """
+    print(f"Received file update for tenant {tenant_id}: {file.filename}")
     
-    # Store with file metadata
-    upload_time = datetime.utcnow().isoformat()
-    vectordb.upsert_chunks(
-        tenant_id=tenant_id,
-        chunks=chunks,
-        embeddings=embeddings,
-        source_file=file.filename,
-        file_type=file_parser.get_file_extension(file.filename),
-        upload_timestamp=upload_time
-    )
+    try:
+        path = await uploads.spool_upload(file)
+    except uploads.DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    return FileUploadResponse(
+    try:
+        stats = await ingest.update_file(tenant_id, file.filename, path)
+    except ValueError as e:
+        return FileUpdateResponse(status="error", message=str(e), filename=file.filename)
+    finally:
+        uploads.discard(path)
+    
+    return FileUpdateResponse(
         status="success",
-        message=f"Successfully processed {file.filename}",
+        message=f"Successfully updated {file.filename}",
         filename=file.filename,
-        chunks_created=len(chunks)
+        embeddings_skipped=stats["chunks_total"] - stats["chunks_embedded"],
+        **stats
     )
 
+def _file_count(kwargs: dict) -> int:
+    return len(kwargs["files"])
+
 @router.post("/upload-files")
+@admitted(admission.BATCH, cost=_file_count)
 async def upload_multiple_files(tenant_id: str = Form(...), files: List[UploadFile] = File(...)):
     """
     Upload multiple files at once.
-    """
-    results = []
     
-    for file in files:
-        try:
-            file_bytes = await file.read()
-            text = file_parser.parse_file(file.filename, file_bytes)
-            chunks = chunker.chunk_text(text)
-            
-            embeddings = [embedder.embed_document(chunk) for chunk in chunks]
-            
-            upload_time = datetime.utcnow().isoformat()
-            vectordb.upsert_chunks(
-                tenant_id=tenant_id,
-                chunks=chunks,
-                embeddings=embeddings,
-                source_file=file.filename,
-                file_type=file_parser.get_file_extension(file.filename),
-                upload_timestamp=upload_time
-            )
-            
-            results.append({
-                "filename": file.filename,
-                "status": "success",
-                "chunks_created": len(chunks)
-            })
-        except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "status": "error",
-                "error": str(e)
-            })
+    Files move through parse → embed → store as a pipeline, so one file
+    parses while another embeds and a third is stored. Results are
+    reported per file, in upload order.
+
+    The batch takes one rate-limit token per file but a single batch slot:
+    the pipeline bounds its own parse/embed/store concurrency, so a large
+    batch takes longer rather than using more at once.
+    """
+    results = await pipeline.ingest_files(
+        tenant_id,
+        [(file.filename, file) for file in files]
+    )
     
     return {"status": "completed", "results": results}
 
@@ -126,36 +193,176 @@ async def list_files(tenant_id: str):
     """
     List all uploaded files for a tenant.
     """
-    files = vectordb.list_files(tenant_id)
+    files = await executors.run_io(vectordb.list_files, tenant_id)
     return FileListResponse(
         status="success",
         tenant_id=tenant_id,
         files=files
     )
 
+def _query_cache_key(request: QueryRequest) -> str:
+    return query_cache.cache_key(
+        request.tenant_id, request.query, {"top_k": QUERY_TOP_K, "embedder": embedder.vector_space()}
+    )
+
+async def _query_cache_lookup(tenant_id: str, cache_key: str):
+    with metrics.span("cache_lookup"):
+        cached, generation = await executors.run_io(query_cache.lookup, tenant_id, cache_key)
+    if generation >= 0:
+        metrics.count_cache_lookup("query", cached is not None)
+    return cached, generation
+
+def _semantic_cache_lookup(tenant_id: str, query_vector):
+    cached, generation = semantic_cache.lookup(tenant_id, query_vector)
+    if generation >= 0:
+        metrics.count_cache_lookup("semantic", cached is not None)
+    return cached, generation
+
 @router.post("/query", response_model=QueryResponse)
+@admitted(admission.INTERACTIVE)
 async def query_knowledge(request: QueryRequest):
     print(f"Received query for tenant {request.tenant_id}: {request.query}")
+
+    # 0. Answer repeated questions from the cache (invalidated on upload/delete)
+    cache_key = _query_cache_key(request)
+    cached, generation = await _query_cache_lookup(request.tenant_id, cache_key)
+    if cached is not None:
+        return QueryResponse(**cached, cached=True)
     
-    # 1. Embed query
-    query_vector = embedder.embed_query(request.query)
+    # 1. Embed query (micro-batched with concurrent queries)
+    try:
+        with metrics.span("embed_query"):
+            query_vector = await query_batcher.embed_query(request.query)
+    except query_batcher.BatcherOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    # 1b. Reuse the answer to a near-duplicate question, if enabled
+    similar, semantic_generation = _semantic_cache_lookup(request.tenant_id, query_vector)
+    if similar is not None:
+        return QueryResponse(**similar, cached=True)
     
     # 2. Search Vector DB
-    results = vectordb.search(request.tenant_id, query_vector)
+    with metrics.span("search"):
+        results = await executors.run_io(vectordb.search, request.tenant_id, query_vector, QUERY_TOP_K)
     
-    # 3. Build Context
-    context = context_builder.build_context(results)
+    # 3. Build Context (neighbouring chunks merged, capped at the token budget)
+    with metrics.span("build_context"):
+        context_stats = await executors.run_query(context_builder.assemble, results)
+    context = context_stats.pop("context")
+    print(f"Context: {context_stats['tokens']} tokens from {context_stats['chunks']} chunks "
+          f"({context_stats['tokens_deduplicated']} deduplicated, "
+          f"{context_stats['tokens_over_budget']} over budget)")
     
     # 4. Generate Answer
-    answer = llm.generate_answer(request.query, context)
-    
-    return QueryResponse(
-        status="success", 
-        answer=answer,
-        retrieved_chunks=results
+    with metrics.span("generate_answer"):
+        answer = await llm.generate_answer(request.query, context)
+
+    response = {"status": "success", "answer": answer, "retrieved_chunks": results}
+    if results and not answer.startswith(llm.ERROR_PREFIX):
+        await executors.run_io(query_cache.store, request.tenant_id, cache_key, generation, response)
+        semantic_cache.store(request.tenant_id, query_vector, semantic_generation, response)
+    return QueryResponse(**response)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _usage(chunk) -> dict | None:
+    usage = getattr(chunk, "usage", None)
+    if usage is None or isinstance(usage, dict):
+        return usage
+    return usage.model_dump()
+
+@router.post("/query/stream")
+@admitted(admission.INTERACTIVE)
+async def query_knowledge_stream(request: QueryRequest):
+    """
+    Answer a query as Server-Sent Events instead of one JSON response.
+
+    Events, in order:
+        sources: {"retrieved_chunks": [...], "cached": bool}
+        token:   {"text": "..."}, once per piece of the answer
+        done:    {"cached": bool, "timings": {...}, "usage": {...} | null}
+    or error: {"message": "..."} in place of the remaining events.
+
+    Tokens are pulled from the OpenAI stream only as fast as the client
+    reads them, and a client disconnect closes the upstream request.
+    """
+    print(f"Received streaming query for tenant {request.tenant_id}: {request.query}")
+    started = time.perf_counter()
+    timings = {}
+
+    def mark(name: str) -> None:
+        # Milliseconds since the request arrived
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    cache_key = _query_cache_key(request)
+    cached, generation = await _query_cache_lookup(request.tenant_id, cache_key)
+    query_vector = None
+    if cached is None:
+        try:
+            with metrics.span("embed_query"):
+                query_vector = await query_batcher.embed_query(request.query)
+        except query_batcher.BatcherOverloaded as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        mark("embed_ms")
+        cached, semantic_generation = _semantic_cache_lookup(request.tenant_id, query_vector)
+
+    async def cached_events():
+        yield _sse("sources", {"retrieved_chunks": cached["retrieved_chunks"], "cached": True})
+        yield _sse("token", {"text": cached["answer"]})
+        mark("total_ms")
+        yield _sse("done", {"cached": True, "timings": timings, "usage": None})
+
+    async def answer_events():
+        with metrics.span("search"):
+            results = await executors.run_io(vectordb.search, request.tenant_id, query_vector, QUERY_TOP_K)
+        mark("search_ms")
+        yield _sse("sources", {"retrieved_chunks": results, "cached": False})
+
+        with metrics.span("build_context"):
+            context_stats = await executors.run_query(context_builder.assemble, results)
+        context = context_stats.pop("context")
+        parts, usage = [], None
+        generate_started = time.perf_counter()
+        try:
+            # Leaving the block closes the upstream stream: on completion,
+            # on errors and when the client disconnects
+            async with llm.answer_stream(request.query, context) as stream:
+                # The next chunk is only read once the previous token was handed to the client
+                async for chunk in stream:
+                    usage = _usage(chunk) or usage
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        if not parts:
+                            mark("first_token_ms")
+                        parts.append(text)
+                        yield _sse("token", {"text": text})
+        except Exception as e:
+            print(f"Error streaming LLM answer: {e}")
+            yield _sse("error", {"message": f"{llm.ERROR_PREFIX}{str(e)}"})
+            return
+        finally:
+            metrics.record_stage("generate_answer", time.perf_counter() - generate_started)
+
+        if usage:
+            metrics.count_tokens(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        mark("total_ms")
+        yield _sse("done", {"cached": False, "timings": timings, "usage": usage, "context": context_stats})
+
+        response = {"status": "success", "answer": "".join(parts), "retrieved_chunks": results}
+        if results:
+            await executors.run_io(query_cache.store, request.tenant_id, cache_key, generation, response)
+            semantic_cache.store(request.tenant_id, query_vector, semantic_generation, response)
+
+    return StreamingResponse(
+        cached_events() if cached is not None else answer_events(),
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @router.post("/process-s3")
+@admitted(admission.BATCH)
 async def process_s3_document(
     tenant_id: str = Form(...),
     s3_bucket: str = Form(...),
@@ -180,36 +387,28 @@ async def process_s3_document(
         # Import S3 client
         from services import s3_client
         
-        # Download from S3
-        file_bytes = s3_client.download_from_s3(s3_bucket, s3_key)
-        
-        if not file_bytes:
-            return {
-                "status": "error",
-                "message": "Failed to download file from S3"
-            }
-        
-        # Parse file
-        text = file_parser.parse_file(filename, file_bytes)
-        
-        # Process: chunk → embed → store
-        chunks = chunker.chunk_text(text)
-        embeddings = [embedder.embed_document(chunk) for chunk in chunks]
-        
-        upload_time = datetime.utcnow().isoformat()
-        vectordb.upsert_chunks(
-            tenant_id=tenant_id,
-            chunks=chunks,
-            embeddings=embeddings,
-            source_file=filename,
-            file_type=file_parser.get_file_extension(filename),
-            upload_timestamp=upload_time
-        )
+        # Stream the object to a temp file
+        path = uploads.new_spool_path(os.path.splitext(filename)[1])
+        try:
+            size = await executors.run_io(
+                s3_client.download_to_file, s3_bucket, s3_key, path, uploads.MAX_UPLOAD_BYTES
+            )
+            
+            if not size:
+                return {
+                    "status": "error",
+                    "message": "Failed to download file from S3"
+                }
+            
+            # Process: parse → chunk → embed → store
+            chunks_created = await ingest.ingest_file(tenant_id, filename, path)
+        finally:
+            uploads.discard(path)
         
         return {
             "status": "success",
             "message": f"Successfully processed {filename}",
-            "chunks_created": len(chunks),
+            "chunks_created": chunks_created,
             "s3_path": f"s3://{s3_bucket}/{s3_key}"
         }
     
@@ -220,6 +419,75 @@ async def process_s3_document(
             "message": str(e)
         }
 
+def _job_status(job: dict) -> JobStatusResponse:
+    return JobStatusResponse(job_id=job["id"], **{k: v for k, v in job.items() if k not in ("id", "payload")})
+
+@router.post("/jobs/upload-file", response_model=JobSubmitResponse)
+@admitted(admission.BATCH, hold_slot=False)
+async def submit_file_job(tenant_id: str = Form(...), file: UploadFile = File(...)):
+    """
+    Queue a file for background ingestion and return its job id immediately.
+    Poll GET /jobs/{job_id} for progress.
+    """
+    try:
+        path = await uploads.spool_upload(file)
+    except uploads.DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = await jobs.submit(tenant_id, "file", file.filename, {}, path)
+    print(f"Queued job {job['id']} for tenant {tenant_id}: {file.filename}")
+    return JobSubmitResponse(status="queued", job_id=job["id"], filename=file.filename)
+
+@router.post("/jobs/upload-files")
+@admitted(admission.BATCH, hold_slot=False, cost=_file_count)
+async def submit_files_job(tenant_id: str = Form(...), files: List[UploadFile] = File(...)):
+    """
+    Queue several files for background ingestion (one job per file).
+    """
+    results = []
+    for file in files:
+        try:
+            path = await uploads.spool_upload(file)
+        except uploads.DocumentTooLarge as e:
+            results.append({"filename": file.filename, "status": "error", "error": str(e)})
+            continue
+        job = await jobs.submit(tenant_id, "file", file.filename, {}, path)
+        results.append({"filename": file.filename, "status": "queued", "job_id": job["id"]})
+    return {"status": "queued", "results": results}
+
+@router.post("/jobs/process-s3", response_model=JobSubmitResponse)
+@admitted(admission.BATCH, hold_slot=False)
+async def submit_s3_job(
+    tenant_id: str = Form(...),
+    s3_bucket: str = Form(...),
+    s3_key: str = Form(...),
+    filename: str = Form(...)
+):
+    """
+    Queue an S3 document for background ingestion and return its job id immediately.
+    """
+    payload = {"s3_bucket": s3_bucket, "s3_key": s3_key}
+    job = await jobs.submit(tenant_id, "s3", filename, payload)
+    print(f"Queued job {job['id']} for tenant {tenant_id}: s3://{s3_bucket}/{s3_key}")
+    return JobSubmitResponse(status="queued", job_id=job["id"], filename=filename)
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """
+    Report a job's status, current stage, progress and error.
+    """
+    job = await executors.run_io(jobs.get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return _job_status(job)
+
+@router.get("/jobs")
+async def list_jobs(tenant_id: str, limit: int = 50):
+    """
+    List a tenant's most recent jobs.
+    """
+    tenant_jobs = await executors.run_io(jobs.get_job_store().list_for_tenant, tenant_id, limit)
+    return {"status": "success", "tenant_id": tenant_id, "jobs": [_job_status(j) for j in tenant_jobs]}
+
 @router.delete("/documents/{tenant_id}/{filename}")
 async def delete_document(tenant_id: str, filename: str):
     """
@@ -235,7 +503,7 @@ async def delete_document(tenant_id: str, filename: str):
     print(f"Deleting document {filename} for tenant {tenant_id}")
     
     try:
-        deleted_count = vectordb.delete_document(tenant_id, filename)
+        deleted_count = await executors.run_io(vectordb.delete_document, tenant_id, filename)
         
         return {
             "status": "success",
@@ -264,7 +532,7 @@ async def delete_all_documents(tenant_id: str):
     print(f"Deleting ALL documents for tenant {tenant_id}")
     
     try:
-        deleted_count = vectordb.delete_all_documents(tenant_id)
+        deleted_count = await executors.run_io(vectordb.delete_all_documents, tenant_id)
         
         return {
             "status": "success",
@@ -284,29 +552,95 @@ async def delete_all_documents(tenant_id: str):
 # Debug endpoints
 @router.post("/debug/init-collection")
 async def debug_init_collection(tenant_id: str):
-    vectordb.ensure_collection(tenant_id)
+    await executors.run_io(vectordb.ensure_collection, tenant_id)
     return {"status": "ok", "message": f"Collection ensured for {tenant_id}"}
 
 @router.post("/debug/insert-dummy")
 async def debug_insert_dummy(tenant_id: str):
-    vectordb.insert_dummy_vector(tenant_id)
+    await executors.run_io(vectordb.insert_dummy_vector, tenant_id)
     return {"status": "ok", "message": f"Dummy vector inserted for {tenant_id}"}
 
 @router.post("/debug/search-dummy")
 async def debug_search_dummy(tenant_id: str):
-    results = vectordb.search_dummy_vector(tenant_id)
+    results = await executors.run_io(vectordb.search_dummy_vector, tenant_id)
     return {"status": "ok", "results": results}
 
 @router.post("/debug/embed-doc")
 async def debug_embed_doc(text: str):
-    vector = embedder.embed_document(text)
+    vector = await executors.run_query(embedder.embed_document, text)
     return {"status": "ok", "vector_length": len(vector), "vector_preview": vector[:5]}
 
 @router.post("/debug/embed-query")
 async def debug_embed_query(text: str):
-    vector = embedder.embed_query(text)
+    vector = await executors.run_query(embedder.embed_query, text)
     return {"status": "ok", "vector_length": len(vector), "vector_preview": vector[:5]}
 
+def _collect_service_metrics():
+    """Scrape-time gauges and counters from the services' own stats."""
+    cache = query_cache.stats()
+    yield "rag_query_cache_entries", "gauge", "Entries in the query cache", {"backend": cache["backend"]}, cache.get("entries", 0)
+    yield "rag_query_cache_bytes", "gauge", "Bytes used by the query cache", {"backend": cache["backend"]}, cache.get("bytes", 0)
+    semantic = semantic_cache.stats()
+    yield "rag_semantic_cache_entries", "gauge", "Entries in the semantic cache", {}, semantic["entries"]
+    embedding = embedder.cache_stats()
+    for field, result in (("memory_hits", "memory_hit"), ("disk_hits", "disk_hit"), ("misses", "miss")):
+        if field in embedding:
+            yield "rag_embedding_cache_lookups_total", "counter", "Embedding cache lookups, by result", \
+                {"result": result}, embedding[field]
+    client = llm.stats()
+    yield "rag_llm_requests_total", "counter", "LLM completions started", {}, client.get("requests", 0)
+    yield "rag_llm_retries_total", "counter", "LLM request retries", {}, client.get("retries", 0)
+    yield "rag_llm_failures_total", "counter", "LLM calls that failed after retries", {}, client.get("failures", 0)
+    yield "rag_llm_in_flight", "gauge", "LLM requests in flight", {}, client.get("in_flight", 0)
+    batcher = query_batcher.get_query_batcher().stats()
+    yield "rag_query_batcher_queue_depth", "gauge", "Queries waiting to be embedded", {}, batcher["queue_depth"]
+    yield "rag_query_batcher_rejected_total", "counter", "Queries rejected by the batcher", {}, batcher["rejected"]
+    for lane, lane_stats in admission.stats().get("lanes", {}).items():
+        yield "rag_admission_in_flight", "gauge", "Requests admitted and running", {"lane": lane}, lane_stats["in_flight"]
+        yield "rag_admission_queue_depth", "gauge", "Requests waiting for admission", {"lane": lane}, lane_stats["queue_depth"]
+        for tenant_id, tenant in lane_stats["tenants"].items():
+            # Only tenants with requests running or queued: bounded by the lane's limits
+            if tenant["in_flight"] or tenant["waiting"]:
+                yield "rag_admission_tenant_in_flight", "gauge", "Requests running per tenant", \
+                    {"lane": lane, "tenant": tenant_id}, tenant["in_flight"]
+                yield "rag_admission_tenant_queue_depth", "gauge", "Requests waiting per tenant", \
+                    {"lane": lane, "tenant": tenant_id}, tenant["waiting"]
+            for reason, count in tenant["rejected"].items():
+                yield "rag_admission_tenant_rejections_total", "counter", "Rejections per tracked tenant", \
+                    {"lane": lane, "tenant": tenant_id, "reason": reason}, count
+
+metrics.register_collector(_collect_service_metrics)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    body = await executors.run_io(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/debug/embedding-cache")
+async def debug_embedding_cache():
+    return {"status": "ok", "cache": embedder.cache_stats()}
+
+@router.get("/debug/query-cache")
+async def debug_query_cache():
+    return {"status": "ok", "cache": await executors.run_io(query_cache.stats)}
+
+@router.get("/debug/semantic-cache")
+async def debug_semantic_cache():
+    return {"status": "ok", "cache": semantic_cache.stats()}
+
+@router.get("/debug/llm")
+async def debug_llm():
+    return {"status": "ok", "llm": llm.stats()}
+
+@router.get("/debug/admission")
+async def debug_admission():
+    return {"status": "ok", "admission": admission.stats()}
+
+@router.get("/debug/query-batcher")
+async def debug_query_batcher():
+    return {"status": "ok", "batcher": query_batcher.get_query_batcher().stats()}
+
 @router.post("/debug/chunk")
 async def debug_chunk(text: str, chunk_size: int = 1000, overlap: int = 200):
     chunks = chunker.chunk_text(text, chunk_size, overlap)
@@ -314,8 +648,11 @@ async def debug_chunk(text: str, chunk_size: int = 1000, overlap: int = 200):
 
 @router.post("/debug/build-context")
 async def debug_build_context(chunks: list[dict]):
-    context = context_builder.build_context(chunks)
-    return {"status": "ok", "context": context}
+    return {"status": "ok", **await executors.run_query(context_builder.assemble, chunks)}
+
+@router.get("/debug/context-builder")
+async def debug_context_builder():
+    return {"status": "ok", "context": context_builder.stats()}
 
 
 
@@ -0,0 +1,86 @@
+"""
+Multi-process serving: gunicorn with uvicorn workers and the embedding
+model loaded once, before fork.
+
+    gunicorn -c gunicorn.conf.py            # from knowledge_svc/
+    WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py
+
+The app is imported in the master (preload_app) and when_ready() loads
+the torch embedding model there before any worker is forked. The workers
+then share the model's weights copy-on-write: tensor storage is never
+written after loading, so its pages stay shared, and gc.freeze() keeps
+the garbage collector from touching the objects loaded up to that point.
+Each worker still runs its own warm-up (services/warmup.py) and answers
+/ready on its own.
+
+Per worker, not shared: the event loop, the LLM client, the worker pools
+(including PARSE_POOL_SIZE parse processes), the in-memory caches and the
+/metrics counters. A write only invalidates the caches of the worker that
+made it, so with several workers when_ready() turns off the semantic cache
+and any query cache that is not QUERY_CACHE_BACKEND=redis; otherwise the
+other workers would serve answers from deleted or replaced chunks.
+VECTOR_STORE=local is single-process, so with several workers the master
+refuses to start; use supabase or postgres.
+"""
+import gc
+import os
+import sys
+
+# Read by services/jobs.py when the app is preloaded below: only the master
+# requeues interrupted jobs, once, instead of every (re)starting worker
+os.environ.setdefault("JOBS_REQUEUE_ON_START", "false")
+
+wsgi_app = "main:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+preload_app = True
+# Warm-up runs in the background after the lifespan starts, so boot is quick
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = None
+
+
+def when_ready(server):
+    """In the master, after the app is imported and before workers fork."""
+    from services import embedder, jobs, local_store, query_cache, semantic_cache, vectordb
+
+    if server.cfg.workers > 1:
+        if vectordb.VECTOR_STORE == "local" and not local_store.LOCAL_STORE_MULTI_WORKER:
+            # Each worker would load its own copy of LOCAL_STORE_PATH and
+            # append to the same write log; gunicorn exits on RuntimeError
+            raise RuntimeError(
+                f"VECTOR_STORE=local cannot be shared by {server.cfg.workers} workers. "
+                "Run one worker (WEB_CONCURRENCY=1) or use supabase or postgres."
+            )
+        # Before fork, so every worker inherits the switched-off caches
+        if query_cache.QUERY_CACHE_BACKEND not in ("redis", "off"):
+            print(f"⚠ QUERY_CACHE_BACKEND={query_cache.QUERY_CACHE_BACKEND} is per worker and would "
+                  "serve stale answers after another worker's writes; query cache off. Use redis.")
+            query_cache.disable()
+        if semantic_cache.SEMANTIC_CACHE_ENABLED:
+            print("⚠ The semantic cache is per worker and would serve stale answers after another "
+                  "worker's writes; semantic cache off.")
+            semantic_cache.disable()
+
+    store = jobs.JobStore()
+    jobs.requeue_interrupted(store)
+    store.close()
+
+    if embedder.EMBEDDER_BACKEND == "torch":
+        # Weights only: no forward pass in the master, so no intra-op thread
+        # pool exists to be inherited by the forked workers
+        embedder.get_model()
+    else:
+        # onnxruntime sessions are not fork-safe; each worker loads its own
+        print(f"{embedder.EMBEDDER_BACKEND} embedder: loaded per worker, not shared")
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Split the cores between the workers' torch thread pools."""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        threads = int(os.getenv("TORCH_NUM_THREADS", "0")) or max(1, (os.cpu_count() or 1) // server.cfg.workers)
+        torch.set_num_threads(threads)
@@ -7,6 +7,7 @@ CREATE TABLE IF NOT EXISTS knowledge_vectors (
     tenant_id TEXT NOT NULL,
     vector vector(768),
     text TEXT,
+    content_hash TEXT,
     chunk_index INTEGER,
     source_file TEXT,
     file_type TEXT,
@@ -14,6 +15,9 @@ CREATE TABLE IF NOT EXISTS knowledge_vectors (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Existing deployments: add the content hash used by deterministic chunk IDs
+ALTER TABLE knowledge_vectors ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
 -- Create index on tenant_id for fast filtering
 CREATE INDEX IF NOT EXISTS idx_knowledge_vectors_tenant_id 
 ON knowledge_vectors(tenant_id);
@@ -27,6 +31,28 @@ WITH (lists = 100);
 CREATE INDEX IF NOT EXISTS idx_knowledge_vectors_source_file 
 ON knowledge_vectors(tenant_id, source_file);
 
+-- Per-document manifest: one row per file, so listing a tenant's files
+-- does not have to scan its chunks
+CREATE TABLE IF NOT EXISTS knowledge_files (
+    tenant_id TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    file_type TEXT,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    byte_size BIGINT,
+    content_hash TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, source_file)
+);
+
+-- Existing deployments: backfill the manifest from the stored chunks
+INSERT INTO knowledge_files (tenant_id, source_file, file_type, chunk_count, created_at, updated_at)
+SELECT tenant_id, source_file, min(file_type), count(*), min(upload_timestamp), max(upload_timestamp)
+FROM knowledge_vectors
+WHERE source_file IS NOT NULL
+GROUP BY tenant_id, source_file
+ON CONFLICT (tenant_id, source_file) DO NOTHING;
+
 -- Create RPC function for vector similarity search
 CREATE OR REPLACE FUNCTION match_knowledge_vectors(
     query_embedding vector(768),
@@ -63,3 +89,102 @@ BEGIN
 END;
 $$;
 
+-- Apply a re-indexed document's changes in one transaction: move chunks
+-- whose text is unchanged to their new position (id and chunk_index are
+-- both derived from the position), delete chunks that no longer exist and
+-- insert the new ones, so readers never see a mix of the two versions.
+-- Moves go through a temporary id first so that swapped positions never
+-- collide on the primary key.
+-- Existing deployments: the signature gained new_rows
+DROP FUNCTION IF EXISTS reindex_document_chunks(text, text, jsonb, uuid[]);
+CREATE OR REPLACE FUNCTION reindex_document_chunks(
+    match_tenant_id text,
+    match_source_file text,
+    moves jsonb,
+    delete_ids uuid[],
+    new_rows jsonb DEFAULT '[]'::jsonb
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    deleted_count integer;
+BEGIN
+    DELETE FROM knowledge_vectors
+    WHERE knowledge_vectors.tenant_id = match_tenant_id
+      AND knowledge_vectors.source_file = match_source_file
+      AND knowledge_vectors.id = ANY(delete_ids);
+    GET DIAGNOSTICS deleted_count = ROW_COUNT;
+
+    UPDATE knowledge_vectors
+    SET id = md5(m.old_id::text || ':reindex')::uuid
+    FROM jsonb_to_recordset(moves) AS m(old_id uuid, new_id uuid, chunk_index integer)
+    WHERE knowledge_vectors.id = m.old_id
+      AND knowledge_vectors.tenant_id = match_tenant_id
+      AND knowledge_vectors.source_file = match_source_file;
+
+    UPDATE knowledge_vectors
+    SET id = m.new_id, chunk_index = m.chunk_index
+    FROM jsonb_to_recordset(moves) AS m(old_id uuid, new_id uuid, chunk_index integer)
+    WHERE knowledge_vectors.id = md5(m.old_id::text || ':reindex')::uuid;
+
+    INSERT INTO knowledge_vectors
+        (id, tenant_id, vector, text, content_hash, chunk_index, source_file, file_type, upload_timestamp)
+    SELECT r.id, match_tenant_id, r.vector::text::vector, r.text, r.content_hash, r.chunk_index,
+           match_source_file, r.file_type, r.upload_timestamp
+    FROM jsonb_to_recordset(new_rows) AS r(
+        id uuid, vector jsonb, text text, content_hash text, chunk_index integer,
+        file_type text, upload_timestamp timestamp
+    )
+    ON CONFLICT (id) DO NOTHING;
+
+    RETURN deleted_count;
+END;
+$$;
+
+-- Delete a document's chunks and its manifest entry in one transaction, so
+-- a failure can't leave a listed file with no chunks (or the reverse).
+-- Returns the number of chunks deleted.
+CREATE OR REPLACE FUNCTION delete_document_chunks(
+    match_tenant_id text,
+    match_source_file text
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    deleted_count integer;
+BEGIN
+    DELETE FROM knowledge_vectors
+    WHERE knowledge_vectors.tenant_id = match_tenant_id
+      AND knowledge_vectors.source_file = match_source_file;
+    GET DIAGNOSTICS deleted_count = ROW_COUNT;
+
+    DELETE FROM knowledge_files
+    WHERE knowledge_files.tenant_id = match_tenant_id
+      AND knowledge_files.source_file = match_source_file;
+
+    RETURN deleted_count;
+END;
+$$;
+
+-- The same for every document of a tenant.
+CREATE OR REPLACE FUNCTION delete_tenant_documents(
+    match_tenant_id text
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    deleted_count integer;
+BEGIN
+    DELETE FROM knowledge_vectors
+    WHERE knowledge_vectors.tenant_id = match_tenant_id;
+    GET DIAGNOSTICS deleted_count = ROW_COUNT;
+
+    DELETE FROM knowledge_files
+    WHERE knowledge_files.tenant_id = match_tenant_id;
+
+    RETURN deleted_count;
+END;
+$$;
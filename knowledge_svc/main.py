@@ -13,10 +13,27 @@ for var in required_vars:
     value = os.getenv(var)
     print(f"  {var}: {'✅ Set' if value else '❌ Missing'}")
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from api.routes import router
+from services import executors, jobs, llm, metrics, vectordb, warmup
 
-app = FastAPI(title="Knowledge Service", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await jobs.start_workers()
+    # Loads the model etc. in the background; /ready flips when it is done
+    warmup.start()
+    yield
+    await warmup.stop()
+    await jobs.stop_workers()
+    executors.shutdown()
+    vectordb.close_store()
+    await llm.close()
+
+
+app = FastAPI(title="Knowledge Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(router)
 
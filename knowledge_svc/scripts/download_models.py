@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Download the embedding model and the tiktoken encoding into their caches.
+
+Run at image build time (see Dockerfile) so a container starts without
+network access to Hugging Face or OpenAI's encoding files; HF_HOME and
+TIKTOKEN_CACHE_DIR decide where they land.
+
+Standalone on purpose: the Dockerfile runs it before the application code
+is copied in, so the model layer is not rebuilt on every code change. The
+defaults match services.embedder.MODEL_NAME and llm.MODEL.
+
+Usage (from knowledge_svc/):
+    python scripts/download_models.py [--embed-model NAME] [--llm-model NAME]
+"""
+import argparse
+import os
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embed-model", default="BAAI/bge-base-en-v1.5")
+    parser.add_argument("--llm-model", default=os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Downloading {args.embed_model}...")
+    SentenceTransformer(args.embed_model)
+
+    import tiktoken
+
+    print(f"Downloading the tiktoken encoding for {args.llm_model}...")
+    try:
+        tiktoken.encoding_for_model(args.llm_model)
+    except KeyError:
+        tiktoken.get_encoding("cl100k_base")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
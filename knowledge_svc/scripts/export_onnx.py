@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Export the BGE embedding model to ONNX and quantize it for CPU inference.
+
+Writes into ONNX_MODEL_DIR (default models/bge-base-en-v1.5-onnx):
+  - model.onnx            fp32 export of the transformer
+  - model_quantized.onnx  dynamic int8 (weights) quantization
+  - tokenizer files
+
+Usage (from knowledge_svc/):
+    python scripts/export_onnx.py [--output DIR] [--no-quantize]
+
+Then run the service with EMBEDDER_BACKEND=onnx and check drift with
+tests/test_onnx_parity.py.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedder import MODEL_NAME, ONNX_MODEL_DIR, MAX_SEQ_LENGTH
+
+
+def export(output_dir: str, quantize: bool = True) -> None:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Loading {MODEL_NAME}...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(
+        ["export sample"], padding=True, truncation=True,
+        max_length=MAX_SEQ_LENGTH, return_tensors="pt",
+    )
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    print(f"Exporting to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, "model_quantized.onnx")
+        print(f"Quantizing to {int8_path}...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith(".onnx"):
+            size_mb = os.path.getsize(os.path.join(output_dir, name)) / (1024 * 1024)
+            print(f"  {name}: {size_mb:.1f} MB")
+    print("✓ Export complete")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=ONNX_MODEL_DIR, help="Output directory")
+    parser.add_argument("--no-quantize", action="store_true", help="Only write the fp32 model")
+    args = parser.parse_args()
+    export(args.output, quantize=not args.no_quantize)
@@ -0,0 +1,367 @@
+"""
+Admission control: priority lanes, per-tenant limits and bounded queues.
+
+Requests are admitted into one of two lanes before any work is done:
+
+- interactive: /query and /query/stream
+- batch: /upload, /upload-file, /update-file, /upload-files and
+  /process-s3, and background ingestion jobs when they run (the /jobs
+  submissions themselves only take from the rate limit)
+
+Each lane has its own concurrency limit, so bulk ingestion can never take
+the slots queries need. The batch lane also gives way to the interactive
+one: no batch request is admitted while queries are waiting.
+
+Within a lane, every tenant has:
+
+- a token bucket (ADMISSION_<LANE>_TENANT_RATE requests per second, bursts
+  of up to ADMISSION_<LANE>_TENANT_BURST); an empty bucket is rejected at
+  once with 429
+- a concurrency limit; requests over it wait in the lane's queue, and
+  other tenants' waiting requests are admitted ahead of them
+- a cap on its waiting requests; more are rejected with 429
+
+The lane's queue holds at most ADMISSION_<LANE>_QUEUE requests and nobody
+waits longer than ADMISSION_<LANE>_QUEUE_TIMEOUT seconds; both fail with
+503. Every rejection carries a Retry-After estimate: when the tenant gets
+its next token, or how long the queue ahead would take to drain at the
+lane's recent pace.
+
+Background jobs take a batch slot with wait_for_slot(): they skip the
+rate limit and the queue caps and wait as long as it takes, since nobody
+is holding a connection open for them.
+
+A rate, concurrency or tenant queue of 0 means no limit; a lane queue of
+0 means requests never wait. ADMISSION_ENABLED=false admits everything.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from . import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Tenants whose limiter state and rejection counts are kept; idle ones are dropped beyond this
+ADMISSION_TRACKED_TENANTS = int(os.getenv("ADMISSION_TRACKED_TENANTS", "1000"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+REJECTIONS = metrics.counter("rag_admission_rejections_total", "Requests rejected by admission control",
+                             ("lane", "reason", "tier"))
+WAIT_SECONDS = metrics.histogram("rag_admission_wait_seconds", "Time admitted requests waited in the queue",
+                                 ("lane", "tier"))
+
+
+def _lane_config(lane: str, **defaults) -> dict:
+    """ADMISSION_<LANE>_<SETTING> environment overrides for one lane."""
+    return {
+        key: type(default)(os.getenv(f"ADMISSION_{lane.upper()}_{key.upper()}", str(default)))
+        for key, default in defaults.items()
+    }
+
+
+LANE_CONFIG = {
+    INTERACTIVE: _lane_config(
+        INTERACTIVE, concurrency=32, queue=64, queue_timeout=2.0,
+        tenant_concurrency=8, tenant_queue=16, tenant_rate=20.0, tenant_burst=40,
+    ),
+    BATCH: _lane_config(
+        BATCH, concurrency=4, queue=32, queue_timeout=30.0,
+        tenant_concurrency=2, tenant_queue=8, tenant_rate=2.0, tenant_burst=10,
+    ),
+}
+
+_lanes = None
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; carries the HTTP status and Retry-After."""
+
+    def __init__(self, lane: str, reason: str, status_code: int, retry_after: float, message: str):
+        super().__init__(message)
+        self.lane = lane
+        self.reason = reason
+        self.status_code = status_code
+        # Whole seconds, at least 1, as the Retry-After header wants
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Tenant:
+    """Limiter state of one tenant in one lane."""
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: dict = {}
+
+    def idle(self) -> bool:
+        return self.in_flight == 0 and self.waiting == 0
+
+
+class Ticket:
+    """An admitted request's slot; release() it when the response is done."""
+
+    def __init__(self, lane: Optional["Lane"], tenant_id: str, holds_slot: bool):
+        self.lane = lane
+        self.tenant_id = tenant_id
+        self.holds_slot = holds_slot
+        self.started = time.monotonic()
+
+    def release(self) -> None:
+        if self.holds_slot:
+            self.holds_slot = False
+            self.lane.release(self.tenant_id, time.monotonic() - self.started)
+
+
+class Lane:
+    """One priority lane: a concurrency limit, per-tenant limits and a bounded FIFO queue."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float,
+                 tenant_concurrency: int, tenant_queue: int, tenant_rate: float, tenant_burst: int,
+                 yields_to: Optional["Lane"] = None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.tenant_concurrency = tenant_concurrency
+        self.tenant_queue = tenant_queue
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = max(1, tenant_burst)
+        # Lanes waiting on this one: re-checked whenever its queue empties
+        self.yields_to = yields_to
+        self.waited_on_by: list["Lane"] = []
+        if yields_to is not None:
+            yields_to.waited_on_by.append(self)
+
+        self.in_flight = 0
+        self.waiters: deque = deque()  # (tenant_id, future, enqueued_at)
+        self.tenants: dict[str, _Tenant] = {}
+        # Moving average of how long a request holds its slot, for Retry-After
+        self.avg_hold = 0.0
+
+    def _tenant(self, tenant_id: str) -> _Tenant:
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            if len(self.tenants) >= ADMISSION_TRACKED_TENANTS:
+                self._forget_idle()
+            tenant = self.tenants[tenant_id] = _Tenant(self.tenant_burst)
+        return tenant
+
+    def _forget_idle(self) -> None:
+        # An idle tenant whose bucket has refilled is the same as a new one
+        now = time.monotonic()
+        for tenant_id, tenant in list(self.tenants.items()):
+            if tenant.idle() and self._refill(tenant, now) >= self.tenant_burst:
+                del self.tenants[tenant_id]
+
+    def _refill(self, tenant: _Tenant, now: float) -> float:
+        if self.tenant_rate > 0:
+            tenant.tokens = min(self.tenant_burst, tenant.tokens + (now - tenant.refilled) * self.tenant_rate)
+            tenant.refilled = now
+        return tenant.tokens
+
+    def _reject(self, tenant_id: str, tenant: _Tenant, reason: str, status_code: int,
+                retry_after: float, message: str) -> AdmissionRejected:
+        tenant.rejected[reason] = tenant.rejected.get(reason, 0) + 1
+        REJECTIONS.inc(lane=self.name, reason=reason, tier=metrics.tenant_tier(tenant_id))
+        return AdmissionRejected(self.name, reason, status_code, retry_after, message)
+
+    def _drain_estimate(self, ahead: int) -> float:
+        """Seconds until `ahead` more requests have gone through at the recent pace."""
+        hold = self.avg_hold or 1.0
+        return hold * (ahead + 1) / max(1, self.concurrency or 1)
+
+    def _can_start(self, tenant: _Tenant) -> bool:
+        if self.concurrency and self.in_flight >= self.concurrency:
+            return False
+        if self.tenant_concurrency and tenant.in_flight >= self.tenant_concurrency:
+            return False
+        return self.yields_to is None or not self.yields_to.waiters
+
+    def _eligible_waiting(self) -> bool:
+        """Whether a queued request could take a free slot (and so goes first)."""
+        return any(
+            not self.tenant_concurrency or self.tenants[tenant_id].in_flight < self.tenant_concurrency
+            for tenant_id, _, _ in self.waiters
+        )
+
+    def _start(self, tenant: _Tenant) -> None:
+        self.in_flight += 1
+        tenant.in_flight += 1
+        tenant.admitted += 1
+
+    def check_rate(self, tenant_id: str, cost: int = 1) -> _Tenant:
+        """
+        Take cost tokens from the tenant's bucket, or raise 429. A cost over
+        the burst size takes the whole bucket, so it can still get in.
+        """
+        tenant = self._tenant(tenant_id)
+        if self.tenant_rate <= 0:
+            return tenant
+        cost = min(max(1, cost), self.tenant_burst)
+        tokens = self._refill(tenant, time.monotonic())
+        if tokens < cost:
+            raise self._reject(
+                tenant_id, tenant, "rate_limited", 429, (cost - tokens) / self.tenant_rate,
+                f"Tenant {tenant_id} is over its {self.name} rate limit ({self.tenant_rate:g} requests/s)",
+            )
+        tenant.tokens -= cost
+        return tenant
+
+    async def acquire(self, tenant_id: str, cost: int = 1) -> None:
+        """Wait for a slot, or raise AdmissionRejected."""
+        tenant = self.check_rate(tenant_id, cost)
+        if self._can_start(tenant) and not self._eligible_waiting():
+            self._start(tenant)
+            WAIT_SECONDS.observe(0.0, lane=self.name, tier=metrics.tenant_tier(tenant_id))
+            return
+
+        if self.tenant_queue and tenant.waiting >= self.tenant_queue:
+            raise self._reject(
+                tenant_id, tenant, "tenant_queue_full", 429, self._drain_estimate(tenant.waiting),
+                f"Tenant {tenant_id} already has {tenant.waiting} {self.name} requests waiting",
+            )
+        if len(self.waiters) >= self.queue:
+            raise self._reject(
+                tenant_id, tenant, "queue_full", 503, self._drain_estimate(len(self.waiters)),
+                f"The {self.name} queue is full ({self.queue} waiting)",
+            )
+
+        await self._wait(tenant_id, tenant, self.queue_timeout)
+
+    async def wait_for_slot(self, tenant_id: str) -> None:
+        """Wait for a slot with no rate limit, queue cap or timeout (background jobs)."""
+        tenant = self._tenant(tenant_id)
+        if self._can_start(tenant) and not self._eligible_waiting():
+            self._start(tenant)
+            WAIT_SECONDS.observe(0.0, lane=self.name, tier=metrics.tenant_tier(tenant_id))
+            return
+        await self._wait(tenant_id, tenant, None)
+
+    async def _wait(self, tenant_id: str, tenant: _Tenant, timeout: Optional[float]) -> None:
+        """Queue for a slot; raises AdmissionRejected once timeout seconds have passed."""
+        future = asyncio.get_running_loop().create_future()
+        waiter = (tenant_id, future, time.monotonic())
+        self.waiters.append(waiter)
+        tenant.waiting += 1
+        self.dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Admitted just as we gave up: hand the slot back
+                self.release(tenant_id, 0.0)
+            else:
+                self.waiters.remove(waiter)
+                tenant.waiting -= 1
+                self._queue_changed()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(
+                    tenant_id, tenant, "queue_timeout", 503, self._drain_estimate(len(self.waiters)),
+                    f"Timed out after {self.queue_timeout:g}s waiting in the {self.name} queue",
+                ) from None
+            raise
+        WAIT_SECONDS.observe(time.monotonic() - waiter[2], lane=self.name, tier=metrics.tenant_tier(tenant_id))
+
+    def release(self, tenant_id: str, held: float) -> None:
+        tenant = self.tenants.get(tenant_id)
+        self.in_flight -= 1
+        if tenant is not None:
+            tenant.in_flight -= 1
+        self.avg_hold = held if not self.avg_hold else 0.9 * self.avg_hold + 0.1 * held
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """Admit waiting requests, oldest first, skipping tenants at their limit."""
+        if self.yields_to is not None and self.yields_to.waiters:
+            return
+        for waiter in list(self.waiters):
+            if self.concurrency and self.in_flight >= self.concurrency:
+                break
+            tenant_id, future, _ = waiter
+            tenant = self.tenants[tenant_id]
+            if future.done() or (self.tenant_concurrency and tenant.in_flight >= self.tenant_concurrency):
+                continue
+            self.waiters.remove(waiter)
+            tenant.waiting -= 1
+            self._start(tenant)
+            future.set_result(None)
+        self._queue_changed()
+
+    def _queue_changed(self) -> None:
+        if not self.waiters:
+            for lane in self.waited_on_by:
+                lane.dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "avg_hold_s": round(self.avg_hold, 4),
+            "limits": {
+                "concurrency": self.concurrency, "queue": self.queue, "queue_timeout_s": self.queue_timeout,
+                "tenant_concurrency": self.tenant_concurrency, "tenant_queue": self.tenant_queue,
+                "tenant_rate": self.tenant_rate, "tenant_burst": self.tenant_burst,
+            },
+            "tenants": {
+                tenant_id: {
+                    "in_flight": tenant.in_flight,
+                    "waiting": tenant.waiting,
+                    "admitted": tenant.admitted,
+                    "rejected": dict(tenant.rejected),
+                    "tokens": round(tenant.tokens, 2) if self.tenant_rate > 0 else None,
+                }
+                # Copied first: /metrics renders off the event loop
+                for tenant_id, tenant in list(self.tenants.items())
+            },
+        }
+
+
+def get_lanes() -> dict[str, Lane]:
+    """Get or create the lanes."""
+    global _lanes
+    if _lanes is None:
+        interactive = Lane(INTERACTIVE, **LANE_CONFIG[INTERACTIVE])
+        batch = Lane(BATCH, **LANE_CONFIG[BATCH], yields_to=interactive)
+        _lanes = {INTERACTIVE: interactive, BATCH: batch}
+    return _lanes
+
+
+async def acquire(lane: str, tenant_id: str, cost: int = 1) -> Ticket:
+    """
+    Admit a request into a lane; release() the ticket when it is done.
+    cost is how many rate-limit tokens it takes (it always holds one slot).
+    """
+    if not ADMISSION_ENABLED:
+        return Ticket(None, tenant_id, holds_slot=False)
+    target = get_lanes()[lane]
+    await target.acquire(tenant_id, cost)
+    return Ticket(target, tenant_id, holds_slot=True)
+
+
+async def wait_for_slot(lane: str, tenant_id: str) -> Ticket:
+    """Take a slot for background work, waiting as long as it takes; release() the ticket after."""
+    if not ADMISSION_ENABLED:
+        return Ticket(None, tenant_id, holds_slot=False)
+    target = get_lanes()[lane]
+    await target.wait_for_slot(tenant_id)
+    return Ticket(target, tenant_id, holds_slot=True)
+
+
+def check_rate(lane: str, tenant_id: str, cost: int = 1) -> None:
+    """Apply only the lane's per-tenant rate limit (for cheap requests that hold no slot)."""
+    if ADMISSION_ENABLED:
+        get_lanes()[lane].check_rate(tenant_id, cost)
+
+
+def stats() -> dict:
+    if not ADMISSION_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "lanes": {name: lane.stats() for name, lane in get_lanes().items()}}
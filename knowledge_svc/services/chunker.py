@@ -17,3 +17,30 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[st
         start += chunk_size - overlap
         
     return chunks
+
+def iter_chunks(pieces, chunk_size: int = 1000, overlap: int = 200):
+    """
+    Streaming version of chunk_text.
+    
+    Consumes text pieces (e.g. pages from file_parser.iter_text) and yields
+    exactly the chunks chunk_text would produce for their concatenation,
+    while only holding about one chunk plus the current piece in memory.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    pos = 0       # start of the next chunk within buffer
+    covered = 0   # leading chars of buffer[pos:] already part of an emitted chunk
+    
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer = buffer[pos:] + piece
+        pos = 0
+        
+        while len(buffer) - pos >= chunk_size:
+            yield buffer[pos:pos + chunk_size]
+            pos += step
+            covered = overlap
+    
+    if len(buffer) - pos > covered:
+        yield buffer[pos:]
@@ -1,14 +1,203 @@
-def build_context(chunks: list[dict]) -> str:
+"""
+Builds the LLM prompt context from retrieved chunks.
+
+chunker.chunk_text makes neighbouring chunks share CHUNK_OVERLAP characters,
+and a search often returns several neighbours from the same document, so
+concatenating the chunks verbatim pays for that text twice. Instead:
+
+1. chunks of the same source with consecutive chunk_index values are merged
+   into one passage, dropping the span each chunk repeats from the one
+   before it (only when that overlap is actually found, so unrelated
+   chunks that happen to share a source name are never spliced together)
+2. passages are ordered by their best chunk's score
+3. passages are added until CONTEXT_TOKEN_BUDGET tokens are used; the
+   first passage that does not fit is cut at a token boundary if at least
+   CONTEXT_MIN_PASSAGE_TOKENS remain, and the rest are dropped
+
+Tokens are counted with tiktoken for llm.MODEL when it is installed, and
+estimated at CHARS_PER_TOKEN otherwise.
+"""
+import math
+import os
+import threading
+
+from . import llm
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.getenv("CONTEXT_MIN_PASSAGE_TOKENS", "50"))
+# Matches chunker.chunk_text's default overlap
+CHUNK_OVERLAP = 200
+# Shorter suffix/prefix matches are treated as coincidence, not overlap
+MIN_OVERLAP = 16
+# Estimate used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+SEPARATOR = "\n\n---\n\n"
+
+_encoding = None
+_encoding_loaded = False
+_totals_lock = threading.Lock()
+_totals = {"calls": 0, "tokens": 0, "tokens_verbatim": 0, "tokens_deduplicated": 0, "tokens_over_budget": 0,
+           "truncated": 0}
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(llm.MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable ({e}); estimating context tokens at {CHARS_PER_TOKEN} chars/token")
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text that fits in max_tokens."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def overlap_length(previous: str, following: str, expected: int = CHUNK_OVERLAP) -> int:
+    """Length of the longest suffix of previous that following starts with (0 if under MIN_OVERLAP)."""
+    limit = min(len(previous), len(following))
+    # The common case: chunker's fixed overlap. Checked first because on
+    # repetitive text a longer suffix/prefix match would eat real text.
+    if MIN_OVERLAP <= expected <= limit and previous.endswith(following[:expected]):
+        return expected
+    for k in range(limit, MIN_OVERLAP - 1, -1):
+        if previous.endswith(following[:k]):
+            return k
+    return 0
+
+
+def _format(source: str, text: str) -> str:
+    return f"Source: {source}\nContent: {text}"
+
+
+def merge_passages(chunks: list[dict]) -> list[dict]:
+    """
+    Merge overlapping neighbours into passages.
+
+    Returns {"source", "text", "score", "chunks"} dicts, best score first.
+    """
+    by_source: dict = {}
+    for order, chunk in enumerate(chunks):
+        by_source.setdefault(chunk.get("source", "unknown"), []).append((order, chunk))
+
+    passages = []
+    for source, items in by_source.items():
+        items.sort(key=lambda item: (item[1].get("chunk_index") is None, item[1].get("chunk_index") or 0, item[0]))
+        current = None
+        for order, chunk in items:
+            text = chunk.get("text", "")
+            index = chunk.get("chunk_index")
+            score = chunk.get("score", 0.0)
+            if current is not None and index is not None and current["last_index"] is not None \
+                    and index == current["last_index"] + 1:
+                k = overlap_length(current["text"], text)
+                if k:
+                    current["text"] += text[k:]
+                    current["last_index"] = index
+                    current["score"] = max(current["score"], score)
+                    current["order"] = min(current["order"], order)
+                    current["chunks"] += 1
+                    continue
+            current = {"source": source, "text": text, "score": score, "order": order,
+                       "last_index": index, "chunks": 1}
+            passages.append(current)
+
+    # Best score first; retrieval order breaks ties
+    passages.sort(key=lambda p: (-p["score"], p["order"]))
+    return [{"source": p["source"], "text": p["text"], "score": p["score"], "chunks": p["chunks"]} for p in passages]
+
+
+def assemble(chunks: list[dict], budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """
+    Build the context and report what it cost.
+
+    Returns:
+        context: the prompt context
+        tokens: tokens in context
+        tokens_verbatim: tokens the chunks would have cost concatenated as-is
+        tokens_deduplicated: tokens saved by merging neighbours (overlap
+            sent once), before the budget is applied
+        tokens_over_budget: tokens of the merged passages cut or dropped
+            to fit the budget
+        chunks, passages: chunks in, passages out
+        truncated: whether the budget cut or dropped a passage
+
+    Blocking (tiktoken); call it in a worker thread from async code.
+    """
     if not chunks:
-        return ""
-    
-    context_parts = []
-    for chunk in chunks:
-        text = chunk.get("text", "")
-        source = chunk.get("source", "unknown")
-        
-        # Simple formatting
-        part = f"Source: {source}\nContent: {text}"
-        context_parts.append(part)
-    
-    return "\n\n---\n\n".join(context_parts)
+        return {"context": "", "tokens": 0, "tokens_verbatim": 0, "tokens_deduplicated": 0,
+                "tokens_over_budget": 0, "chunks": 0, "passages": 0, "truncated": False}
+
+    separator_tokens = count_tokens(SEPARATOR)
+    parts = []
+    used = 0
+    truncated = False
+    merged = [_format(passage["source"], passage["text"]) for passage in merge_passages(chunks)]
+    for part in merged:
+        cost = count_tokens(part) + (separator_tokens if parts else 0)
+        if used + cost <= budget:
+            parts.append(part)
+            used += cost
+            continue
+        truncated = True
+        remaining = budget - used - (separator_tokens if parts else 0)
+        if remaining >= CONTEXT_MIN_PASSAGE_TOKENS:
+            parts.append(truncate_tokens(part, remaining))
+        break
+
+    context = SEPARATOR.join(parts)
+    tokens = count_tokens(context)
+    verbatim = count_tokens(SEPARATOR.join(
+        _format(chunk.get("source", "unknown"), chunk.get("text", "")) for chunk in chunks
+    ))
+    merged_tokens = count_tokens(SEPARATOR.join(merged)) if truncated else tokens
+    result = {
+        "context": context,
+        "tokens": tokens,
+        "tokens_verbatim": verbatim,
+        "tokens_deduplicated": verbatim - merged_tokens,
+        "tokens_over_budget": merged_tokens - tokens,
+        "chunks": len(chunks),
+        "passages": len(parts),
+        "truncated": truncated,
+    }
+    with _totals_lock:
+        _totals["calls"] += 1
+        _totals["tokens"] += tokens
+        _totals["tokens_verbatim"] += verbatim
+        _totals["tokens_deduplicated"] += result["tokens_deduplicated"]
+        _totals["tokens_over_budget"] += result["tokens_over_budget"]
+        _totals["truncated"] += int(truncated)
+    return result
+
+
+def build_context(chunks: list[dict], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    return assemble(chunks, budget)["context"]
+
+
+def stats() -> dict:
+    """Cumulative token counts since startup."""
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["budget"] = CONTEXT_TOKEN_BUDGET
+    totals["tokenizer"] = "tiktoken" if _get_encoding() is not None else f"estimate ({CHARS_PER_TOKEN} chars/token)"
+    return totals
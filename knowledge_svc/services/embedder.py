@@ -1,25 +1,205 @@
-from sentence_transformers import SentenceTransformer
+import os
+import numpy as np
+
+from .embedding_cache import cache_key, get_embedding_cache
 
 MODEL_NAME = "BAAI/bge-base-en-v1.5"
-_model = None
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+
+# "torch" runs SentenceTransformer; "onnx" runs an exported (optionally
+# int8-quantized) model with onnxruntime, see scripts/export_onnx.py
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/bge-base-en-v1.5-onnx")
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model_quantized.onnx")
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))  # 0 = onnxruntime default
+MAX_SEQ_LENGTH = 512
+
+# BGE v1.5: No instruction needed for documents
+DOCUMENT_PREFIX = ""
+# BGE v1.5: Recommended instruction for queries
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+_backend = None
+
+
+class TorchBackend:
+    """BGE through PyTorch SentenceTransformer (CLS pooling + L2 norm)."""
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(MODEL_NAME)
+        self.name = MODEL_NAME
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+
+
+class OnnxBackend:
+    """
+    BGE through onnxruntime on CPU.
+
+    Reproduces the SentenceTransformer pipeline for this model: tokenize,
+    take the CLS token of the last hidden state, L2-normalize.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, model_file: str = ONNX_MODEL_FILE):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise ValueError(
+                f"ONNX model not found at {model_path}. "
+                "Run scripts/export_onnx.py to export and quantize it."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_NUM_THREADS:
+            options.intra_op_num_threads = ONNX_NUM_THREADS
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+        # Keep quantized vectors apart from torch ones in the embedding cache
+        self.name = f"{MODEL_NAME}@onnx/{model_file}"
+
+    def encode(self, texts: list[str], batch_size: int) -> np.ndarray:
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in tokens.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            cls = hidden[:, 0]
+            norms = np.linalg.norm(cls, axis=1, keepdims=True)
+            out[start:start + len(batch)] = cls / np.clip(norms, 1e-12, None)
+        return out
+
 
-def get_model() -> SentenceTransformer:
-    global _model
-    if _model is None:
-        print(f"Loading embedding model: {MODEL_NAME}...")
-        _model = SentenceTransformer(MODEL_NAME)
+def create_backend(name: str = EMBEDDER_BACKEND):
+    """Instantiate an embedder backend by name ("torch" or "onnx")."""
+    if name == "torch":
+        return TorchBackend()
+    if name == "onnx":
+        return OnnxBackend()
+    raise ValueError(f"Unknown EMBEDDER_BACKEND: {name}. Supported: torch, onnx")
+
+
+def get_model():
+    """Get or create the configured embedder backend singleton."""
+    global _backend
+    if _backend is None:
+        print(f"Loading embedding model: {MODEL_NAME} ({EMBEDDER_BACKEND} backend)...")
+        _backend = create_backend()
         print("Model loaded.")
-    return _model
+    return _backend
+
+def vector_space() -> str:
+    """
+    Name of the vectors the configured backend produces (its backend.name),
+    without loading the model. Vectors from different spaces must not be
+    mixed, e.g. in a cache shared by torch and onnx deployments.
+    """
+    if _backend is not None:
+        return _backend.name
+    if EMBEDDER_BACKEND == "onnx":
+        return f"{MODEL_NAME}@onnx/{ONNX_MODEL_FILE}"
+    return MODEL_NAME
+
+def _encode(texts: list[str], batch_size: int, backend=None) -> np.ndarray:
+    """
+    Run the model over texts in length-sorted batches.
+
+    Sorting by length keeps the padding inside each batch small; rows are
+    written back in input order.
+    """
+    backend = backend or get_model()
+    out = np.empty((len(texts), backend.dimension), dtype=np.float32)
+    if not texts:
+        return out
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        out[idx] = backend.encode([texts[i] for i in idx], batch_size)
+    return out
+
+def _embed_cached(texts: list[str], prefix: str, batch_size: int) -> np.ndarray:
+    """Embed prefix + text for each text, only running the model on cache misses."""
+    if not EMBED_CACHE_ENABLED:
+        return _encode([prefix + t for t in texts], batch_size)
+
+    backend = get_model()
+    cache = get_embedding_cache()
+    keys = [cache_key(backend.name, prefix, t) for t in texts]
+    cached = cache.get_many(set(keys))
+
+    # Identical texts inside one call are only embedded once
+    missing = list(dict.fromkeys(k for k in keys if k not in cached))
+    if missing:
+        first_text = {}
+        for key, text in zip(keys, texts):
+            first_text.setdefault(key, text)
+        vectors = _encode([prefix + first_text[k] for k in missing], batch_size, backend)
+        cache.put_many(zip(missing, vectors))
+        cached.update(zip(missing, vectors))
+
+    if not texts:
+        return np.empty((0, backend.dimension), dtype=np.float32)
+    return np.ascontiguousarray(np.stack([cached[k] for k in keys]), dtype=np.float32)
 
 def embed_document(text: str) -> list[float]:
-    model = get_model()
-    # BGE v1.5: No instruction needed for documents
-    embedding = model.encode(text, normalize_embeddings=True)
-    return embedding.tolist()
+    return _embed_cached([text], DOCUMENT_PREFIX, 1)[0].tolist()
+
+def embed_documents(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    Embed many document chunks with batched forward passes.
+
+    Chunks already in the embedding cache skip the model entirely.
+
+    Returns:
+        Contiguous float32 matrix of shape (len(texts), dim)
+    """
+    return _embed_cached(texts, DOCUMENT_PREFIX, batch_size)
 
 def embed_query(text: str) -> list[float]:
-    model = get_model()
-    # BGE v1.5: Recommended instruction for queries
-    instruction = "Represent this sentence for searching relevant passages: "
-    embedding = model.encode(instruction + text, normalize_embeddings=True)
-    return embedding.tolist()
+    return _embed_cached([text], QUERY_INSTRUCTION, 1)[0].tolist()
+
+def embed_queries(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Embed several search queries in one batched pass (see query_batcher)."""
+    return _embed_cached(texts, QUERY_INSTRUCTION, batch_size)
+
+def warm_up() -> None:
+    """
+    Load the model and run a dummy batch of each kind through it.
+
+    The first forward passes allocate buffers and are far slower than the
+    rest; the cache is bypassed so nothing dummy is stored.
+    """
+    backend = get_model()
+    _encode([DOCUMENT_PREFIX + "warm-up document " * 64] * EMBED_BATCH_SIZE, EMBED_BATCH_SIZE, backend)
+    _encode([QUERY_INSTRUCTION + "warm-up query"], 1, backend)
+
+def cache_stats() -> dict:
+    """Embedding cache counters, or an empty dict when the cache is disabled."""
+    if not EMBED_CACHE_ENABLED:
+        return {}
+    return get_embedding_cache().stats()
@@ -0,0 +1,231 @@
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by (model name, instruction prefix, SHA-256 of the text),
+so an unchanged chunk maps to the same entry no matter which file or tenant
+it came from. Two tiers sit in front of the model:
+
+- an in-memory LRU bounded by EMBED_CACHE_MEMORY_MB
+- an on-disk SQLite table bounded by EMBED_CACHE_DISK_MB (set
+  EMBED_CACHE_PATH to an empty string to disable it)
+
+The SQLite file is shared by every process that opens it (e.g. gunicorn
+workers), so its size is read from the database itself rather than
+counted per process, and the cap holds for all of them together.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "data/embedding_cache.sqlite")
+EMBED_CACHE_MEMORY_MB = float(os.getenv("EMBED_CACHE_MEMORY_MB", "64"))
+EMBED_CACHE_DISK_MB = float(os.getenv("EMBED_CACHE_DISK_MB", "1024"))
+
+# When a tier goes over its cap, evict down to this fraction of it so we
+# don't pay for an eviction pass on every insert.
+_EVICT_TARGET = 0.9
+
+_cache = None
+
+
+def cache_key(model_name: str, prefix: str, text: str) -> str:
+    """Build the cache key for one text."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model_name}\x1f{prefix}\x1f{digest}"
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of float32 embedding vectors."""
+
+    def __init__(
+        self,
+        path: Optional[str] = EMBED_CACHE_PATH,
+        memory_bytes: int = int(EMBED_CACHE_MEMORY_MB * 1024 * 1024),
+        disk_bytes: int = int(EMBED_CACHE_DISK_MB * 1024 * 1024),
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_used = 0
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Other processes' writes hold the lock briefly; wait rather than fail
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA busy_timeout=30000")
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    nbytes INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+            )
+            self._db.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the keys that are present."""
+        found: Dict[str, np.ndarray] = {}
+        pending: List[str] = []
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    pending.append(key)
+
+            if pending and self._db is not None:
+                now = time.time()
+                promoted = []
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(pending), 500):
+                    batch = pending[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        promoted.append((key, vector))
+                if promoted:
+                    self._db.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, key) for key, _ in promoted],
+                    )
+                    self._db.commit()
+                    self.disk_hits += len(promoted)
+                    for key, vector in promoted:
+                        self._remember(key, vector)
+
+            self.misses += sum(1 for key in pending if key not in found)
+
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        """Store vectors in both tiers."""
+        rows = []
+        now = time.time()
+
+        with self._lock:
+            for key, vector in items:
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes(), vector.nbytes, now))
+
+            if rows and self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_access) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                # Still inside the insert's write transaction, so no other
+                # process changes the size between the check and the eviction
+                if self._disk_size() > self.disk_bytes:
+                    self._evict_disk()
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert into the memory tier and evict LRU entries over the cap."""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old.nbytes
+        self._memory[key] = vector
+        self._memory_used += vector.nbytes
+
+        if self._memory_used > self.memory_bytes:
+            target = self.memory_bytes * _EVICT_TARGET
+            while self._memory and self._memory_used > target:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+                self.evictions += 1
+
+    def _disk_size(self) -> int:
+        """Bytes of the database in use (pages not on the freelist)."""
+        page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def _evict_disk(self) -> None:
+        """Drop least recently used rows until the disk tier is under its cap."""
+        target = self.disk_bytes * _EVICT_TARGET
+        used = self._disk_size()
+        while used > target:
+            # Pages are freed in whole, so estimate from the row sizes and
+            # measure again after each round
+            rows = self._db.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            dropped = []
+            excess = used - target
+            for key, nbytes in rows:
+                dropped.append((key,))
+                excess -= nbytes
+                if excess <= 0:
+                    break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", dropped)
+            self.evictions += len(dropped)
+            used = self._disk_size()
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and tier sizes."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_limit_bytes": self.memory_bytes,
+                "disk_enabled": self._db is not None,
+                "disk_bytes": self._disk_size() if self._db is not None else 0,
+                "disk_limit_bytes": self.disk_bytes,
+            }
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get or create the embedding cache singleton."""
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
@@ -0,0 +1,75 @@
+"""
+Bounded worker pools for blocking work.
+
+Route handlers are async, so anything CPU-heavy or using a synchronous
+client must run here instead of on the event loop:
+
+- parse: process pool for document parsing and chunking (pure-Python,
+  GIL-bound work such as pdfplumber)
+- embed: thread pool for ingestion embedding (torch/onnxruntime release
+  the GIL while they compute)
+- query: thread pool reserved for query embeddings, so a large ingestion
+  never queues interactive queries behind it
+- io: thread pool for Supabase and boto3 calls (the LLM client is async,
+  see services.llm)
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+PARSE_POOL_SIZE = int(os.getenv("PARSE_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", "1"))
+QUERY_POOL_SIZE = int(os.getenv("QUERY_POOL_SIZE", "1"))
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+
+_pools: dict[str, Optional[Executor]] = {"parse": None, "embed": None, "query": None, "io": None}
+
+
+def get_pool(name: str) -> Executor:
+    """Get or create one of the named pools."""
+    pool = _pools[name]
+    if pool is None:
+        if name == "parse":
+            # spawn, not fork: the parent may already hold torch threads
+            pool = ProcessPoolExecutor(
+                max_workers=PARSE_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            size = {"embed": EMBED_POOL_SIZE, "query": QUERY_POOL_SIZE, "io": IO_POOL_SIZE}[name]
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-pool")
+        _pools[name] = pool
+    return pool
+
+
+async def run_in_pool(name: str, fn: Callable, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the named pool and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(name), functools.partial(fn, *args, **kwargs))
+
+
+async def run_parse(fn: Callable, *args, **kwargs):
+    return await run_in_pool("parse", fn, *args, **kwargs)
+
+
+async def run_embed(fn: Callable, *args, **kwargs):
+    return await run_in_pool("embed", fn, *args, **kwargs)
+
+
+async def run_query(fn: Callable, *args, **kwargs):
+    return await run_in_pool("query", fn, *args, **kwargs)
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    return await run_in_pool("io", fn, *args, **kwargs)
+
+
+def shutdown() -> None:
+    """Shut down every pool that was started."""
+    for name, pool in _pools.items():
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _pools[name] = None
@@ -1,18 +1,18 @@
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Union
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import ExitStack
+import codecs
 import io
+import os
+import time
 from pathlib import Path
-
-# PDF parsing
-import PyPDF2
-import pdfplumber
-
-# DOCX parsing
-from docx import Document
-
-# Markdown parsing
-import markdown
 from html.parser import HTMLParser
 
+# PyPDF2, pdfplumber, python-docx and markdown are imported where they are
+# used: together they are a large share of the service's import time, and
+# most processes only ever parse some of the formats (see preload()).
+
 
 class MLStripper(HTMLParser):
     """Helper to strip HTML tags from markdown conversion."""
@@ -37,42 +37,229 @@ def strip_html_tags(html: str) -> str:
     return s.get_data()
 
 
-def parse_pdf(file_bytes: bytes) -> str:
-    """Extract text from PDF using PyPDF2 and pdfplumber."""
-    text_parts = []
+# Pages per task when a PDF is split across a process pool
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", "8"))
+# PDF shards submitted ahead of the one being consumed; bounds parsed text held in memory
+PDF_SHARDS_IN_FLIGHT = int(os.getenv("PDF_SHARDS_IN_FLIGHT", "8"))
+# Bytes decoded per step when streaming plain text files
+TEXT_READ_BLOCK = 1024 * 1024
+
+# Parsers accept raw bytes or a path to a (spooled) file on disk
+Source = Union[bytes, str, os.PathLike]
+
+
+def preload() -> None:
+    """Import every parser library now (warms parse pool workers at startup)."""
+    import docx  # noqa: F401
+    import markdown  # noqa: F401
+    import pdfplumber  # noqa: F401
+    import PyPDF2  # noqa: F401
+
+
+def open_source(source: Source):
+    """Open a source as a binary file object."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def _joined(pieces: Iterable[str], sep: str) -> Iterator[str]:
+    """Yield pieces with sep between them, i.e. a streamed sep.join(pieces)."""
+    first = True
+    for piece in pieces:
+        if not first:
+            yield sep
+        yield piece
+        first = False
+
+
+def pdf_page_count(source: Source) -> int:
+    """Number of pages in a PDF (cheap: only reads the page tree)."""
+    import PyPDF2
+
+    with open_source(source) as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_pages(source: Source, start: int, end: int) -> list[dict]:
+    """
+    Extract text from pages [start, end) of a PDF.
+    
+    pdfplumber is tried first (better for tables and layout). A page it
+    fails on falls back to PyPDF2 for that page only.
     
+    Returns:
+        One dict per page: page (0-based), text, seconds, engine
+        ("pdfplumber", "pypdf2" or None if both failed) and error
+    """
+    import pdfplumber
+    import PyPDF2
+
+    pages = []
+    fallback_reader = None
+    
+    with ExitStack() as files:
+        # Everything opened here is closed on the way out: pdfplumber does
+        # not close a file object it was handed
+        def fallback(page_no: int, reason: str) -> dict:
+            nonlocal fallback_reader
+            started = time.perf_counter()
+            try:
+                if fallback_reader is None:
+                    fallback_reader = PyPDF2.PdfReader(files.enter_context(open_source(source)))
+                text = fallback_reader.pages[page_no].extract_text() or ""
+                return {"page": page_no, "text": text, "engine": "pypdf2", "error": None,
+                        "seconds": time.perf_counter() - started}
+            except Exception as e:
+                return {"page": page_no, "text": "", "engine": None,
+                        "error": f"pdfplumber: {reason}; PyPDF2: {e}",
+                        "seconds": time.perf_counter() - started}
+        
+        try:
+            pdf = files.enter_context(pdfplumber.open(files.enter_context(open_source(source))))
+        except Exception as e:
+            print(f"pdfplumber failed to open PDF, using PyPDF2 for pages {start}-{end - 1}: {e}")
+            return [fallback(page_no, str(e)) for page_no in range(start, end)]
+        
+        for page_no in range(start, min(end, len(pdf.pages))):
+            started = time.perf_counter()
+            try:
+                text = pdf.pages[page_no].extract_text() or ""
+                pages.append({"page": page_no, "text": text, "engine": "pdfplumber", "error": None,
+                              "seconds": time.perf_counter() - started})
+            except Exception as e:
+                pages.append(fallback(page_no, str(e)))
+            # Cached layout objects grow with every page; drop them as we go
+            pdf.pages[page_no].flush_cache()
+        return pages
+
+
+def iter_pdf_pages(source: Source, executor: Optional[Executor] = None,
+                   report: Optional[dict] = None) -> Iterator[dict]:
+    """
+    Yield page dicts (see extract_pdf_pages) for every page, in page order.
+    
+    With a (process) executor, the page range is split into shards of
+    PDF_SHARD_PAGES pages extracted in parallel; at most
+    PDF_SHARDS_IN_FLIGHT shards are outstanding at a time, so a huge PDF
+    never has all of its text in memory at once. Pass a source path rather
+    than bytes to avoid copying the document to every worker.
+    
+    If report is given, it is filled with page timings once all pages
+    have been yielded.
+    
+    Raises:
+        ValueError: If no page could be read by either engine
+    """
+    started = time.perf_counter()
     try:
-        # Try pdfplumber first (better for tables and layout)
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
+        page_count = pdf_page_count(source)
     except Exception as e:
-        print(f"pdfplumber failed, trying PyPDF2: {e}")
+        raise ValueError(f"Failed to parse PDF: {e}")
+    
+    shards = [(s, min(s + PDF_SHARD_PAGES, page_count)) for s in range(0, page_count, PDF_SHARD_PAGES)]
+    parallel = executor is not None and len(shards) > 1
+    
+    def shard_results() -> Iterator[list[dict]]:
+        if not parallel:
+            for s, e in shards:
+                yield extract_pdf_pages(source, s, e)
+            return
+        pending = deque()
+        remaining = iter(shards)
         try:
-            # Fallback to PyPDF2
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-        except Exception as e2:
-            print(f"PyPDF2 also failed: {e2}")
-            raise ValueError(f"Failed to parse PDF: {e2}")
+            for s, e in remaining:
+                pending.append(executor.submit(extract_pdf_pages, source, s, e))
+                if len(pending) >= PDF_SHARDS_IN_FLIGHT:
+                    break
+            while pending:
+                pages = pending.popleft().result()
+                for s, e in remaining:
+                    pending.append(executor.submit(extract_pdf_pages, source, s, e))
+                    break
+                yield pages
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    seen = 0
+    fallback_pages, failed_pages, timings = [], [], []
+    first_error = None
+    for shard in shard_results():
+        for page in shard:
+            seen += 1
+            timings.append((page["seconds"], page["page"]))
+            if page["engine"] == "pypdf2":
+                fallback_pages.append(page["page"])
+            elif page["engine"] is None:
+                failed_pages.append(page["page"])
+                first_error = first_error or page["error"]
+            yield page
     
-    return "\n\n".join(text_parts)
+    if seen and len(failed_pages) == seen:
+        raise ValueError(f"Failed to parse PDF: {first_error}")
+    
+    page_seconds = [t for t, _ in timings]
+    stats = {
+        "pages": page_count,
+        "shards": len(shards),
+        "parallel": parallel,
+        "wall_seconds": time.perf_counter() - started,
+        "page_seconds_total": sum(page_seconds),
+        "page_seconds_max": max(page_seconds, default=0.0),
+        "slowest_pages": [{"page": p, "seconds": t} for t, p in sorted(timings, reverse=True)[:5]],
+        "fallback_pages": fallback_pages,
+        "failed_pages": failed_pages,
+    }
+    print(
+        f"Parsed {page_count} PDF pages in {stats['wall_seconds']:.2f}s "
+        f"({stats['page_seconds_total']:.2f}s of page work, {len(shards)} shards, "
+        f"{len(fallback_pages)} PyPDF2 fallbacks, {len(failed_pages)} failed)"
+    )
+    if report is not None:
+        report.update(stats)
 
 
-def parse_docx(file_bytes: bytes) -> str:
-    """Extract text from DOCX file."""
+def parse_pdf_pages(source: Source, executor: Optional[Executor] = None) -> tuple[list[str], dict]:
+    """
+    Extract text from every page of a PDF, optionally sharded across an executor.
+    
+    Returns:
+        (page texts in page order, timing report)
+    
+    Raises:
+        ValueError: If no page could be read by either engine
+    """
+    report = {}
+    texts = [page["text"] for page in iter_pdf_pages(source, executor, report)]
+    return texts, report
+
+
+def iter_pdf_text(source: Source, executor: Optional[Executor] = None) -> Iterator[str]:
+    """Stream PDF text page by page (pieces of parse_pdf's output)."""
+    pages = (page["text"] for page in iter_pdf_pages(source, executor))
+    return _joined((t for t in pages if t), "\n\n")
+
+
+def parse_pdf(source: Source, executor: Optional[Executor] = None) -> str:
+    """Extract text from PDF using pdfplumber, with per-page PyPDF2 fallback."""
+    return "".join(iter_pdf_text(source, executor))
+
+
+def iter_docx_text(source: Source) -> Iterator[str]:
+    """Stream DOCX text paragraph by paragraph, then table row by table row."""
+    from docx import Document
+
     try:
-        doc = Document(io.BytesIO(file_bytes))
-        text_parts = []
-        
+        with open_source(source) as f:
+            doc = Document(f)
+    except Exception as e:
+        raise ValueError(f"Failed to parse DOCX: {e}")
+    
+    def parts() -> Iterator[str]:
         for paragraph in doc.paragraphs:
             if paragraph.text.strip():
-                text_parts.append(paragraph.text)
+                yield paragraph.text
         
         # Also extract text from tables
         for table in doc.tables:
@@ -82,30 +269,64 @@ def parse_docx(file_bytes: bytes) -> str:
                     if cell.text.strip():
                         row_text.append(cell.text.strip())
                 if row_text:
-                    text_parts.append(" | ".join(row_text))
-        
-        return "\n\n".join(text_parts)
-    except Exception as e:
-        raise ValueError(f"Failed to parse DOCX: {e}")
+                    yield " | ".join(row_text)
+    
+    return _joined(parts(), "\n\n")
 
 
-def parse_txt(file_bytes: bytes) -> str:
-    """Extract text from plain text file."""
+def parse_docx(source: Source) -> str:
+    """Extract text from DOCX file."""
+    return "".join(iter_docx_text(source))
+
+
+def _is_utf8(source: Source) -> bool:
+    """Check a source decodes as UTF-8 without holding it all in memory."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
     try:
-        # Try UTF-8 first
-        return file_bytes.decode('utf-8')
+        with open_source(source) as f:
+            while True:
+                block = f.read(TEXT_READ_BLOCK)
+                if not block:
+                    decoder.decode(b"", final=True)
+                    return True
+                decoder.decode(block)
     except UnicodeDecodeError:
-        try:
-            # Fallback to latin-1
-            return file_bytes.decode('latin-1')
-        except Exception as e:
-            raise ValueError(f"Failed to decode text file: {e}")
+        return False
+
+
+def iter_txt_text(source: Source) -> Iterator[str]:
+    """Stream a plain text file in decoded blocks."""
+    # Try UTF-8 first, fallback to latin-1 (which can decode any byte string)
+    encoding = "utf-8" if _is_utf8(source) else "latin-1"
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open_source(source) as f:
+        while True:
+            block = f.read(TEXT_READ_BLOCK)
+            if not block:
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+                return
+            text = decoder.decode(block)
+            if text:
+                yield text
+
 
+def parse_txt(source: Source) -> str:
+    """Extract text from plain text file."""
+    try:
+        return "".join(iter_txt_text(source))
+    except Exception as e:
+        raise ValueError(f"Failed to decode text file: {e}")
 
-def parse_markdown(file_bytes: bytes) -> str:
+
+def parse_markdown(source: Source) -> str:
     """Convert Markdown to plain text."""
+    import markdown
+
     try:
-        md_text = file_bytes.decode('utf-8')
+        with open_source(source) as f:
+            md_text = f.read().decode('utf-8')
         # Convert to HTML then strip tags
         html = markdown.markdown(md_text)
         plain_text = strip_html_tags(html)
@@ -114,18 +335,82 @@ def parse_markdown(file_bytes: bytes) -> str:
         raise ValueError(f"Failed to parse Markdown: {e}")
 
 
+def iter_markdown_text(source: Source) -> Iterator[str]:
+    # Markdown has to be rendered as a whole document
+    yield parse_markdown(source)
+
+
 def get_file_extension(filename: str) -> str:
     """Get lowercase file extension."""
     return Path(filename).suffix.lower()
 
 
-def parse_file(filename: str, file_bytes: bytes) -> str:
+STREAM_PARSERS = {
+    '.pdf': iter_pdf_text,
+    '.docx': iter_docx_text,
+    '.doc': iter_docx_text,  # Try docx parser for .doc too
+    '.txt': iter_txt_text,
+    '.md': iter_markdown_text,
+    '.markdown': iter_markdown_text,
+}
+
+
+def _stripped(pieces: Iterable[str]) -> Iterator[str]:
+    """Streamed equivalent of "".join(pieces).strip()."""
+    started = False
+    held = ""  # trailing whitespace, only released if more text follows
+    for piece in pieces:
+        if not started:
+            piece = piece.lstrip()
+            if not piece:
+                continue
+            started = True
+        body = piece.rstrip()
+        if body:
+            if held:
+                yield held
+            yield body
+            held = piece[len(body):]
+        else:
+            held += piece
+
+
+def iter_text(filename: str, source: Source, executor: Optional[Executor] = None) -> Iterator[str]:
+    """
+    Stream the text of a file as pieces, based on extension.
+    
+    "".join(iter_text(...)) equals parse_file(...), but only a page,
+    paragraph or block is held at a time. executor is used to shard PDF
+    pages (see iter_pdf_pages).
+    
+    Raises:
+        ValueError: If file type is unsupported or parsing fails (possibly
+        part way through iteration)
+    """
+    ext = get_file_extension(filename)
+    parser = STREAM_PARSERS.get(ext)
+    if not parser:
+        raise ValueError(f"Unsupported file type: {ext}. Supported: {', '.join(STREAM_PARSERS.keys())}")
+    
+    try:
+        pieces = parser(source, executor) if ext == '.pdf' else parser(source)
+        empty = True
+        for piece in _stripped(pieces):
+            empty = False
+            yield piece
+        if empty:
+            raise ValueError(f"No text content extracted from {filename}")
+    except Exception as e:
+        raise ValueError(f"Error parsing {filename}: {e}")
+
+
+def parse_file(filename: str, file_bytes: Source) -> str:
     """
     Parse file based on extension.
     
     Args:
         filename: Name of the file
-        file_bytes: Raw file bytes
+        file_bytes: Raw file bytes, or a path to the file
         
     Returns:
         Extracted text content
@@ -133,25 +418,4 @@ def parse_file(filename: str, file_bytes: bytes) -> str:
     Raises:
         ValueError: If file type is unsupported or parsing fails
     """
-    ext = get_file_extension(filename)
-    
-    parsers = {
-        '.pdf': parse_pdf,
-        '.docx': parse_docx,
-        '.doc': parse_docx,  # Try docx parser for .doc too
-        '.txt': parse_txt,
-        '.md': parse_markdown,
-        '.markdown': parse_markdown,
-    }
-    
-    parser = parsers.get(ext)
-    if not parser:
-        raise ValueError(f"Unsupported file type: {ext}. Supported: {', '.join(parsers.keys())}")
-    
-    try:
-        text = parser(file_bytes)
-        if not text or not text.strip():
-            raise ValueError(f"No text content extracted from {filename}")
-        return text.strip()
-    except Exception as e:
-        raise ValueError(f"Error parsing {filename}: {e}")
+    return "".join(iter_text(filename, file_bytes))
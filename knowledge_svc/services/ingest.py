@@ -0,0 +1,529 @@
+"""
+Ingestion pipeline shared by the upload routes and the background job workers.
+
+parse → chunk → embed → store, with every blocking stage dispatched to the
+matching pool in services.executors so the event loop stays free.
+
+Documents are streamed from a file on disk: the parser yields text piece
+by piece, the chunker turns that stream into chunks, and chunks are
+embedded and stored INGEST_BATCH_CHUNKS at a time. Peak memory per
+document is therefore bounded by the batch size, not the document size.
+
+Chunk IDs are deterministic (vectordb.chunk_id), so re-ingesting a file
+only embeds and writes chunks whose text is new, renumbers chunks that
+moved, and removes the rows of chunks that no longer exist. The new
+chunks are staged on disk until the whole document is embedded, then
+committed together with the renumbering and pruning in one transaction,
+so readers never see a mix of two versions and a failed ingestion leaves
+the stored version as it was.
+
+Callers can pass an async progress(stage, **counts) callback to follow a
+document through the stages (used for job status).
+"""
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Iterator, Optional
+
+import numpy as np
+
+from . import chunker, embedder, executors, file_parser, metrics, uploads, vectordb
+
+# Rows per insert request; keeps PostgREST payloads bounded for large documents
+STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", "200"))
+# Chunks pulled from a document stream per embed/store round
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))
+# flock()ed files that serialize ingestions of the same document across workers
+INGEST_LOCK_DIR = os.getenv("INGEST_LOCK_DIR", "data/ingest_locks")
+_LOCK_STRIPES = 256
+_LOCK_POLL_SECONDS = 0.05
+_DIGEST_BLOCK_SIZE = 1024 * 1024
+
+Progress = Optional[Callable[..., Awaitable[None]]]
+
+
+async def _report(progress: Progress, stage: str, **counts) -> None:
+    if progress is not None:
+        await progress(stage, **counts)
+
+
+class _TimedIterator:
+    """Wraps an iterator and adds up the time spent waiting on next()."""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def close(self) -> None:
+        if hasattr(self._iterator, "close"):
+            self._iterator.close()
+
+
+def chunk_to_file(filename: str, path: str, out_path: str) -> tuple[int, float, float]:
+    """
+    Parse and chunk a document, writing chunks to out_path as JSON lines.
+
+    Runs inside the parse process pool; handing chunks back through a file
+    keeps a large document out of both processes' memory.
+
+    Returns:
+        (chunks written, seconds spent parsing, seconds spent chunking)
+    """
+    count = 0
+    started = time.perf_counter()
+    pieces = _TimedIterator(file_parser.iter_text(filename, path))
+    with open(out_path, "w", encoding="utf-8") as out:
+        for chunk in chunker.iter_chunks(pieces):
+            out.write(json.dumps(chunk))
+            out.write("\n")
+            count += 1
+    return count, pieces.seconds, time.perf_counter() - started - pieces.seconds
+
+
+def file_digest(path: str) -> tuple[int, str]:
+    """(size in bytes, SHA-256 hex digest) of a file, read in blocks."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while block := f.read(_DIGEST_BLOCK_SIZE):
+            digest.update(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+def _read_chunk_file(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _next_batch(chunks: Iterator[str], size: int) -> list[str]:
+    return list(itertools.islice(chunks, size))
+
+
+class ChunkStream:
+    """
+    Chunks of one document, pulled in batches without blocking the event loop.
+
+    PDFs are parsed with their pages sharded across the parse pool and
+    chunked as the pages arrive; other formats are parsed and chunked by
+    one parse worker into a temporary JSON-lines file that is then read
+    back batch by batch.
+
+    Time spent parsing and chunking is recorded as the "parse" and "chunk"
+    metric stages; for PDFs, "parse" is the time spent waiting for pages.
+    """
+
+    def __init__(self, filename: str, path: str):
+        self.filename = filename
+        self.path = path
+        self._chunks: Optional[Iterator[str]] = None
+        self._chunk_file: Optional[str] = None
+        self._pieces: Optional[_TimedIterator] = None
+
+    async def open(self) -> None:
+        metrics.count_bytes_parsed(os.path.getsize(self.path))
+        if file_parser.get_file_extension(self.filename) == ".pdf":
+            self._pieces = _TimedIterator(
+                file_parser.iter_text(self.filename, self.path, executors.get_pool("parse"))
+            )
+            self._chunks = chunker.iter_chunks(self._pieces)
+        else:
+            self._chunk_file = self.path + ".chunks"
+            _, parse_seconds, chunk_seconds = await executors.run_parse(
+                chunk_to_file, self.filename, self.path, self._chunk_file
+            )
+            metrics.record_stage("parse", parse_seconds)
+            metrics.record_stage("chunk", chunk_seconds)
+            self._chunks = _read_chunk_file(self._chunk_file)
+
+    async def next_batch(self, size: int = INGEST_BATCH_CHUNKS) -> list[str]:
+        """Next batch of chunks; an empty list once the document is exhausted."""
+        if self._pieces is None:
+            return await executors.run_io(_next_batch, self._chunks, size)
+        parsed = self._pieces.seconds
+        started = time.perf_counter()
+        batch = await executors.run_io(_next_batch, self._chunks, size)
+        parse_seconds = self._pieces.seconds - parsed
+        metrics.record_stage("parse", parse_seconds)
+        metrics.record_stage("chunk", max(time.perf_counter() - started - parse_seconds, 0.0))
+        return batch
+
+    def close(self) -> None:
+        if self._chunks is not None and hasattr(self._chunks, "close"):
+            self._chunks.close()
+        if self._pieces is not None:
+            self._pieces.close()
+        if self._chunk_file and os.path.exists(self._chunk_file):
+            os.remove(self._chunk_file)
+
+
+def _lock_stripe(tenant_id: str, filename: str) -> int:
+    digest = hashlib.sha256(f"{tenant_id}\0{filename}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % _LOCK_STRIPES
+
+
+async def _acquire_lock_file(path: str) -> int:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # flock has no async wait; a non-blocking attempt per poll keeps the
+        # event loop free and lets a cancelled ingestion stop waiting
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                await asyncio.sleep(_LOCK_POLL_SECONDS)
+    except BaseException:
+        os.close(fd)
+        raise
+
+
+@contextlib.asynccontextmanager
+async def document_lock(tenant_id: str, *filenames: str):
+    """
+    Hold the ingestion lock of one or more of a tenant's documents.
+
+    Two ingestions of the same file would diff against the same stored rows
+    and commit conflicting changes, so they run one at a time, also across
+    the worker processes of a host: each (tenant, file) maps to one of
+    _LOCK_STRIPES lock files in INGEST_LOCK_DIR. Several documents' stripes
+    are taken in a fixed order, so batches can't deadlock each other.
+    Ingestions on different hosts are not serialized.
+    """
+    stripes = sorted({_lock_stripe(tenant_id, filename) for filename in filenames})
+    os.makedirs(INGEST_LOCK_DIR, exist_ok=True)
+    fds = []
+    try:
+        for stripe in stripes:
+            fds.append(await _acquire_lock_file(os.path.join(INGEST_LOCK_DIR, f"{stripe:03d}.lock")))
+        yield
+    finally:
+        # Closing the descriptor releases its flock
+        for fd in fds:
+            os.close(fd)
+
+
+class StagedChunks:
+    """
+    Embedded chunks of a document held back until all of it is embedded.
+
+    Batches are pickled to a spool file as they come out of the embedder,
+    so memory stays bounded by the batch size; DocumentSync.finish() reads
+    them back as store rows and commits them in one transaction.
+    """
+
+    def __init__(self, tenant_id: str, filename: str, file_type: str, upload_timestamp: str):
+        self.tenant_id = tenant_id
+        self.filename = filename
+        self.file_type = file_type
+        self.upload_timestamp = upload_timestamp
+        self.path = uploads.new_spool_path(".staged")
+        self.count = 0
+
+    async def add(self, chunks: list[str], embeddings: np.ndarray, chunk_indexes: list[int]) -> None:
+        await executors.run_io(self._write, (chunks, np.asarray(embeddings, dtype=np.float32), chunk_indexes))
+        self.count += len(chunks)
+
+    def _write(self, batch: tuple) -> None:
+        with open(self.path, "ab") as f:
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def rows(self) -> Iterator[list[dict]]:
+        """Store rows in STORE_BATCH_SIZE batches. Blocking; iterate in the io pool."""
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    chunks, embeddings, chunk_indexes = pickle.load(f)
+                except EOFError:
+                    return
+                for start in range(0, len(chunks), STORE_BATCH_SIZE):
+                    end = start + STORE_BATCH_SIZE
+                    yield vectordb.chunk_rows(
+                        self.tenant_id, chunks[start:end], embeddings[start:end], self.filename,
+                        self.file_type, self.upload_timestamp, chunk_indexes[start:end],
+                    )
+
+    def discard(self) -> None:
+        uploads.discard(self.path)
+
+
+class DocumentSync:
+    """
+    Diffs a document being ingested against what is already stored for it.
+
+    load() fetches the stored chunks' IDs, positions and content hashes
+    once. new_chunks() then classifies each batch of the new version:
+
+    - unchanged: same text at the same position, nothing to do
+    - moved: text already stored at another position; the row is renumbered
+      in place, no embedding needed
+    - new: text not stored yet; returned for embedding and staging
+
+    finish() stores the staged new chunks, applies the moves and deletes
+    chunks that the new version no longer has, in one transaction
+    (vectordb.reindex_document_chunks).
+    """
+
+    def __init__(self, tenant_id: str, filename: str):
+        self.tenant_id = tenant_id
+        self.filename = filename
+        self._stored: set[str] = set()
+        self._unclaimed: dict[str, list[str]] = {}  # content hash -> stored IDs
+        self._kept: set[str] = set()
+        self._moves: dict[str, tuple[str, int]] = {}  # old ID -> (new ID, new position)
+        self.total = 0
+        self.unchanged = 0
+        self.embedded = 0
+        self.deleted = 0
+
+    async def load(self) -> None:
+        rows = await executors.run_io(vectordb.stored_chunks, self.tenant_id, self.filename)
+        # Hand out the earliest positions first: they are the least likely
+        # to be needed as exact matches further down the document
+        for row in sorted(rows, key=lambda r: r["chunk_index"] or 0, reverse=True):
+            self._stored.add(row["id"])
+            if row.get("content_hash"):
+                self._unclaimed.setdefault(row["content_hash"], []).append(row["id"])
+
+    def _claim(self, content_hash: str, chunk_id: str) -> None:
+        ids = self._unclaimed.get(content_hash)
+        if ids and chunk_id in ids:
+            ids.remove(chunk_id)
+
+    def new_chunks(self, chunks: list[str], start_index: int) -> tuple[list[str], list[int]]:
+        """The chunks of a batch that need embedding and storing, and their positions."""
+        new, indexes = [], []
+        for i, chunk in enumerate(chunks, start=start_index):
+            self.total += 1
+            content_hash = vectordb.content_hash(chunk)
+            chunk_id = vectordb.chunk_id(self.tenant_id, self.filename, i, chunk)
+
+            if chunk_id in self._stored:
+                self.unchanged += 1
+                self._kept.add(chunk_id)
+                if chunk_id in self._moves:
+                    # An earlier position borrowed this row; give it back and
+                    # store a fresh copy (same text) at the earlier position
+                    _, position = self._moves.pop(chunk_id)
+                    new.append(chunk)
+                    indexes.append(position)
+                else:
+                    self._claim(content_hash, chunk_id)
+            elif self._unclaimed.get(content_hash):
+                old_id = self._unclaimed[content_hash].pop()
+                self._moves[old_id] = (chunk_id, i)
+            else:
+                new.append(chunk)
+                indexes.append(i)
+        self.embedded += len(new)
+        return new, indexes
+
+    @property
+    def moved(self) -> int:
+        return len(self._moves)
+
+    async def finish(self, staged: Optional[StagedChunks] = None) -> int:
+        """
+        Store the staged chunks, apply moves and delete vanished chunks, all
+        in one transaction. Returns the number deleted.
+        """
+        moves = [
+            {"old_id": old_id, "new_id": new_id, "chunk_index": position}
+            for old_id, (new_id, position) in self._moves.items()
+        ]
+        delete_ids = list(self._stored - self._kept - self._moves.keys())
+        rows = staged.rows() if staged is not None and staged.count else ()
+        if moves or delete_ids or rows:
+            with metrics.span("store"):
+                self.deleted = await executors.run_io(
+                    vectordb.reindex_document_chunks, self.tenant_id, self.filename, moves, delete_ids, rows
+                )
+        if rows:
+            metrics.count_chunks("stored", staged.count)
+        return self.deleted
+
+    def stats(self) -> dict:
+        return {
+            "chunks_total": self.total,
+            "chunks_unchanged": self.unchanged,
+            "chunks_moved": self.moved,
+            "chunks_embedded": self.embedded,
+            "chunks_deleted": self.deleted,
+        }
+
+
+async def embed_chunks(chunks: list[str], progress: Progress = None, offset: int = 0) -> np.ndarray:
+    """
+    Embed chunks in the embed pool, one batch per task.
+
+    Submitting batch by batch lets several concurrent ingestions share the
+    pool instead of the first large document holding it until it finishes.
+    offset is only used for progress counts.
+    """
+    if not chunks:
+        return await executors.run_embed(embedder.embed_documents, [])
+    step = embedder.EMBED_BATCH_SIZE
+    parts = []
+    for start in range(0, len(chunks), step):
+        with metrics.span("embed"):
+            parts.append(await executors.run_embed(embedder.embed_documents, chunks[start:start + step]))
+        metrics.count_chunks("embedded", len(parts[-1]))
+        await _report(progress, "embedding", chunks_embedded=offset + min(start + step, len(chunks)))
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+async def ingest_chunks(
+    tenant_id: str,
+    chunks: list[str],
+    source_file: str = "upload",
+    file_type: str = ".txt",
+    upload_timestamp: Optional[str] = None,
+    progress: Progress = None,
+) -> int:
+    """Embed and store already-chunked text. Returns the number of chunks."""
+    await _report(progress, "embedding", chunks_total=len(chunks), chunks_embedded=0)
+    embeddings = await embed_chunks(chunks, progress)
+    print(f"Generated {len(embeddings)} embeddings")
+
+    await store_chunks(tenant_id, chunks, embeddings, source_file, file_type, upload_timestamp, progress)
+    # Raw-text uploads can share a source name, so count what is stored under it
+    chunk_count = await executors.run_io(vectordb.count_chunks, tenant_id, source_file)
+    await executors.run_io(vectordb.record_file, tenant_id, source_file, file_type, chunk_count,
+                           timestamp=upload_timestamp)
+    return len(chunks)
+
+
+async def store_chunks(
+    tenant_id: str,
+    chunks: list[str],
+    embeddings: np.ndarray,
+    source_file: str = "upload",
+    file_type: str = ".txt",
+    upload_timestamp: Optional[str] = None,
+    progress: Progress = None,
+    start_index: int = 0,
+    chunk_indexes: Optional[list[int]] = None,
+    progress_offset: Optional[int] = None,
+) -> None:
+    """
+    Write embedded chunks to the vector DB in STORE_BATCH_SIZE batches.
+
+    chunk_indexes gives each chunk's position when the chunks are not a
+    contiguous run starting at start_index (e.g. only the changed ones).
+    """
+    upload_timestamp = upload_timestamp or datetime.utcnow().isoformat()
+    if chunk_indexes is None:
+        chunk_indexes = list(range(start_index, start_index + len(chunks)))
+    if progress_offset is None:
+        progress_offset = start_index
+    await _report(progress, "storing", chunks_stored=progress_offset)
+    for start in range(0, len(chunks), STORE_BATCH_SIZE):
+        end = start + STORE_BATCH_SIZE
+        with metrics.span("store"):
+            await executors.run_io(
+                vectordb.upsert_chunks,
+                tenant_id=tenant_id,
+                chunks=chunks[start:end],
+                embeddings=embeddings[start:end],
+                source_file=source_file,
+                file_type=file_type,
+                upload_timestamp=upload_timestamp,
+                chunk_indexes=chunk_indexes[start:end],
+            )
+        metrics.count_chunks("stored", len(chunks[start:end]))
+        await _report(progress, "storing", chunks_stored=progress_offset + min(end, len(chunks)))
+
+
+async def update_file(tenant_id: str, filename: str, path: str, progress: Progress = None) -> dict:
+    """
+    Bring the stored chunks of a file in line with a new version on disk.
+
+    The file is streamed in batches and diffed chunk by chunk against what
+    is stored (see DocumentSync): only chunks with new text are embedded,
+    unchanged text that moved is renumbered in place, and chunks the new
+    version no longer has are deleted. The embedded chunks are staged and
+    written together with the renumbering and deletes in one transaction,
+    so if anything fails the stored version is left as it was. For a file
+    that is not stored yet this is a plain ingestion. The file's manifest
+    entry is written last. Ingestions of the same file are serialized
+    (see document_lock).
+
+    Returns:
+        DocumentSync.stats(): how many chunks were unchanged, moved,
+        embedded and deleted
+
+    Raises:
+        ValueError: If the file type is unsupported or parsing fails
+    """
+    file_type = file_parser.get_file_extension(filename)
+    upload_timestamp = datetime.utcnow().isoformat()
+
+    await _report(progress, "parsing")
+    async with document_lock(tenant_id, filename):
+        sync = DocumentSync(tenant_id, filename)
+        await sync.load()
+        stream = ChunkStream(filename, path)
+        staged = StagedChunks(tenant_id, filename, file_type, upload_timestamp)
+        total = 0
+        try:
+            await stream.open()
+            while True:
+                batch = await stream.next_batch()
+                if not batch:
+                    break
+                new, indexes = sync.new_chunks(batch, total)
+                await _report(progress, "embedding", chunks_total=total + len(batch))
+                if new:
+                    embeddings = await embed_chunks(new, progress, offset=total)
+                    await staged.add(new, embeddings, indexes)
+                total += len(batch)
+
+            await _report(progress, "storing", chunks_stored=0)
+            await sync.finish(staged)
+            await _report(progress, "storing", chunks_stored=total)
+        finally:
+            stream.close()
+            staged.discard()
+
+        byte_size, digest = await executors.run_io(file_digest, path)
+        await executors.run_io(vectordb.record_file, tenant_id, filename, file_type, total,
+                               byte_size, digest, upload_timestamp)
+    stats = sync.stats()
+    print(f"Stored {total} chunks from {filename} ({stats['chunks_unchanged']} unchanged, "
+          f"{stats['chunks_moved']} moved, {stats['chunks_embedded']} embedded, "
+          f"{stats['chunks_deleted']} deleted)")
+    return stats
+
+
+async def ingest_file(tenant_id: str, filename: str, path: str, progress: Progress = None) -> int:
+    """
+    Run the full pipeline for one file on disk, streaming it in batches.
+
+    Re-ingesting a stored file only does the work update_file() needs.
+
+    Returns:
+        Number of chunks stored
+
+    Raises:
+        ValueError: If the file type is unsupported or parsing fails
+    """
+    stats = await update_file(tenant_id, filename, path, progress)
+    return stats["chunks_total"]
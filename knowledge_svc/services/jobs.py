@@ -0,0 +1,419 @@
+"""
+Durable background ingestion jobs.
+
+Submitting a document stores a job row in SQLite (plus the spooled upload
+in JOBS_SPOOL_DIR) and returns immediately. JOB_WORKERS asyncio workers
+claim jobs and run the ingestion pipeline, recording stage and progress
+as they go. Jobs left "running" by a crashed or restarted process are put
+back in the queue on startup (under gunicorn, once by the master before
+the workers start; see gunicorn.conf.py), unless they have already been
+tried JOB_MAX_ATTEMPTS times: a document that crashes the process fails
+instead of crashing it again on every restart.
+
+Fairness: a worker always claims from the tenant with the fewest running
+jobs, breaking ties by whichever tenant was served least recently, so one
+tenant's bulk import is interleaved with everyone else's uploads instead
+of running ahead of them.
+
+A claimed job waits for a slot in the admission batch lane before it runs
+(see services/admission.py), so queued ingestion shares the same
+concurrency limits as synchronous uploads.
+"""
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from . import admission, executors, ingest, metrics, uploads
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite")
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", "data/job_uploads")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# Off when several processes share JOBS_DB_PATH: a restarting one would
+# requeue jobs its siblings are still running
+JOBS_REQUEUE_ON_START = os.getenv("JOBS_REQUEUE_ON_START", "true").lower() == "true"
+
+_store = None
+_pool = None
+
+_COLUMNS = (
+    "id, tenant_id, kind, filename, payload, status, stage, chunks_total, "
+    "chunks_embedded, chunks_stored, error, result, attempts, created_at, "
+    "started_at, finished_at, updated_at"
+)
+
+
+class JobStore:
+    """SQLite-backed job queue; safe to share across threads and processes."""
+
+    def __init__(self, path: str = JOBS_DB_PATH, spool_dir: str = JOBS_SPOOL_DIR):
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                tenant_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                chunks_total INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                chunks_stored INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, tenant_id, created_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tenant_turns (tenant_id TEXT PRIMARY KEY, last_claimed_at REAL NOT NULL)"
+        )
+
+    def submit(self, tenant_id: str, kind: str, filename: str, payload: dict,
+               upload_path: Optional[str] = None) -> dict:
+        """
+        Queue a job. A spooled upload is moved into the job spool directory
+        so the job survives restarts.
+        """
+        job_id = str(uuid.uuid4())
+        payload = dict(payload)
+        if upload_path is not None:
+            path = os.path.join(self.spool_dir, job_id)
+            shutil.move(upload_path, path)
+            payload["path"] = path
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """
+                INSERT INTO jobs (id, tenant_id, kind, filename, payload, status, stage, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 'queued', 'queued', ?, ?)
+                """,
+                (job_id, tenant_id, kind, filename, json.dumps(payload), now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_dict(row) if row else None
+
+    def payload(self, job_id: str) -> dict:
+        """Full job payload, including the spooled upload path."""
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["payload"])
+
+    def list_for_tenant(self, tenant_id: str, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE tenant_id = ? ORDER BY created_at DESC LIMIT ?",
+                (tenant_id, limit),
+            ).fetchall()
+        return [_to_dict(r) for r in rows]
+
+    def claim_next(self) -> Optional[dict]:
+        """Atomically move the fairest queued job to running and return it."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    """
+                    SELECT q.tenant_id
+                    FROM (SELECT DISTINCT tenant_id FROM jobs WHERE status = 'queued') q
+                    LEFT JOIN (
+                        SELECT tenant_id, COUNT(*) AS running FROM jobs
+                        WHERE status = 'running' GROUP BY tenant_id
+                    ) r ON r.tenant_id = q.tenant_id
+                    LEFT JOIN tenant_turns t ON t.tenant_id = q.tenant_id
+                    ORDER BY COALESCE(r.running, 0), COALESCE(t.last_claimed_at, 0)
+                    LIMIT 1
+                    """
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+
+                tenant_id = row["tenant_id"]
+                job = self._db.execute(
+                    """
+                    SELECT id FROM jobs WHERE status = 'queued' AND tenant_id = ?
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (tenant_id,),
+                ).fetchone()
+                now = time.time()
+                self._db.execute(
+                    """
+                    UPDATE jobs SET status = 'running', stage = 'starting', attempts = attempts + 1,
+                        started_at = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now, now, job["id"]),
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tenant_turns (tenant_id, last_claimed_at) VALUES (?, ?)",
+                    (tenant_id, now),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(job["id"])
+
+    def update_progress(self, job_id: str, stage: str, **counts) -> None:
+        fields = ["stage = ?", "updated_at = ?"]
+        values = [stage, time.time()]
+        for name in ("chunks_total", "chunks_embedded", "chunks_stored"):
+            if name in counts:
+                fields.append(f"{name} = ?")
+                values.append(counts[name])
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {', '.join(fields)} WHERE id = ?", (*values, job_id))
+
+    def finish(self, job_id: str, result: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = 'succeeded', stage = 'done', result = ?, error = NULL,
+                    finished_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (json.dumps(result), now, now, job_id),
+            )
+        self._discard_upload(job_id)
+
+    def fail(self, job_id: str, error: str, retry: bool = False) -> None:
+        """Record an error; retryable failures go back to the queue."""
+        now = time.time()
+        status = "queued" if retry else "failed"
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, error = ?, updated_at = ?,
+                    finished_at = CASE WHEN ? = 'failed' THEN ? ELSE NULL END
+                WHERE id = ?
+                """,
+                (status, error, now, status, now, job_id),
+            )
+        if not retry:
+            self._discard_upload(job_id)
+
+    def release(self, job_id: str) -> None:
+        """Put a job interrupted by a clean shutdown back in the queue, refunding its attempt."""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = 'queued', stage = 'queued', attempts = MAX(attempts - 1, 0),
+                    updated_at = ?
+                WHERE id = ? AND status = 'running'
+                """,
+                (time.time(), job_id),
+            )
+
+    def requeue_running(self, max_attempts: int = JOB_MAX_ATTEMPTS) -> tuple[int, list[str]]:
+        """
+        Put jobs interrupted by a crash or restart back in the queue.
+
+        The interrupted run already counted as an attempt when it was
+        claimed; jobs that have used up max_attempts are failed instead, so
+        a document that kills the process is not retried forever. Returns
+        the number requeued and the ids of the jobs failed.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                failed = [
+                    row["id"] for row in self._db.execute(
+                        "SELECT id FROM jobs WHERE status = 'running' AND attempts >= ?", (max_attempts,)
+                    ).fetchall()
+                ]
+                self._db.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', finished_at = ?, updated_at = ?,
+                        error = 'Interrupted ' || attempts || ' times (the process exited while running it)'
+                    WHERE status = 'running' AND attempts >= ?
+                    """,
+                    (now, now, max_attempts),
+                )
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = 'queued', stage = 'queued', updated_at = ? WHERE status = 'running'",
+                    (now,),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        for job_id in failed:
+            self._discard_upload(job_id)
+        return cursor.rowcount, failed
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _discard_upload(self, job_id: str) -> None:
+        path = os.path.join(self.spool_dir, job_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _to_dict(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["payload"].pop("path", None)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def get_job_store() -> JobStore:
+    """Get or create the job store singleton."""
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+
+async def run_job(store: JobStore, job: dict) -> dict:
+    """Run the ingestion pipeline for one claimed job."""
+    job_id = job["id"]
+
+    async def progress(stage: str, **counts) -> None:
+        await executors.run_io(store.update_progress, job_id, stage, **counts)
+
+    payload = await executors.run_io(store.payload, job_id)
+
+    if job["kind"] == "file":
+        chunks_created = await ingest.ingest_file(job["tenant_id"], job["filename"], payload["path"], progress=progress)
+    elif job["kind"] == "s3":
+        from . import s3_client
+        await progress("downloading")
+        path = uploads.new_spool_path(os.path.splitext(job["filename"])[1])
+        try:
+            await executors.run_io(
+                s3_client.download_to_file, payload["s3_bucket"], payload["s3_key"], path, uploads.MAX_UPLOAD_BYTES
+            )
+            chunks_created = await ingest.ingest_file(job["tenant_id"], job["filename"], path, progress=progress)
+        finally:
+            uploads.discard(path)
+    else:
+        raise ValueError(f"Unknown job kind: {job['kind']}")
+
+    return {"chunks_created": chunks_created}
+
+
+class JobWorkerPool:
+    """Background asyncio workers that drain the job store."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if JOBS_REQUEUE_ON_START:
+            requeue_interrupted(self.store)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers after a submit."""
+        self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            job = await executors.run_io(self.store.claim_next)
+            if job is None:
+                # Other processes may share the database, so poll as well
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            print(f"Job {job['id']}: {job['kind']} {job['filename']} for tenant {job['tenant_id']}")
+            try:
+                with metrics.background(f"job:{job['kind']}", job["tenant_id"]):
+                    ticket = await admission.wait_for_slot(admission.BATCH, job["tenant_id"])
+                    try:
+                        result = await run_job(self.store, job)
+                    finally:
+                        ticket.release()
+            except asyncio.CancelledError:
+                # Shutting down: back in the queue without using up an attempt
+                self.store.release(job["id"])
+                raise
+            except ValueError as e:
+                # Unsupported or unparseable documents won't succeed on retry
+                await executors.run_io(self.store.fail, job["id"], str(e))
+            except Exception as e:
+                print(f"Job {job['id']} failed: {e}")
+                retry = job["attempts"] < JOB_MAX_ATTEMPTS
+                await executors.run_io(self.store.fail, job["id"], str(e), retry)
+            else:
+                await executors.run_io(self.store.finish, job["id"], result)
+
+
+def requeue_interrupted(store: JobStore) -> int:
+    """Put jobs left running by a previous process back in the queue."""
+    requeued, failed = store.requeue_running()
+    if requeued:
+        print(f"Requeued {requeued} interrupted ingestion jobs")
+    for job_id in failed:
+        print(f"⚠ Job {job_id} failed: interrupted {JOB_MAX_ATTEMPTS} times")
+    return requeued
+
+
+async def start_workers() -> None:
+    global _pool
+    if _pool is None and JOB_WORKERS > 0:
+        _pool = JobWorkerPool(get_job_store())
+        _pool.start()
+
+
+async def stop_workers() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.stop()
+        _pool = None
+
+
+async def submit(tenant_id: str, kind: str, filename: str, payload: dict,
+                 upload_path: Optional[str] = None) -> dict:
+    """Queue a job and wake the local workers."""
+    job = await executors.run_io(get_job_store().submit, tenant_id, kind, filename, payload, upload_path)
+    if _pool is not None:
+        _pool.notify()
+    return job
@@ -1,41 +1,291 @@
+"""
+Async LLM client for answer generation.
+
+One AsyncOpenAI client per process, so completions share its keep-alive
+connection pool, with at most LLM_MAX_CONCURRENCY requests in flight.
+Every call has one deadline (LLM_DEADLINE_SECONDS) covering all of its
+attempts:
+
+- 429s, 5xx responses, timeouts and connection errors are retried up to
+  LLM_MAX_RETRIES times with full-jitter exponential backoff, or after
+  Retry-After when the server sends one
+- with LLM_HEDGE=true, a completion still running after the p95 latency of
+  recent completions gets a second, identical request; the first to
+  succeed wins and the other is cancelled. Hedges are only sent when a
+  concurrency slot is free, so they never queue ahead of real traffic.
+
+OPENAI_BASE_URL points the client at any OpenAI-compatible server, such as
+a local stub during load tests.
+"""
+import asyncio
 import os
-from openai import OpenAI
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from . import metrics
+from .metrics import Histogram
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+# Completions observed before hedging kicks in, and the floor for the hedge delay
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1"))
+# Recent completion latencies kept for the p95
+LLM_LATENCY_WINDOW = 200
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for a RAG (Retrieval-Augmented Generation) system. "
+    "Your task is to answer the user's question strictly based on the provided context. "
+    "If the answer is not in the context, say 'I don't know' or 'The provided context does not contain this information'. "
+    "Do not hallucinate or use outside knowledge."
+)
+
+# Prefix of the answer returned when the completion call fails
+ERROR_PREFIX = "Error generating answer: "
 
-# Initialize OpenAI client
-# Assumes OPENAI_API_KEY is set in environment variables
 _client = None
 
-def get_openai_client() -> OpenAI:
-    global _client
-    if _client is None:
+
+def _retryable(error: Exception) -> bool:
+    """429s, 5xx responses, timeouts and connection failures are worth retrying."""
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """
+    Shared AsyncOpenAI client with a concurrency cap, retries, a deadline
+    and optional hedging. Bound to the event loop it was created on.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge: bool = LLM_HEDGE,
+    ):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             print("Warning: OPENAI_API_KEY not set. LLM calls will fail.")
-        _client = OpenAI(api_key=api_key)
+            if base_url:
+                # OpenAI-compatible local servers usually ignore the key
+                api_key = "unused"
+        # openai is imported on first use: it is the slowest import in the service
+        from openai import AsyncOpenAI
+
+        # Retries are ours (with jitter and the overall deadline), not the SDK's
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=deadline)
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self._latencies: deque = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.latency_ms = Histogram([100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000])
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.in_flight = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging: p95 of recent completions, or None if hedging is off."""
+        if not self.hedge or len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return max(p95, LLM_HEDGE_MIN_DELAY_SECONDS)
+
+    async def _create(self, **kwargs):
+        """One request, holding a concurrency slot."""
+        async with self.semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+            finally:
+                self.in_flight -= 1
+            elapsed = time.perf_counter() - started
+            self._latencies.append(elapsed)
+            self.latency_ms.observe(elapsed * 1000)
+            return response
+
+    async def _hedged(self, **kwargs):
+        """
+        One attempt, plus a second identical request if the first is still
+        running after hedge_delay() and a concurrency slot is free.
+        First success wins; the other request is cancelled.
+        """
+        tasks = [asyncio.ensure_future(self._create(**kwargs))]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not self.semaphore.locked():
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(self._create(**kwargs)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _with_retries(self, attempt_fn):
+        """Run attempt_fn() until it succeeds, retrying transient errors within the deadline."""
+        self.requests += 1
+        deadline = self.loop.time() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await asyncio.wait_for(attempt_fn(), max(deadline - self.loop.time(), 0))
+            except asyncio.TimeoutError:
+                self.failures += 1
+                raise TimeoutError(f"no response from the LLM within {self.deadline:g}s")
+            except Exception as e:
+                delay = _retry_after(e)
+                if delay is None:
+                    # Full jitter: spreads retries from concurrent requests apart
+                    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+                if not _retryable(e) or attempt >= self.max_retries or self.loop.time() + delay >= deadline:
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                print(f"LLM request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def complete(self, messages: list[dict]) -> str:
+        response = await self._with_retries(lambda: self._hedged(
+            model=MODEL,
+            messages=messages,
+            temperature=0.0, # Low temperature for factual answers
+        ))
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.count_tokens(usage.prompt_tokens, usage.completion_tokens)
+        return response.choices[0].message.content
+
+    @asynccontextmanager
+    async def stream(self, messages: list[dict]):
+        """
+        Streamed completion, closed (aborting the upstream request) on exit.
+
+        Retries and the deadline cover opening the stream, i.e. up to the
+        response headers; streams are not hedged.
+        """
+        # The slot is held until the stream is closed, not just while it opens
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                stream = await self._with_retries(lambda: self.client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=0.0,
+                    stream=True,
+                    # Sent as a raw body field so older openai clients accept it too
+                    extra_body={"stream_options": {"include_usage": True}},
+                ))
+                try:
+                    yield stream
+                finally:
+                    await stream.close()
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "hedge_delay_s": self.hedge_delay(),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+
+def get_llm_client() -> LLMClient:
+    """Get or create the LLM client for the running event loop."""
+    global _client
+    if _client is None or _client.loop is not asyncio.get_running_loop():
+        _client = LLMClient()
     return _client
 
-def generate_answer(query: str, context: str) -> str:
-    client = get_openai_client()
-    
-    system_prompt = (
-        "You are a helpful assistant for a RAG (Retrieval-Augmented Generation) system. "
-        "Your task is to answer the user's question strictly based on the provided context. "
-        "If the answer is not in the context, say 'I don't know' or 'The provided context does not contain this information'. "
-        "Do not hallucinate or use outside knowledge."
-    )
-    
+
+def build_messages(query: str, context: str) -> list[dict]:
     user_message = f"Context:\n{context}\n\nQuestion: {query}"
-    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message}
+    ]
+
+
+async def generate_answer(query: str, context: str) -> str:
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Or gpt-4o if available
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.0, # Low temperature for factual answers
-        )
-        return response.choices[0].message.content
+        return await get_llm_client().complete(build_messages(query, context))
     except Exception as e:
         print(f"Error calling LLM: {e}")
-        return f"Error generating answer: {str(e)}"
+        return f"{ERROR_PREFIX}{str(e)}"
+
+
+def answer_stream(query: str, context: str):
+    """
+    async with answer_stream(query, context) as stream: iterate the stream
+    for chunks whose choices[0].delta.content holds the next tokens; the
+    last chunk carries usage and no choices.
+    """
+    return get_llm_client().stream(build_messages(query, context))
+
+
+def stats() -> dict:
+    if _client is None:
+        return {"requests": 0}
+    return _client.stats()
+
+
+async def close() -> None:
+    """Close the shared client's connections."""
+    global _client
+    if _client is not None:
+        await _client.client.close()
+        _client = None
@@ -0,0 +1,439 @@
+"""
+In-process vector store: one float32 matrix per tenant, persisted to disk.
+
+Selected with VECTOR_STORE=local. Search is an exact dot product over the
+tenant's (L2-normalized) vectors, which for small tenants takes well under
+a millisecond and needs no network round trip. Tenants with at least
+LOCAL_HNSW_MIN_ROWS chunks switch to an approximate HNSW index when the
+optional hnswlib package is installed.
+
+Persistence: each tenant has a directory under LOCAL_STORE_PATH holding a
+snapshot (snapshot.npz) and an append-only log of the writes since that
+snapshot (log.<generation>.jsonl). The file manifest is kept alongside the
+rows in both. Every write is appended to the log;
+once the log outgrows the snapshot it is folded into a new snapshot. The
+store assumes a single process owns LOCAL_STORE_PATH.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .vectordb import VectorStore, group_files
+
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", "data/vector_store")
+LOCAL_HNSW = os.getenv("LOCAL_HNSW", "true").lower() == "true"
+LOCAL_HNSW_MIN_ROWS = int(os.getenv("LOCAL_HNSW_MIN_ROWS", "20000"))
+LOCAL_HNSW_M = int(os.getenv("LOCAL_HNSW_M", "16"))
+LOCAL_HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_HNSW_EF_CONSTRUCTION", "200"))
+LOCAL_HNSW_EF_SEARCH = int(os.getenv("LOCAL_HNSW_EF_SEARCH", "64"))
+# Fold the log into a new snapshot once it holds this many rows more than the snapshot
+LOCAL_LOG_MAX_ROWS = int(os.getenv("LOCAL_LOG_MAX_ROWS", "10000"))
+# Let gunicorn start several workers on one local store anyway. Only safe
+# when nothing writes to it while they run (bench/multi_worker.py)
+LOCAL_STORE_MULTI_WORKER = os.getenv("LOCAL_STORE_MULTI_WORKER", "false").lower() == "true"
+
+# Row metadata kept alongside each vector
+META_FIELDS = ("id", "text", "content_hash", "chunk_index", "source_file", "file_type", "upload_timestamp")
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def _encode_vectors(vectors: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vectors(data: str, dim: int) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dim)
+
+
+_hnswlib = None
+
+
+def _hnswlib_available() -> bool:
+    global _hnswlib
+    if _hnswlib is None:
+        try:
+            import hnswlib  # noqa: F401
+            _hnswlib = True
+        except ImportError:
+            print("hnswlib not installed; local store uses exact search only")
+            _hnswlib = False
+    return _hnswlib
+
+
+class TenantIndex:
+    """
+    One tenant's vectors and row metadata.
+
+    Rows live in slots of a growable matrix; deleted slots are tombstoned
+    and reclaimed by compact(). Slots double as HNSW labels. files holds
+    the manifest entries, keyed by source_file.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self.files: Dict[str, Dict] = {}
+        self.vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.rows: List[Optional[Dict]] = []
+        self.slot_by_id: Dict[str, int] = {}
+        self.hnsw = None
+
+    def __len__(self) -> int:
+        return len(self.slot_by_id)
+
+    @property
+    def dead(self) -> int:
+        return len(self.rows) - len(self.slot_by_id)
+
+    def _reserve(self, extra: int) -> None:
+        needed = len(self.rows) + extra
+        if needed <= len(self.vectors):
+            return
+        capacity = max(needed, 2 * len(self.vectors), 256)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self.rows)] = self.vectors[:len(self.rows)]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.rows)] = self.alive[:len(self.rows)]
+        self.vectors, self.alive = vectors, alive
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def add(self, rows: List[Dict], vectors: np.ndarray) -> int:
+        """Add rows (vectors already normalized), skipping existing ids. Returns rows added."""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match stored dimension {self.dim}")
+
+        keep = []
+        seen = set()
+        for i, row in enumerate(rows):
+            if row["id"] not in self.slot_by_id and row["id"] not in seen:
+                seen.add(row["id"])
+                keep.append(i)
+        if not keep:
+            return 0
+
+        self._reserve(len(keep))
+        start = len(self.rows)
+        slots = np.arange(start, start + len(keep))
+        self.vectors[slots] = vectors[keep]
+        self.alive[slots] = True
+        for slot, i in zip(slots, keep):
+            self.rows.append({field: rows[i].get(field) for field in META_FIELDS})
+            self.slot_by_id[rows[i]["id"]] = int(slot)
+        if self.hnsw is not None:
+            self.hnsw.add_items(self.vectors[slots], slots)
+        return len(keep)
+
+    def remove(self, ids) -> int:
+        removed = 0
+        for row_id in ids:
+            slot = self.slot_by_id.pop(row_id, None)
+            if slot is None:
+                continue
+            self.alive[slot] = False
+            self.rows[slot] = None
+            if self.hnsw is not None:
+                self.hnsw.mark_deleted(slot)
+            removed += 1
+        return removed
+
+    def move(self, moves: List[Dict]) -> None:
+        """Re-key rows in place; vectors (and HNSW labels) stay where they are."""
+        slots = [(self.slot_by_id.pop(m["old_id"], None), m) for m in moves]
+        for slot, m in slots:
+            if slot is None:
+                continue
+            self.rows[slot]["id"] = m["new_id"]
+            self.rows[slot]["chunk_index"] = m["chunk_index"]
+            self.slot_by_id[m["new_id"]] = slot
+
+    def live_rows(self):
+        return (row for row in self.rows if row is not None)
+
+    def compact(self) -> None:
+        """Drop tombstoned slots (invalidates the HNSW index)."""
+        slots = np.flatnonzero(self.alive[:len(self.rows)])
+        self.vectors = self.vectors[slots].copy()
+        self.alive = np.ones(len(slots), dtype=bool)
+        self.rows = [self.rows[s] for s in slots]
+        self.slot_by_id = {row["id"]: i for i, row in enumerate(self.rows)}
+        self.hnsw = None
+
+    def _build_hnsw(self) -> None:
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=max(len(self.vectors), 1), ef_construction=LOCAL_HNSW_EF_CONSTRUCTION, M=LOCAL_HNSW_M)
+        slots = np.flatnonzero(self.alive[:len(self.rows)])
+        index.add_items(self.vectors[slots], slots)
+        self.hnsw = index
+        print(f"Built HNSW index over {len(slots)} vectors")
+
+    def _use_hnsw(self) -> bool:
+        if not LOCAL_HNSW or len(self) < LOCAL_HNSW_MIN_ROWS or not _hnswlib_available():
+            return False
+        if self.hnsw is None:
+            self._build_hnsw()
+        return True
+
+    def search(self, query: np.ndarray, limit: int) -> List[tuple]:
+        """(slot, similarity) pairs, best first."""
+        k = min(limit, len(self))
+        if k <= 0:
+            return []
+        if self._use_hnsw():
+            self.hnsw.set_ef(max(LOCAL_HNSW_EF_SEARCH, k))
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            # "ip" space distance is 1 - dot product
+            return [(int(s), float(1.0 - d)) for s, d in zip(labels[0], distances[0])]
+
+        n = len(self.rows)
+        scores = self.vectors[:n] @ query
+        if self.dead:
+            scores[~self.alive[:n]] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top], kind="stable")][:k]
+        return [(int(s), float(scores[s])) for s in top]
+
+    def snapshot_arrays(self):
+        slots = np.flatnonzero(self.alive[:len(self.rows)])
+        rows = [self.rows[s] for s in slots]
+        return self.vectors[slots], rows
+
+
+class LocalStore(VectorStore):
+    """VectorStore backed by per-tenant TenantIndex objects persisted on local disk."""
+
+    name = "local"
+
+    def __init__(self, path: str = LOCAL_STORE_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._tenants: Dict[str, TenantIndex] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._generations: Dict[str, int] = {}
+        self._log_rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # --- persistence -------------------------------------------------
+
+    def _dir(self, tenant_id: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()[:32])
+
+    def _log_path(self, tenant_id: str) -> str:
+        return os.path.join(self._dir(tenant_id), f"log.{self._generations[tenant_id]}.jsonl")
+
+    def _load(self, tenant_id: str) -> TenantIndex:
+        directory = self._dir(tenant_id)
+        index = TenantIndex()
+        generation = 0
+        snapshot = os.path.join(directory, "snapshot.npz")
+        if os.path.exists(snapshot):
+            with np.load(snapshot, allow_pickle=False) as data:
+                generation = int(data["generation"])
+                rows = json.loads(data["rows"].tobytes().decode("utf-8"))
+                if rows:
+                    index.add(rows, data["vectors"])
+                if "files" in data.files:
+                    index.files = json.loads(data["files"].tobytes().decode("utf-8"))
+        self._generations[tenant_id] = generation
+
+        log_rows = 0
+        log_path = self._log_path(tenant_id)
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final line from a crash mid-write
+                        break
+                    log_rows += self._apply(index, op)
+        self._log_rows[tenant_id] = log_rows
+
+        # Backfill documents stored before the manifest existed (or whose
+        # entry was lost to a crash between storing and recording them)
+        missing = [row for row in index.live_rows() if row["source_file"] not in index.files]
+        for entry in group_files(missing):
+            index.files[entry["source_file"]] = entry
+
+        # Logs from older generations are leftovers of an interrupted compaction
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith("log.") and name != os.path.basename(log_path):
+                    os.remove(os.path.join(directory, name))
+        return index
+
+    def _apply(self, index: TenantIndex, op: Dict) -> int:
+        kind = op["op"]
+        if kind == "upsert":
+            vectors = _decode_vectors(op["vectors"], op["dim"])
+            index.add(op["rows"], vectors)
+            return len(op["rows"])
+        if kind == "delete":
+            index.remove(op["ids"])
+            if "source_file" in op:
+                index.files.pop(op["source_file"], None)
+        elif kind == "reindex":
+            index.remove(op["ids"])
+            index.move(op["moves"])
+            if op.get("rows"):
+                index.add(op["rows"], _decode_vectors(op["vectors"], op["dim"]))
+                return len(op["rows"])
+        elif kind == "clear":
+            index.remove(list(index.slot_by_id))
+            index.files.clear()
+        elif kind == "file":
+            index.files[op["entry"]["source_file"]] = op["entry"]
+        return 1
+
+    def _append(self, tenant_id: str, op: Dict) -> None:
+        os.makedirs(self._dir(tenant_id), exist_ok=True)
+        with open(self._log_path(tenant_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(op))
+            f.write("\n")
+        self._log_rows[tenant_id] += len(op["rows"]) if op.get("rows") else 1
+
+    def _maybe_compact(self, tenant_id: str, index: TenantIndex) -> None:
+        if index.dead > max(1000, len(index)):
+            index.compact()
+        if self._log_rows[tenant_id] > max(LOCAL_LOG_MAX_ROWS, len(index)):
+            self._write_snapshot(tenant_id, index)
+
+    def _write_snapshot(self, tenant_id: str, index: TenantIndex) -> None:
+        directory = self._dir(tenant_id)
+        old_log = self._log_path(tenant_id)
+        generation = self._generations[tenant_id] + 1
+        vectors, rows = index.snapshot_arrays()
+
+        tmp = os.path.join(directory, "snapshot.tmp.npz")
+        np.savez(
+            tmp,
+            vectors=vectors,
+            rows=np.frombuffer(json.dumps(rows).encode("utf-8"), dtype=np.uint8),
+            files=np.frombuffer(json.dumps(index.files).encode("utf-8"), dtype=np.uint8),
+            generation=np.array(generation),
+        )
+        os.replace(tmp, os.path.join(directory, "snapshot.npz"))
+
+        self._generations[tenant_id] = generation
+        self._log_rows[tenant_id] = 0
+        if os.path.exists(old_log):
+            os.remove(old_log)
+
+    def _tenant(self, tenant_id: str):
+        """(index, lock) for a tenant, loading it from disk on first use."""
+        with self._lock:
+            lock = self._locks.setdefault(tenant_id, threading.RLock())
+        with lock:
+            if tenant_id not in self._tenants:
+                self._tenants[tenant_id] = self._load(tenant_id)
+            return self._tenants[tenant_id], lock
+
+    # --- VectorStore -------------------------------------------------
+
+    def ensure(self) -> None:
+        print(f"✓ Local vector store at {self.path}")
+
+    def upsert(self, tenant_id: str, rows: List[Dict]) -> int:
+        if not rows:
+            return 0
+        vectors = _normalized(np.asarray([row["vector"] for row in rows], dtype=np.float32))
+        meta = [{field: row.get(field) for field in META_FIELDS} for row in rows]
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            index.add(meta, vectors)
+            self._append(tenant_id, {
+                "op": "upsert", "rows": meta, "dim": vectors.shape[1], "vectors": _encode_vectors(vectors)
+            })
+            self._maybe_compact(tenant_id, index)
+        return len(rows)
+
+    def search(self, tenant_id: str, query_vector: List[float], limit: int) -> List[Dict]:
+        query = _normalized(np.asarray([query_vector], dtype=np.float32))[0]
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            if index.dim is None:
+                return []
+            return [dict(index.rows[slot], similarity=score) for slot, score in index.search(query, limit)]
+
+    def list_files(self, tenant_id: str) -> List[Dict]:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            return [dict(index.files[name]) for name in sorted(index.files)]
+
+    def record_file(self, tenant_id: str, entry: Dict) -> None:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            previous = index.files.get(entry["source_file"])
+            entry = dict(entry, created_at=previous["created_at"] if previous else entry.get("updated_at"))
+            index.files[entry["source_file"]] = entry
+            self._append(tenant_id, {"op": "file", "entry": entry})
+            self._maybe_compact(tenant_id, index)
+
+    def stored_chunks(self, tenant_id: str, source_file: str) -> List[Dict]:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            return [
+                {"id": row["id"], "chunk_index": row["chunk_index"], "content_hash": row["content_hash"]}
+                for row in index.live_rows() if row["source_file"] == source_file
+            ]
+
+    def reindex_document_chunks(self, tenant_id: str, source_file: str, moves: List[Dict],
+                                delete_ids: List[str], rows: Iterable[List[Dict]] = ()) -> int:
+        rows = [row for batch in rows for row in batch]
+        op = {"op": "reindex", "ids": list(delete_ids), "moves": moves}
+        if rows:
+            vectors = _normalized(np.asarray([row["vector"] for row in rows], dtype=np.float32))
+            meta = [{field: row.get(field) for field in META_FIELDS} for row in rows]
+            op.update(rows=meta, dim=vectors.shape[1], vectors=_encode_vectors(vectors))
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            if rows and index.dim is not None and vectors.shape[1] != index.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match stored dimension {index.dim}")
+            deleted = index.remove(delete_ids)
+            index.move(moves)
+            if rows:
+                index.add(meta, vectors)
+            # One log line, so a crash can't leave half of the change applied
+            self._append(tenant_id, op)
+            self._maybe_compact(tenant_id, index)
+        return deleted
+
+    def delete_document(self, tenant_id: str, source_file: str) -> int:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            ids = [row["id"] for row in index.live_rows() if row["source_file"] == source_file]
+            deleted = index.remove(ids)
+            index.files.pop(source_file, None)
+            self._append(tenant_id, {"op": "delete", "ids": ids, "source_file": source_file})
+            self._maybe_compact(tenant_id, index)
+        return deleted
+
+    def delete_all_documents(self, tenant_id: str) -> int:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            deleted = index.remove(list(index.slot_by_id))
+            index.files.clear()
+            self._append(tenant_id, {"op": "clear"})
+            self._maybe_compact(tenant_id, index)
+        return deleted
+
+    def count(self, tenant_id: str, source_file: Optional[str] = None) -> int:
+        index, lock = self._tenant(tenant_id)
+        with lock:
+            if source_file is None:
+                return len(index)
+            return sum(1 for row in index.live_rows() if row["source_file"] == source_file)
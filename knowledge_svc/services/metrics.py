@@ -0,0 +1,332 @@
+"""
+Small in-process metric primitives and the Prometheus /metrics registry.
+
+Kept dependency-free so any service module can record timings without
+pulling in a metrics client.
+
+Request-scoped labels: MetricsMiddleware gives every HTTP request a
+RequestMetrics context (route template, tenant tier, Server-Timing spans)
+in a contextvar. span() and the counters below read their route/tier
+labels from it, so call sites only name the stage. Work outside a request
+(background jobs) runs under background(), or is labelled
+route="background".
+
+Tenant tiers come from TENANT_TIERS ("tenant_a=enterprise,tenant_b=pro");
+other tenants are TENANT_TIER_DEFAULT. Tiers rather than tenant IDs keep
+label cardinality bounded.
+"""
+import bisect
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+TENANT_TIER_DEFAULT = os.getenv("TENANT_TIER_DEFAULT", "standard")
+TENANT_TIERS = dict(
+    item.split("=", 1) for item in os.getenv("TENANT_TIERS", "").replace(" ", "").split(",") if "=" in item
+)
+
+# Stage durations from ~1 ms (cache lookups) up to a minute (large parses)
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (same semantics as a Prometheus histogram)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        """Cumulative bucket counts keyed by upper bound, plus sum and count."""
+        with self._lock:
+            cumulative = {}
+            running = 0
+            for bound, count in zip(self.buckets, self._counts):
+                running += count
+                cumulative[str(bound)] = running
+            cumulative["+Inf"] = running + self._counts[-1]
+            return {
+                "buckets": cumulative,
+                "sum": self._sum,
+                "count": self._count,
+                "mean": self._sum / self._count if self._count else 0.0,
+            }
+
+
+class Counter:
+    """Monotonic counter family keyed by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class HistogramFamily:
+    """Histogram family keyed by label values (one Histogram per label set)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = list(buckets)
+        self._children: Dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, Histogram(self.buckets))
+        child.observe(value)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        for key, child in items:
+            labels = dict(zip(self.labelnames, key))
+            snapshot = child.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                yield f"{self.name}_bucket", dict(labels, le=bound), count
+            yield f"{self.name}_sum", labels, snapshot["sum"]
+            yield f"{self.name}_count", labels, snapshot["count"]
+
+
+_families: list = []
+# Callables returning (name, kind, help, labels, value) tuples at scrape time
+_collectors: list[Callable[[], Iterable[Tuple[str, str, str, Dict, float]]]] = []
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    family = Counter(name, help, labelnames)
+    _families.append(family)
+    return family
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS) -> HistogramFamily:
+    family = HistogramFamily(name, help, labelnames, buckets)
+    _families.append(family)
+    return family
+
+
+def register_collector(collect: Callable[[], Iterable[Tuple[str, str, str, Dict, float]]]) -> None:
+    """Add a scrape-time source of samples (e.g. cache stats kept elsewhere)."""
+    _collectors.append(collect)
+
+
+REQUESTS = counter("rag_requests_total", "HTTP requests", ("route", "method", "status", "tier"))
+REQUEST_SECONDS = histogram("rag_request_duration_seconds", "HTTP request duration until the last body byte",
+                            ("route", "tier"))
+STAGE_SECONDS = histogram("rag_stage_duration_seconds", "Time spent per pipeline stage", ("stage", "route", "tier"))
+CHUNKS = counter("rag_chunks_total", "Chunks processed, by stage (embedded, stored)", ("stage", "route", "tier"))
+BYTES_PARSED = counter("rag_bytes_parsed_total", "Bytes of documents parsed", ("route", "tier"))
+CACHE_LOOKUPS = counter("rag_cache_lookups_total", "Answer cache lookups, by cache (query, semantic) and result",
+                        ("cache", "result", "route", "tier"))
+LLM_TOKENS = counter("rag_llm_tokens_total", "LLM tokens, by direction (prompt, completion)", ("direction", "route", "tier"))
+
+
+def tenant_tier(tenant_id: Optional[str]) -> str:
+    return TENANT_TIERS.get(tenant_id or "", TENANT_TIER_DEFAULT)
+
+
+class RequestMetrics:
+    """Labels and Server-Timing spans of one request (or background task)."""
+
+    def __init__(self, scope: Optional[dict] = None, route: Optional[str] = None, tier: str = TENANT_TIER_DEFAULT):
+        self.scope = scope
+        self._route = route
+        self.tier = tier
+        self.timings: list[tuple[str, float]] = []
+
+    @property
+    def route(self) -> str:
+        if self._route is None and self.scope is not None:
+            route = self.scope.get("route")
+            return getattr(route, "path", None) or "unmatched"
+        return self._route or "background"
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("request_metrics", default=None)
+
+
+def _labels() -> Dict[str, str]:
+    current = _current.get()
+    if current is None:
+        return {"route": "background", "tier": TENANT_TIER_DEFAULT}
+    return {"route": current.route, "tier": current.tier}
+
+
+def set_tenant(tenant_id: str) -> None:
+    """Label the current request's metrics with the tenant's tier."""
+    current = _current.get()
+    if current is not None:
+        current.tier = tenant_tier(tenant_id)
+
+
+@contextmanager
+def background(route: str, tenant_id: Optional[str] = None):
+    """Metrics context for work outside an HTTP request (e.g. a job)."""
+    token = _current.set(RequestMetrics(route=route, tier=tenant_tier(tenant_id)))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record time spent in a stage (histogram + Server-Timing)."""
+    STAGE_SECONDS.observe(seconds, stage=stage, **_labels())
+    current = _current.get()
+    if current is not None:
+        current.timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one stage: with metrics.span("search"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def count_chunks(stage: str, count: int) -> None:
+    CHUNKS.inc(count, stage=stage, **_labels())
+
+
+def count_bytes_parsed(count: int) -> None:
+    BYTES_PARSED.inc(count, **_labels())
+
+
+def count_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss", **_labels())
+
+
+def count_tokens(prompt: int, completion: int) -> None:
+    labels = _labels()
+    LLM_TOKENS.inc(prompt or 0, direction="prompt", **labels)
+    LLM_TOKENS.inc(completion or 0, direction="completion", **labels)
+
+
+def server_timing(timings: list[tuple[str, float]]) -> str:
+    """Server-Timing header value; repeated stages are summed."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request counters and durations, the per-request
+    metrics context, and a Server-Timing header listing the spans that
+    finished before the response started (for streamed responses, the
+    spans before the first byte).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = RequestMetrics(scope=scope)
+        token = _current.set(context)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if SERVER_TIMING and context.timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(context.timings).encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route, tier = context.route, context.tier
+            REQUESTS.inc(route=route, method=scope["method"], status=status["code"], tier=tier)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, tier=tier)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value is None:
+        return "NaN"
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if not value.is_integer() else str(int(value))
+
+
+def _line(name: str, labels: Dict, value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render() -> str:
+    """Every family and collector in the Prometheus text exposition format."""
+    lines = []
+    for family in _families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        lines.extend(_line(name, labels, value) for name, labels, value in family.samples())
+
+    described = set()
+    for collect in _collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help, labels, value in samples:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(_line(name, labels, value))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,240 @@
+"""
+Direct Postgres vector store over a pooled asyncpg connection.
+
+Selected with VECTOR_STORE=postgres. It talks to the same knowledge_vectors
+schema (init_supabase.sql) as the Supabase backend, but skips supabase-py
+and PostgREST:
+
+- vectors travel in pgvector's binary format (int16 dim, int16 unused,
+  float4[dim] big-endian) instead of JSON arrays of decimal strings
+- every query is a fixed SQL string, so asyncpg's per-connection statement
+  cache prepares it once and reuses it
+- inserts go through executemany, which pipelines the rows over one
+  connection
+
+The rest of the service calls vector stores from worker threads, so the
+pool lives on its own event loop in a background thread and the
+VectorStore methods submit coroutines to it.
+"""
+import asyncio
+import json
+import os
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .vectordb import VectorStore
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+# Schema the pgvector extension was created in (Supabase uses "extensions")
+PG_VECTOR_SCHEMA = os.getenv("PG_VECTOR_SCHEMA", "public")
+
+SEARCH_SQL = """
+    SELECT id::text, text, chunk_index, source_file, file_type, upload_timestamp,
+           1 - (vector <=> $1) AS similarity
+    FROM knowledge_vectors
+    WHERE tenant_id = $2
+    ORDER BY vector <=> $1
+    LIMIT $3
+"""
+
+INSERT_SQL = """
+    INSERT INTO knowledge_vectors
+        (id, tenant_id, vector, text, content_hash, chunk_index, source_file, file_type, upload_timestamp)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    ON CONFLICT (id) DO NOTHING
+"""
+
+RECORD_FILE_SQL = """
+    INSERT INTO knowledge_files
+        (tenant_id, source_file, file_type, chunk_count, byte_size, content_hash, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (tenant_id, source_file) DO UPDATE SET
+        file_type = EXCLUDED.file_type,
+        chunk_count = EXCLUDED.chunk_count,
+        byte_size = EXCLUDED.byte_size,
+        content_hash = EXCLUDED.content_hash,
+        updated_at = EXCLUDED.updated_at
+"""
+
+_VECTOR_HEADER = struct.Struct(">HH")
+
+
+def encode_vector(vector) -> bytes:
+    """pgvector binary send format."""
+    values = np.asarray(vector, dtype=">f4")
+    return _VECTOR_HEADER.pack(len(values), 0) + values.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    dim, _ = _VECTOR_HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=_VECTOR_HEADER.size).astype(np.float32)
+
+
+async def _init_connection(conn) -> None:
+    await conn.set_type_codec(
+        "vector", schema=PG_VECTOR_SCHEMA, encoder=encode_vector, decoder=decode_vector, format="binary"
+    )
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _records(tenant_id: str, rows: List[Dict]) -> list:
+    """INSERT_SQL arguments for rows."""
+    return [
+        (
+            row["id"], tenant_id, row["vector"], row["text"], row.get("content_hash"),
+            row["chunk_index"], row["source_file"], row["file_type"], _timestamp(row.get("upload_timestamp")),
+        )
+        for row in rows
+    ]
+
+
+def _isoformat(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else (value or "")
+
+
+class PostgresStore(VectorStore):
+    """VectorStore on an asyncpg pool with binary pgvector transport."""
+
+    name = "postgres"
+
+    def __init__(self, dsn: Optional[str] = DATABASE_URL,
+                 min_size: int = PG_POOL_MIN_SIZE, max_size: int = PG_POOL_MAX_SIZE):
+        import asyncpg
+
+        if not dsn:
+            raise ValueError("DATABASE_URL must be set in environment for VECTOR_STORE=postgres")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="pg-store", daemon=True)
+        self._thread.start()
+        async def create_pool():
+            return await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, init=_init_connection)
+
+        self._pool = self._run(create_pool())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _fetch(self, sql: str, *args):
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(sql, *args)
+
+    async def _fetchval(self, sql: str, *args):
+        async with self._pool.acquire() as conn:
+            return await conn.fetchval(sql, *args)
+
+    async def _execute(self, sql: str, *args) -> str:
+        async with self._pool.acquire() as conn:
+            return await conn.execute(sql, *args)
+
+    async def _execute_all(self, statements: list) -> list:
+        """Run (sql, *args) statements in one transaction."""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                return [await conn.execute(sql, *args) for sql, *args in statements]
+
+    async def _insert(self, records: list) -> None:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(INSERT_SQL, records)
+
+    async def _reindex(self, tenant_id: str, source_file: str, moves: List[Dict],
+                       delete_ids: List[str], rows: Iterable[List[Dict]]) -> int:
+        """Moves, deletes and the new rows' inserts in one transaction."""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                deleted = await conn.fetchval(
+                    "SELECT reindex_document_chunks($1, $2, $3::jsonb, $4::uuid[])",
+                    tenant_id, source_file, json.dumps(moves), delete_ids,
+                )
+                for batch in rows:
+                    await conn.executemany(INSERT_SQL, _records(tenant_id, batch))
+        return deleted
+
+    def close(self) -> None:
+        self._run(self._pool.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def ensure(self) -> None:
+        try:
+            self._run(self._fetchval("SELECT 1 FROM knowledge_vectors LIMIT 1"))
+            print("✓ knowledge_vectors table is accessible (postgres)")
+        except Exception as e:
+            print(f"⚠ Warning: Could not access knowledge_vectors table: {e}")
+            print("Please run init_supabase.sql against DATABASE_URL")
+
+    def upsert(self, tenant_id: str, rows: List[Dict]) -> int:
+        records = _records(tenant_id, rows)
+        if records:
+            self._run(self._insert(records))
+        return len(records)
+
+    def search(self, tenant_id: str, query_vector: List[float], limit: int) -> List[Dict]:
+        rows = self._run(self._fetch(SEARCH_SQL, query_vector, tenant_id, limit))
+        return [
+            dict(row, upload_timestamp=_isoformat(row["upload_timestamp"]), similarity=float(row["similarity"]))
+            for row in rows
+        ]
+
+    def list_files(self, tenant_id: str) -> List[Dict]:
+        rows = self._run(self._fetch(
+            "SELECT source_file, file_type, chunk_count, byte_size, content_hash, created_at, updated_at "
+            "FROM knowledge_files WHERE tenant_id = $1 ORDER BY source_file",
+            tenant_id,
+        ))
+        return [
+            dict(row, created_at=_isoformat(row["created_at"]), updated_at=_isoformat(row["updated_at"]))
+            for row in rows
+        ]
+
+    def record_file(self, tenant_id: str, entry: Dict) -> None:
+        self._run(self._execute(
+            RECORD_FILE_SQL, tenant_id, entry["source_file"], entry["file_type"], entry["chunk_count"],
+            entry.get("byte_size"), entry.get("content_hash"), _timestamp(entry.get("updated_at")),
+        ))
+
+    def stored_chunks(self, tenant_id: str, source_file: str) -> List[Dict]:
+        rows = self._run(self._fetch(
+            "SELECT id::text, chunk_index, content_hash FROM knowledge_vectors "
+            "WHERE tenant_id = $1 AND source_file = $2",
+            tenant_id, source_file,
+        ))
+        return [dict(row) for row in rows]
+
+    def reindex_document_chunks(self, tenant_id: str, source_file: str, moves: List[Dict],
+                                delete_ids: List[str], rows: Iterable[List[Dict]] = ()) -> int:
+        return self._run(self._reindex(tenant_id, source_file, moves, delete_ids, rows)) or 0
+
+    def delete_document(self, tenant_id: str, source_file: str) -> int:
+        status, _ = self._run(self._execute_all([
+            ("DELETE FROM knowledge_vectors WHERE tenant_id = $1 AND source_file = $2", tenant_id, source_file),
+            ("DELETE FROM knowledge_files WHERE tenant_id = $1 AND source_file = $2", tenant_id, source_file),
+        ]))
+        return int(status.split()[-1])
+
+    def delete_all_documents(self, tenant_id: str) -> int:
+        status, _ = self._run(self._execute_all([
+            ("DELETE FROM knowledge_vectors WHERE tenant_id = $1", tenant_id),
+            ("DELETE FROM knowledge_files WHERE tenant_id = $1", tenant_id),
+        ]))
+        return int(status.split()[-1])
+
+    def count(self, tenant_id: str, source_file: Optional[str] = None) -> int:
+        if source_file is None:
+            return self._run(self._fetchval(
+                "SELECT count(*) FROM knowledge_vectors WHERE tenant_id = $1", tenant_id
+            ))
+        return self._run(self._fetchval(
+            "SELECT count(*) FROM knowledge_vectors WHERE tenant_id = $1 AND source_file = $2",
+            tenant_id, source_file,
+        ))
@@ -0,0 +1,232 @@
+"""
+Staged, overlapping ingestion for batches of files.
+
+Instead of running read → parse → chunk → embed → store for one file
+before starting the next, each stage has its own workers connected by
+bounded queues:
+
+    read/parse/chunk  →  embed  →  stage
+    (parse pool)         (embed pool)  (io pool)
+
+so file N+1 parses while file N embeds and file N-1's embedded chunks are
+staged to disk. Parsing and chunking share a stage (see ingest.ChunkStream).
+Work moves between stages in batches of INGEST_BATCH_CHUNKS chunks rather
+than whole documents, so a large file starts embedding before it has been
+fully parsed, and the bounded queues cap how many chunks are held in
+memory at once regardless of document size.
+
+A batch takes roughly as long as its slowest stage rather than the sum of
+all stages. Once every file has gone through, each file that succeeded is
+committed to the vector DB in one transaction (DocumentSync.finish), so a
+file that fails anywhere leaves its stored version untouched. A filename
+that appears twice in one batch is only ingested once.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Optional
+
+import numpy as np
+
+from . import executors, file_parser, ingest, uploads, vectordb
+
+PIPELINE_PARSE_CONCURRENCY = int(os.getenv("PIPELINE_PARSE_CONCURRENCY", "2"))
+PIPELINE_EMBED_CONCURRENCY = int(os.getenv("PIPELINE_EMBED_CONCURRENCY", "1"))
+PIPELINE_STORE_CONCURRENCY = int(os.getenv("PIPELINE_STORE_CONCURRENCY", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+
+@dataclass
+class FileTask:
+    index: int
+    filename: str
+    upload: object  # FastAPI UploadFile
+    path: Optional[str] = None
+    upload_timestamp: str = ""
+    byte_size: Optional[int] = None
+    content_hash: Optional[str] = None
+    sync: Optional[ingest.DocumentSync] = None
+    staged: Optional[ingest.StagedChunks] = None
+    chunks_created: int = 0
+    error: Optional[str] = None
+    timings: dict = field(default_factory=dict)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def result(self) -> dict:
+        timings = {stage: round(seconds, 3) for stage, seconds in self.timings.items()}
+        if self.error is not None:
+            return {"filename": self.filename, "status": "error", "error": self.error, "timings": timings}
+        return {
+            "filename": self.filename,
+            "status": "success",
+            "chunks_created": self.chunks_created,
+            "timings": timings,
+        }
+
+
+@dataclass
+class ChunkBatch:
+    task: FileTask
+    chunks: list[str]
+    chunk_indexes: list[int]
+    embeddings: Optional[np.ndarray] = None
+
+
+async def _parse_worker(tenant_id: str, inbox: asyncio.Queue, outbox: asyncio.Queue) -> None:
+    """
+    Spool each file, then feed its chunks downstream one batch at a time.
+
+    Chunks already stored for the file are counted but not sent on.
+    """
+    while True:
+        task = await inbox.get()
+        if task is None:
+            return
+        task.upload_timestamp = datetime.utcnow().isoformat()
+        stream = None
+        try:
+            started = time.perf_counter()
+            task.path = await uploads.spool_upload(task.upload)
+            task.byte_size, task.content_hash = await executors.run_io(ingest.file_digest, task.path)
+            task.add_time("read", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            task.sync = ingest.DocumentSync(tenant_id, task.filename)
+            await task.sync.load()
+            task.staged = ingest.StagedChunks(
+                tenant_id, task.filename, file_parser.get_file_extension(task.filename), task.upload_timestamp
+            )
+            stream = ingest.ChunkStream(task.filename, task.path)
+            await stream.open()
+            offset = 0
+            while True:
+                batch = await stream.next_batch()
+                task.add_time("parse", time.perf_counter() - started)
+                if not batch:
+                    break
+                new, indexes = task.sync.new_chunks(batch, offset)
+                task.chunks_created += len(batch) - len(new)
+                offset += len(batch)
+                if new:
+                    # Blocks while the embed queue is full, bounding chunks in flight
+                    await outbox.put(ChunkBatch(task, new, indexes))
+                started = time.perf_counter()
+        except Exception as e:
+            task.error = str(e)
+        finally:
+            if stream is not None:
+                stream.close()
+            uploads.discard(task.path)
+
+
+async def _embed(batch: ChunkBatch) -> None:
+    batch.embeddings = await ingest.embed_chunks(batch.chunks)
+
+
+async def _stage_batch(batch: ChunkBatch) -> None:
+    await batch.task.staged.add(batch.chunks, batch.embeddings, batch.chunk_indexes)
+    batch.task.chunks_created += len(batch.chunks)
+    # Free the batch as soon as it's on disk
+    batch.chunks = None
+    batch.embeddings = None
+
+
+async def _commit(tenant_id: str, task: FileTask) -> None:
+    """Store a file's staged chunks, renumber and prune, then record it."""
+    started = time.perf_counter()
+    await task.sync.finish(task.staged)
+    await executors.run_io(
+        vectordb.record_file, tenant_id, task.filename, file_parser.get_file_extension(task.filename),
+        task.sync.total, task.byte_size, task.content_hash, task.upload_timestamp,
+    )
+    task.add_time("store", time.perf_counter() - started)
+
+
+async def _stage_worker(name: str, fn, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]) -> None:
+    while True:
+        batch = await inbox.get()
+        if batch is None:
+            return
+        # Skip the remaining batches of a file that already failed
+        if batch.task.error is None:
+            started = time.perf_counter()
+            try:
+                await fn(batch)
+            except Exception as e:
+                batch.task.error = str(e)
+            batch.task.add_time(name, time.perf_counter() - started)
+        if outbox is not None:
+            await outbox.put(batch)
+
+
+async def _run_stage(workers: list[Awaitable], outbox: Optional[asyncio.Queue],
+                     downstream_workers: int) -> None:
+    await asyncio.gather(*workers)
+    for _ in range(downstream_workers):
+        await outbox.put(None)
+
+
+async def ingest_files(
+    tenant_id: str,
+    files: list[tuple[str, object]],
+    parse_concurrency: int = PIPELINE_PARSE_CONCURRENCY,
+    embed_concurrency: int = PIPELINE_EMBED_CONCURRENCY,
+    store_concurrency: int = PIPELINE_STORE_CONCURRENCY,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+) -> list[dict]:
+    """
+    Ingest several files with overlapping stages.
+
+    Args:
+        tenant_id: Tenant ID
+        files: (filename, UploadFile) pairs
+
+    Returns:
+        One result dict per file, in input order. A filename that already
+        appeared earlier in the batch gets an error result.
+    """
+    parse_q: asyncio.Queue = asyncio.Queue()
+    embed_q: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    store_q: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    tasks = [FileTask(index=i, filename=name, upload=upload) for i, (name, upload) in enumerate(files)]
+    # Two uploads of one name would diff against the same stored rows and
+    # delete each other's chunks; the first one wins
+    seen = set()
+    for task in tasks:
+        if task.filename in seen:
+            task.error = f"Duplicate filename in this batch: {task.filename}"
+            continue
+        seen.add(task.filename)
+        parse_q.put_nowait(task)
+    for _ in range(parse_concurrency):
+        parse_q.put_nowait(None)
+
+    started = time.perf_counter()
+    try:
+        async with ingest.document_lock(tenant_id, *seen):
+            await asyncio.gather(
+                _run_stage([_parse_worker(tenant_id, parse_q, embed_q) for _ in range(parse_concurrency)],
+                           embed_q, embed_concurrency),
+                _run_stage([_stage_worker("embed", _embed, embed_q, store_q) for _ in range(embed_concurrency)],
+                           store_q, store_concurrency),
+                _run_stage([_stage_worker("stage", _stage_batch, store_q, None) for _ in range(store_concurrency)],
+                           None, 0),
+            )
+            for task in tasks:
+                if task.error is None and task.sync is not None:
+                    try:
+                        await _commit(tenant_id, task)
+                    except Exception as e:
+                        task.error = str(e)
+    finally:
+        for task in tasks:
+            if task.staged is not None:
+                task.staged.discard()
+    print(f"Pipelined {len(tasks)} files for tenant {tenant_id} in {time.perf_counter() - started:.2f}s")
+
+    return [task.result() for task in sorted(tasks, key=lambda t: t.index)]
@@ -0,0 +1,158 @@
+"""
+Dynamic micro-batching for query embeddings.
+
+Concurrent /query requests each need one short embedding. Instead of every
+request running its own forward pass (and fighting over the same torch
+threads), requests are queued here and a single runner task embeds them
+together: it waits up to QUERY_BATCH_WINDOW_MS after the first request, or
+until QUERY_BATCH_MAX_SIZE requests are queued, then runs one batched
+encode in a worker thread and resolves each request's future.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from . import embedder, executors
+from .metrics import Histogram
+
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+QUERY_BATCH_MAX_QUEUE = int(os.getenv("QUERY_BATCH_MAX_QUEUE", "256"))
+
+_batcher = None
+
+
+class BatcherOverloaded(Exception):
+    """Raised when the query queue is full and the request should be shed."""
+
+
+class QueryBatcher:
+    def __init__(
+        self,
+        window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+        max_queue: int = QUERY_BATCH_MAX_QUEUE,
+    ):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
+        self.rejected = 0
+
+    def _ensure_started(self) -> None:
+        # The queue and runner are bound to the loop serving requests, so they
+        # are created on first use rather than at import time.
+        if self._runner is None or self._runner.done():
+            if self._runner is not None and not self._runner.cancelled() and self._runner.exception():
+                print(f"Query batcher runner died, restarting: {self._runner.exception()!r}")
+            old_queue = self._queue
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            if old_queue is not None:
+                self._hand_off(old_queue)
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    def _hand_off(self, old_queue: asyncio.Queue) -> None:
+        """Move requests still waiting in a dead runner's queue to the new one."""
+        loop = asyncio.get_running_loop()
+        while not old_queue.empty():
+            item = old_queue.get_nowait()
+            future = item[1]
+            if future.done():
+                continue
+            # A future of another (closed) event loop has nobody awaiting it
+            if future.get_loop() is loop:
+                self._queue.put_nowait(item)
+
+    async def embed_query(self, text: str) -> list[float]:
+        """Queue one query for embedding and wait for its vector."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise BatcherOverloaded(f"Query embedding queue is full ({self.max_queue} pending)")
+        return await future
+
+    async def _collect(self, batch: list) -> None:
+        batch.append(await self._queue.get())
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self) -> None:
+        batch: list = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                await self._embed(batch)
+        except BaseException as e:
+            # Cancelled or crashed: don't leave the batch in hand waiting forever
+            error = e if isinstance(e, Exception) else RuntimeError("Query batcher stopped")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            raise
+
+    async def _embed(self, batch: list) -> None:
+        # Requests whose caller already went away don't need a vector
+        batch[:] = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, enqueued in batch:
+            self.queue_wait_ms.observe((started - enqueued) * 1000)
+
+        try:
+            vectors = await executors.run_query(
+                embedder.embed_queries, [text for text, _, _ in batch]
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector.tolist())
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "rejected": self.rejected,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+def get_query_batcher() -> QueryBatcher:
+    """Get or create the query batcher singleton."""
+    global _batcher
+    if _batcher is None:
+        _batcher = QueryBatcher()
+    return _batcher
+
+
+async def embed_query(text: str) -> list[float]:
+    """Embed a search query through the shared micro-batcher."""
+    return await get_query_batcher().embed_query(text)
@@ -0,0 +1,361 @@
+"""
+Response cache for /query.
+
+Answers are keyed by (tenant_id, normalized query, retrieval parameters)
+and expire after QUERY_CACHE_TTL_SECONDS. Every tenant has a generation
+counter that each write to its vectors bumps (see vectordb). An entry
+remembers the generation it was computed at and is ignored once the
+tenant has moved past it, so a cached answer never outlives a content
+change. The generation is read when the lookup misses and passed back to
+put(), so an answer computed while an upload was landing is stored under
+the old generation and never served.
+
+Backends (QUERY_CACHE_BACKEND):
+
+- memory: in-process LRU bounded by QUERY_CACHE_MAX_MB
+- redis: any Redis-compatible server at QUERY_CACHE_REDIS_URL; eviction is
+  left to the server's maxmemory policy (run it with allkeys-lru). Use it
+  when several worker processes serve the API so they share entries and
+  generations.
+- off: no caching
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "memory").lower()
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+QUERY_CACHE_MAX_MB = float(os.getenv("QUERY_CACHE_MAX_MB", "32"))
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL", "redis://localhost:6379/0")
+QUERY_CACHE_PREFIX = os.getenv("QUERY_CACHE_PREFIX", "qcache:")
+
+# Same eviction hysteresis as the embedding cache
+_EVICT_TARGET = 0.9
+# Tenant generations the memory backend keeps before forgetting those of
+# tenants with no cached entries
+_MAX_GENERATIONS = 10000
+
+_cache = None
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query."""
+    return " ".join(query.casefold().split())
+
+
+def cache_key(tenant_id: str, query: str, params: Dict) -> str:
+    """Cache key for a query under the given retrieval parameters."""
+    payload = json.dumps([tenant_id, normalize_query(query), params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """Base class: hit/miss accounting around a backend's _get/_put."""
+
+    name = "base"
+
+    def __init__(self, ttl: int = QUERY_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _count(self, field: str) -> None:
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, tenant_id: str, key: str) -> Tuple[Optional[Dict], int]:
+        """(cached response or None, the tenant's current generation)."""
+        value, generation, stale = self._get(tenant_id, key)
+        if value is not None:
+            self._count("hits")
+        else:
+            self._count("misses")
+            if stale:
+                self._count("stale")
+        return value, generation
+
+    def put(self, tenant_id: str, key: str, generation: int, value: Dict) -> None:
+        """Cache a response computed at the given generation."""
+        self._put(tenant_id, key, generation, json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    def _get(self, tenant_id: str, key: str) -> Tuple[Optional[Dict], int, bool]:
+        return None, 0, False
+
+    def _put(self, tenant_id: str, key: str, generation: int, blob: bytes) -> None:
+        pass
+
+    def bump(self, tenant_id: str) -> None:
+        """Invalidate every cached answer of a tenant."""
+
+    def clear(self) -> None:
+        """Drop every entry."""
+
+    def usage(self) -> Dict:
+        return {}
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            counts = {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "ttl_seconds": self.ttl,
+            }
+        counts.update(self.usage())
+        return counts
+
+
+class NullQueryCache(QueryCache):
+    """QUERY_CACHE_BACKEND=off."""
+
+    name = "off"
+
+
+class MemoryQueryCache(QueryCache):
+    """
+    In-process LRU of serialized responses, bounded by total bytes.
+
+    Generations come from one counter shared by all tenants, so a number
+    is never handed out twice. That lets the generations of tenants with
+    nothing cached be forgotten once there are more than _MAX_GENERATIONS:
+    such a tenant falls back to the base generation, which is moved past
+    every number handed out so far, so an answer computed before the
+    tenant's last write still can't be stored.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = int(QUERY_CACHE_MAX_MB * 1024 * 1024), ttl: int = QUERY_CACHE_TTL_SECONDS,
+                 max_generations: int = _MAX_GENERATIONS):
+        super().__init__(ttl)
+        self.max_bytes = max_bytes
+        self.max_generations = max_generations
+        self._lock = threading.Lock()
+        # key -> (tenant_id, generation, expires_at, blob)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tenant_entries: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._base_generation = 0
+        self._clock = 0
+        self._used = 0
+        self.evictions = 0
+
+    def _generation(self, tenant_id: str) -> int:
+        return self._generations.get(tenant_id, self._base_generation)
+
+    def _drop(self, key: str) -> None:
+        tenant_id, _, _, blob = self._entries.pop(key)
+        self._used -= len(blob)
+        self._tenant_entries[tenant_id] -= 1
+        if not self._tenant_entries[tenant_id]:
+            del self._tenant_entries[tenant_id]
+
+    def _get(self, tenant_id: str, key: str) -> Tuple[Optional[Dict], int, bool]:
+        with self._lock:
+            current = self._generation(tenant_id)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, current, False
+            _, generation, expires_at, blob = entry
+            if generation != current or expires_at <= time.time():
+                self._drop(key)
+                return None, current, True
+            self._entries.move_to_end(key)
+        return json.loads(blob), current, False
+
+    def _put(self, tenant_id: str, key: str, generation: int, blob: bytes) -> None:
+        with self._lock:
+            if generation != self._generation(tenant_id) or len(blob) > self.max_bytes:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (tenant_id, generation, time.time() + self.ttl, blob)
+            self._tenant_entries[tenant_id] = self._tenant_entries.get(tenant_id, 0) + 1
+            self._used += len(blob)
+            if self._used > self.max_bytes:
+                target = self.max_bytes * _EVICT_TARGET
+                while self._entries and self._used > target:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+
+    def bump(self, tenant_id: str) -> None:
+        with self._lock:
+            self._clock += 1
+            self._generations[tenant_id] = self._clock
+            if len(self._generations) > self.max_generations:
+                self._forget_generations()
+
+    def _forget_generations(self) -> None:
+        """Drop the generations of tenants with no entries (see the class docstring)."""
+        # Entries still stored at the old base generation keep it pinned
+        for tenant_id in self._tenant_entries:
+            self._generations.setdefault(tenant_id, self._base_generation)
+        self._generations = {
+            tenant_id: generation for tenant_id, generation in self._generations.items()
+            if tenant_id in self._tenant_entries
+        }
+        self._base_generation = self._clock
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tenant_entries.clear()
+            self._used = 0
+
+    def usage(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "tenant_generations": len(self._generations),
+                "bytes": self._used,
+                "limit_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class RedisQueryCache(QueryCache):
+    """
+    Entries and generation counters in a Redis-compatible server.
+
+    A lookup is one MGET of the tenant's generation and the entry; entries
+    carry the generation they were computed at and expire via SET EX.
+    The keys of live entries are also kept in a sorted set scored by
+    expiry time, so usage() counts this cache's entries rather than every
+    key in the database (an entry evicted by maxmemory is counted until it
+    would have expired).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = QUERY_CACHE_REDIS_URL, prefix: str = QUERY_CACHE_PREFIX,
+                 ttl: int = QUERY_CACHE_TTL_SECONDS):
+        import redis
+
+        super().__init__(ttl)
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def _generation_key(self, tenant_id: str) -> str:
+        return f"{self.prefix}gen:{tenant_id}"
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}entry:{key}"
+
+    def _index_key(self) -> str:
+        return f"{self.prefix}entries"
+
+    def _get(self, tenant_id: str, key: str) -> Tuple[Optional[Dict], int, bool]:
+        generation, blob = self.client.mget([self._generation_key(tenant_id), self._entry_key(key)])
+        current = int(generation or 0)
+        if blob is None:
+            return None, current, False
+        entry = json.loads(blob)
+        if entry["generation"] != current:
+            return None, current, True
+        return entry["response"], current, False
+
+    def _put(self, tenant_id: str, key: str, generation: int, blob: bytes) -> None:
+        entry = b'{"generation":%d,"response":%s}' % (generation, blob)
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._entry_key(key), entry, ex=self.ttl)
+        # Trimmed here too, so the index stays bounded if usage() is never read
+        pipe.zremrangebyscore(self._index_key(), "-inf", now)
+        pipe.zadd(self._index_key(), {key: now + self.ttl})
+        pipe.execute()
+
+    def bump(self, tenant_id: str) -> None:
+        self.client.incr(self._generation_key(tenant_id))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=f"{self.prefix}entry:*", count=1000):
+            self.client.delete(key)
+        self.client.delete(self._index_key())
+
+    def usage(self) -> Dict:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self._index_key(), "-inf", time.time())
+        pipe.zcard(self._index_key())
+        _, entries = pipe.execute()
+        memory = self.client.info("memory")
+        return {
+            "entries": entries,
+            "bytes": memory.get("used_memory", 0),
+            "limit_bytes": memory.get("maxmemory", 0),
+            "evictions": self.client.info("stats").get("evicted_keys", 0),
+        }
+
+
+def create_query_cache(name: str = QUERY_CACHE_BACKEND) -> QueryCache:
+    """Instantiate a query cache backend by name ("memory", "redis" or "off")."""
+    if name == "memory":
+        return MemoryQueryCache()
+    if name == "redis":
+        return RedisQueryCache()
+    if name == "off":
+        return NullQueryCache()
+    raise ValueError(f"Unknown QUERY_CACHE_BACKEND: {name}")
+
+
+def get_query_cache() -> QueryCache:
+    """Get or create the query cache singleton."""
+    global _cache
+    if _cache is None:
+        _cache = create_query_cache()
+        print(f"✓ Query cache: {_cache.name}")
+    return _cache
+
+
+def disable() -> None:
+    """
+    Turn the cache off in this process (and processes forked from it).
+
+    Used by gunicorn.conf.py: a per-process backend under several workers
+    would only see the invalidations of the worker that made them.
+    """
+    global _cache
+    _cache = NullQueryCache()
+
+
+def lookup(tenant_id: str, key: str) -> Tuple[Optional[Dict], int]:
+    """
+    Cached response for a key, and the tenant's generation to pass to store().
+
+    Cache errors are logged and treated as a miss.
+    """
+    try:
+        return get_query_cache().get(tenant_id, key)
+    except Exception as e:
+        print(f"Query cache lookup failed: {e}")
+        return None, -1
+
+
+def store(tenant_id: str, key: str, generation: int, response: Dict) -> None:
+    """Cache a response computed at generation (as returned by lookup())."""
+    if generation < 0:
+        return
+    try:
+        get_query_cache().put(tenant_id, key, generation, response)
+    except Exception as e:
+        print(f"Query cache store failed: {e}")
+
+
+def invalidate(tenant_id: str) -> None:
+    """Bump a tenant's generation after its content changed."""
+    try:
+        get_query_cache().bump(tenant_id)
+    except Exception as e:
+        print(f"Query cache invalidation failed for {tenant_id}: {e}")
+
+
+def stats() -> Dict:
+    return get_query_cache().stats()
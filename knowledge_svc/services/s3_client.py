@@ -2,15 +2,17 @@
 S3 client for downloading documents from AWS S3.
 """
 import os
-import boto3
-from botocore.exceptions import ClientError
 from typing import Optional
 
+from .uploads import DocumentTooLarge, SPOOL_BLOCK_SIZE, too_large_message
+
 # AWS Configuration
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# S3-compatible endpoint instead of AWS (MinIO, or a fake S3 for load tests)
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
 
 _s3_client = None
 
@@ -18,6 +20,9 @@ def get_s3_client():
     """Get or create S3 client singleton."""
     global _s3_client
     if _s3_client is None:
+        # boto3 is slow to import and only needed once an S3 request arrives
+        import boto3
+
         if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
             print("Warning: AWS credentials not set. S3 operations will fail.")
             print("Set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables.")
@@ -26,7 +31,8 @@ def get_s3_client():
             's3',
             aws_access_key_id=AWS_ACCESS_KEY_ID,
             aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
+            region_name=AWS_REGION,
+            endpoint_url=S3_ENDPOINT_URL
         )
     return _s3_client
 
@@ -44,6 +50,8 @@ def download_from_s3(bucket: str, key: str) -> Optional[bytes]:
     Raises:
         ClientError: If S3 operation fails
     """
+    from botocore.exceptions import ClientError
+
     client = get_s3_client()
     
     try:
@@ -62,6 +70,54 @@ def download_from_s3(bucket: str, key: str) -> Optional[bytes]:
             print(f"✗ S3 error: {e}")
         raise
 
+def download_to_file(bucket: str, key: str, path: str, max_bytes: Optional[int] = None) -> int:
+    """
+    Stream an S3 object to a local file without holding it in memory.
+    
+    Args:
+        bucket: S3 bucket name
+        key: S3 object key (path)
+        path: Local file to write
+        max_bytes: Reject objects larger than this
+    
+    Returns:
+        Number of bytes written
+    
+    Raises:
+        ClientError: If S3 operation fails
+        DocumentTooLarge: If the object is bigger than max_bytes
+    """
+    from botocore.exceptions import ClientError
+
+    client = get_s3_client()
+    
+    try:
+        print(f"Downloading from S3: s3://{bucket}/{key}")
+        response = client.get_object(Bucket=bucket, Key=key)
+        if max_bytes is not None and response.get('ContentLength', 0) > max_bytes:
+            response['Body'].close()
+            raise DocumentTooLarge(too_large_message(f"s3://{bucket}/{key}"))
+        
+        size = 0
+        with open(path, "wb") as out:
+            for block in response['Body'].iter_chunks(SPOOL_BLOCK_SIZE):
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    response['Body'].close()
+                    raise DocumentTooLarge(too_large_message(f"s3://{bucket}/{key}"))
+                out.write(block)
+        print(f"✓ Downloaded {size} bytes from S3")
+        return size
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code == 'NoSuchKey':
+            print(f"✗ File not found in S3: {key}")
+        elif error_code == 'NoSuchBucket':
+            print(f"✗ Bucket not found: {bucket}")
+        else:
+            print(f"✗ S3 error: {e}")
+        raise
+
 def check_file_exists(bucket: str, key: str) -> bool:
     """
     Check if file exists in S3.
@@ -73,6 +129,8 @@ def check_file_exists(bucket: str, key: str) -> bool:
     Returns:
         True if file exists, False otherwise
     """
+    from botocore.exceptions import ClientError
+
     client = get_s3_client()
     
     try:
@@ -94,6 +152,8 @@ def list_tenant_files(bucket: str, tenant_id: str) -> list[dict]:
     Returns:
         List of file metadata dicts
     """
+    from botocore.exceptions import ClientError
+
     client = get_s3_client()
     
     try:
@@ -0,0 +1,195 @@
+"""
+Semantic answer cache for near-duplicate questions.
+
+The exact query cache (query_cache) misses paraphrases such as "what's the
+refund policy" vs "refund policy?". This cache keeps, per tenant, the
+embeddings of the last SEMANTIC_CACHE_MAX_ENTRIES answered queries in a
+small normalized matrix. A new query whose embedding has cosine
+similarity >= SEMANTIC_CACHE_THRESHOLD with a cached one gets that
+query's answer back, skipping the vector search and the LLM call.
+
+Entries expire after SEMANTIC_CACHE_TTL_SECONDS, the least recently used
+entry is replaced when a tenant's matrix is full, and at most
+SEMANTIC_CACHE_MAX_TENANTS tenants are kept. Any write to a tenant's
+vectors drops its entries (vectordb calls invalidate()), using the same
+generation check as query_cache so an answer computed across an upload
+is not stored.
+
+Off by default: a threshold match can return the answer to a different
+question, so enable it per deployment once the threshold has been tuned
+against the best_similarity histogram in stats().
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .metrics import Histogram
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+SEMANTIC_CACHE_MAX_TENANTS = int(os.getenv("SEMANTIC_CACHE_MAX_TENANTS", "1000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+SIMILARITY_BUCKETS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99, 1.0]
+
+_cache = None
+
+
+class TenantEntries:
+    """One tenant's cached query vectors (rows of a fixed-size matrix) and answers."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)  # 0 = empty slot
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.responses: list = [None] * capacity
+        self.generation = 0
+
+    def best(self, query: np.ndarray, now: float) -> Tuple[int, float]:
+        """(slot, similarity) of the closest live entry, or (-1, -inf)."""
+        live = self.expires > now
+        if not live.any():
+            return -1, float("-inf")
+        scores = self.vectors @ query
+        scores[~live] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def put(self, query: np.ndarray, response: Dict, now: float, ttl: float) -> None:
+        # Empty or expired slots have expires <= now; otherwise replace the LRU entry
+        free = np.flatnonzero(self.expires <= now)
+        slot = int(free[0]) if len(free) else int(np.argmin(self.last_used))
+        self.vectors[slot] = query
+        self.expires[slot] = now + ttl
+        self.last_used[slot] = now
+        self.responses[slot] = response
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.expires > time.time()))
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        max_tenants: int = SEMANTIC_CACHE_MAX_TENANTS,
+        ttl: float = SEMANTIC_CACHE_TTL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_tenants = max_tenants
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tenants: "OrderedDict[str, TenantEntries]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        # Best similarity found per lookup (hit or miss), for tuning the threshold
+        self.best_similarity = Histogram(SIMILARITY_BUCKETS)
+        self.hit_similarity = Histogram(SIMILARITY_BUCKETS)
+
+    @staticmethod
+    def _normalized(vector) -> np.ndarray:
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        return query / max(float(np.linalg.norm(query)), 1e-12)
+
+    def get(self, tenant_id: str, query_vector) -> Tuple[Optional[Dict], int]:
+        """(cached response or None, generation to pass to put())."""
+        query = self._normalized(query_vector)
+        now = time.time()
+        with self._lock:
+            generation = self._generations.get(tenant_id, 0)
+            entries = self._tenants.get(tenant_id)
+            if entries is None or entries.vectors.shape[1] != len(query):
+                self.misses += 1
+                return None, generation
+            self._tenants.move_to_end(tenant_id)
+            slot, similarity = entries.best(query, now)
+            if slot >= 0:
+                self.best_similarity.observe(similarity)
+            if slot < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None, generation
+            entries.last_used[slot] = now
+            self.hits += 1
+            self.hit_similarity.observe(similarity)
+            return entries.responses[slot], generation
+
+    def put(self, tenant_id: str, query_vector, generation: int, response: Dict) -> None:
+        query = self._normalized(query_vector)
+        now = time.time()
+        with self._lock:
+            if generation != self._generations.get(tenant_id, 0):
+                return
+            entries = self._tenants.get(tenant_id)
+            if entries is None or entries.vectors.shape[1] != len(query):
+                entries = TenantEntries(len(query), self.max_entries)
+                self._tenants[tenant_id] = entries
+            self._tenants.move_to_end(tenant_id)
+            entries.put(query, response, now, self.ttl)
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+            self._tenants.pop(tenant_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "tenants": len(self._tenants),
+                "entries": sum(len(entries) for entries in self._tenants.values()),
+                "max_entries_per_tenant": self.max_entries,
+                "best_similarity": self.best_similarity.snapshot(),
+                "hit_similarity": self.hit_similarity.snapshot(),
+            }
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Get or create the semantic cache singleton."""
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache()
+    return _cache
+
+
+def disable() -> None:
+    """Turn the cache off in this process (and processes forked from it); see gunicorn.conf.py."""
+    global SEMANTIC_CACHE_ENABLED
+    SEMANTIC_CACHE_ENABLED = False
+
+
+def lookup(tenant_id: str, query_vector) -> Tuple[Optional[Dict], int]:
+    """Cached answer to a near-duplicate query, and the generation to pass to store()."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, -1
+    return get_semantic_cache().get(tenant_id, query_vector)
+
+
+def store(tenant_id: str, query_vector, generation: int, response: Dict) -> None:
+    if not SEMANTIC_CACHE_ENABLED or generation < 0:
+        return
+    get_semantic_cache().put(tenant_id, query_vector, generation, response)
+
+
+def invalidate(tenant_id: str) -> None:
+    """Drop a tenant's entries after its content changed."""
+    if _cache is not None:
+        _cache.invalidate(tenant_id)
+
+
+def stats() -> Dict:
+    return get_semantic_cache().stats()
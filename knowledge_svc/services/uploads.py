@@ -0,0 +1,68 @@
+"""
+Spooling of uploaded documents to temporary files.
+
+Uploads are copied to disk in fixed-size blocks rather than read into
+memory, and rejected once they exceed MAX_UPLOAD_MB, so the memory used by
+an upload does not depend on the size of the document.
+"""
+import os
+import tempfile
+from typing import Optional
+
+from . import executors
+
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None  # None = system temp dir
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+
+class DocumentTooLarge(ValueError):
+    """Raised when an upload or S3 object exceeds MAX_UPLOAD_MB."""
+
+
+def new_spool_path(suffix: str = "") -> str:
+    """Create an empty temp file for a document and return its path."""
+    if UPLOAD_SPOOL_DIR:
+        os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="knowledge-", suffix=suffix, dir=UPLOAD_SPOOL_DIR)
+    os.close(fd)
+    return path
+
+
+def discard(path: Optional[str]) -> None:
+    """Remove a spooled file if it still exists."""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def too_large_message(name: str) -> str:
+    return f"{name} exceeds the {MAX_UPLOAD_MB:g} MB upload limit"
+
+
+async def spool_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Copy a FastAPI UploadFile to a temp file, block by block.
+
+    Returns:
+        Path of the spooled file (caller removes it with discard())
+
+    Raises:
+        DocumentTooLarge: If the upload is bigger than max_bytes
+    """
+    path = new_spool_path(os.path.splitext(upload.filename or "")[1])
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                block = await upload.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise DocumentTooLarge(too_large_message(upload.filename))
+                await executors.run_io(out.write, block)
+    except BaseException:
+        discard(path)
+        raise
+    return path
@@ -1,156 +1,455 @@
 import os
+import hashlib
 import uuid
+from abc import ABC, abstractmethod
 from datetime import datetime
-from supabase import create_client, Client
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
+
+from . import query_cache, semantic_cache
+
+# Vector store backend: "supabase" (pgvector via PostgREST), "postgres"
+# (pgvector over a direct asyncpg pool) or "local" (in-process NumPy
+# matrices persisted under LOCAL_STORE_PATH)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "supabase").lower()
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Namespace for deterministic chunk IDs (uuid5); changing it re-keys every chunk
+CHUNK_ID_NAMESPACE = uuid.UUID("3f6c1f3e-52a4-4d0e-9f3b-1f0c6e0b7a21")
+# PostgREST caps rows per response; page through larger selects
+SELECT_PAGE_SIZE = 1000
+
 _client = None
+_store = None
 
-def get_supabase_client() -> Client:
+def get_supabase_client():
     """Get or create Supabase client singleton."""
     global _client
     if _client is None:
+        from supabase import create_client
+
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment")
         _client = create_client(SUPABASE_URL, SUPABASE_KEY)
     return _client
 
-def ensure_table():
+class VectorStore(ABC):
     """
-    Ensure the knowledge_vectors table exists.
-    Note: Table creation should be done via init_supabase.sql
-    This function just verifies connectivity.
+    Interface every vector store backend implements.
+
+    Rows are dicts with id, vector, text, content_hash, chunk_index,
+    source_file, file_type and upload_timestamp. Alongside the chunks each
+    backend keeps a per-document manifest (see record_file), so listing
+    files costs one entry per file rather than one row per chunk.
+    Backends are called from worker threads and must be thread-safe.
     """
-    client = get_supabase_client()
-    try:
-        # Simple query to verify table exists
-        client.table("knowledge_vectors").select("id").limit(1).execute()
-        print("✓ knowledge_vectors table is accessible")
-    except Exception as e:
-        print(f"⚠ Warning: Could not access knowledge_vectors table: {e}")
-        print("Please run init_supabase.sql in your Supabase SQL editor")
+
+    name = "base"
+
+    # ensure() and close() are optional hooks; everything else is required
+
+    def ensure(self) -> None:
+        """Verify the store is reachable / initialized."""
+
+    def close(self) -> None:
+        """Release connections and background threads."""
+
+    @abstractmethod
+    def upsert(self, tenant_id: str, rows: List[Dict]) -> int:
+        """Insert rows, leaving rows whose id already exists untouched."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, tenant_id: str, query_vector: List[float], limit: int) -> List[Dict]:
+        """Rows most similar to query_vector (cosine), with a "similarity" key, best first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_files(self, tenant_id: str) -> List[Dict]:
+        """Manifest entries of a tenant's documents."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_file(self, tenant_id: str, entry: Dict) -> None:
+        """
+        Insert or update a document's manifest entry: source_file, file_type,
+        chunk_count, byte_size, content_hash and updated_at. created_at is
+        kept from the first time the document was recorded.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stored_chunks(self, tenant_id: str, source_file: str) -> List[Dict]:
+        """id, chunk_index and content_hash of every chunk of a document."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def reindex_document_chunks(self, tenant_id: str, source_file: str, moves: List[Dict],
+                                delete_ids: List[str], rows: Iterable[List[Dict]] = ()) -> int:
+        """
+        Atomically replace a document's chunks with its new version: delete
+        delete_ids, renumber moves and insert rows (batches of rows as for
+        upsert). Readers see the old version or the new one, never a mix.
+        Returns rows deleted.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_document(self, tenant_id: str, source_file: str) -> int:
+        """Delete a document's chunks and manifest entry. Returns chunks deleted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_all_documents(self, tenant_id: str) -> int:
+        """Delete every chunk and manifest entry of a tenant. Returns chunks deleted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self, tenant_id: str, source_file: Optional[str] = None) -> int:
+        """Number of chunks stored for a tenant (or one of its documents)."""
+        raise NotImplementedError
+
+class SupabaseStore(VectorStore):
+    """pgvector in Supabase, through PostgREST and the RPCs in init_supabase.sql."""
+
+    name = "supabase"
+
+    def __init__(self):
+        self.client = get_supabase_client()
+
+    def ensure(self) -> None:
+        """
+        Ensure the knowledge_vectors table exists.
+        Note: Table creation should be done via init_supabase.sql
+        This function just verifies connectivity.
+        """
+        try:
+            # Simple query to verify table exists
+            self.client.table("knowledge_vectors").select("id").limit(1).execute()
+            print("✓ knowledge_vectors table is accessible")
+        except Exception as e:
+            print(f"⚠ Warning: Could not access knowledge_vectors table: {e}")
+            print("Please run init_supabase.sql in your Supabase SQL editor")
+
+    def upsert(self, tenant_id: str, rows: List[Dict]) -> int:
+        data = [dict(row, tenant_id=tenant_id) for row in rows]
+        # Existing IDs are skipped server-side
+        self.client.table("knowledge_vectors")\
+            .upsert(data, on_conflict="id", ignore_duplicates=True)\
+            .execute()
+        return len(data)
+
+    def search(self, tenant_id: str, query_vector: List[float], limit: int) -> List[Dict]:
+        results = self.client.rpc(
+            "match_knowledge_vectors",
+            {
+                "query_embedding": query_vector,
+                "match_tenant_id": tenant_id,
+                "match_count": limit
+            }
+        ).execute()
+        return results.data or []
+
+    def list_files(self, tenant_id: str) -> List[Dict]:
+        files = []
+        start = 0
+        while True:
+            result = self.client.table("knowledge_files")\
+                .select("source_file, file_type, chunk_count, byte_size, content_hash, created_at, updated_at")\
+                .eq("tenant_id", tenant_id)\
+                .order("source_file")\
+                .range(start, start + SELECT_PAGE_SIZE - 1)\
+                .execute()
+            page = result.data or []
+            files.extend(page)
+            if len(page) < SELECT_PAGE_SIZE:
+                return files
+            start += SELECT_PAGE_SIZE
+
+    def record_file(self, tenant_id: str, entry: Dict) -> None:
+        self.client.table("knowledge_files")\
+            .upsert(dict(entry, tenant_id=tenant_id), on_conflict="tenant_id,source_file")\
+            .execute()
+
+    def stored_chunks(self, tenant_id: str, source_file: str) -> List[Dict]:
+        rows = []
+        start = 0
+        while True:
+            result = self.client.table("knowledge_vectors")\
+                .select("id, chunk_index, content_hash")\
+                .eq("tenant_id", tenant_id)\
+                .eq("source_file", source_file)\
+                .order("id")\
+                .range(start, start + SELECT_PAGE_SIZE - 1)\
+                .execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < SELECT_PAGE_SIZE:
+                return rows
+            start += SELECT_PAGE_SIZE
+
+    def reindex_document_chunks(self, tenant_id: str, source_file: str, moves: List[Dict],
+                                delete_ids: List[str], rows: Iterable[List[Dict]] = ()) -> int:
+        # One RPC is one transaction, so the new rows travel with it
+        new_rows = [row for batch in rows for row in batch]
+        result = self.client.rpc(
+            "reindex_document_chunks",
+            {
+                "match_tenant_id": tenant_id,
+                "match_source_file": source_file,
+                "moves": moves,
+                "delete_ids": delete_ids,
+                "new_rows": new_rows
+            }
+        ).execute()
+        return result.data or 0
+
+    def delete_document(self, tenant_id: str, source_file: str) -> int:
+        # One RPC, so the chunks and the manifest entry go in one transaction
+        result = self.client.rpc(
+            "delete_document_chunks",
+            {"match_tenant_id": tenant_id, "match_source_file": source_file}
+        ).execute()
+        return result.data or 0
+
+    def delete_all_documents(self, tenant_id: str) -> int:
+        result = self.client.rpc("delete_tenant_documents", {"match_tenant_id": tenant_id}).execute()
+        return result.data or 0
+
+    def count(self, tenant_id: str, source_file: Optional[str] = None) -> int:
+        query = self.client.table("knowledge_vectors")\
+            .select("id", count="exact", head=True)\
+            .eq("tenant_id", tenant_id)
+        if source_file is not None:
+            query = query.eq("source_file", source_file)
+        return query.execute().count or 0
+
+def create_store(name: str = VECTOR_STORE) -> VectorStore:
+    """Instantiate a vector store backend by name ("supabase", "postgres" or "local")."""
+    if name == "supabase":
+        return SupabaseStore()
+    if name == "postgres":
+        from .pg_store import PostgresStore
+        return PostgresStore()
+    if name == "local":
+        from .local_store import LocalStore
+        return LocalStore()
+    raise ValueError(f"Unknown VECTOR_STORE: {name}. Supported: supabase, postgres, local")
+
+def get_store() -> VectorStore:
+    """Get or create the configured vector store singleton."""
+    global _store
+    if _store is None:
+        _store = create_store()
+        print(f"✓ Using {_store.name} vector store")
+    return _store
+
+def close_store() -> None:
+    """Close the vector store singleton, if one was created."""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+def group_files(rows: Iterable[Dict]) -> List[Dict]:
+    """
+    Build manifest entries from chunk rows (source_file, file_type,
+    upload_timestamp). Only used to backfill stores that predate the manifest.
+    """
+    files_dict = {}
+    for row in rows:
+        filename = row.get("source_file", "unknown")
+
+        if filename not in files_dict:
+            files_dict[filename] = {
+                "source_file": filename,
+                "file_type": row.get("file_type", ""),
+                "chunk_count": 0,
+                "byte_size": None,
+                "content_hash": None,
+                "created_at": row.get("upload_timestamp", ""),
+                "updated_at": row.get("upload_timestamp", "")
+            }
+
+        files_dict[filename]["chunk_count"] += 1
+
+    return list(files_dict.values())
+
+def file_info(entry: Dict) -> Dict:
+    """Manifest entry -> /files response item."""
+    return {
+        "filename": entry["source_file"],
+        "file_type": entry.get("file_type") or "",
+        "upload_date": entry.get("updated_at") or "",
+        "chunk_count": entry.get("chunk_count") or 0,
+        "byte_size": entry.get("byte_size"),
+        "content_hash": entry.get("content_hash"),
+        "created_at": entry.get("created_at")
+    }
+
+def ensure_table():
+    """Verify the configured vector store is reachable."""
+    get_store().ensure()
 
 def ensure_collection(tenant_id: str):
     """
     Legacy function for compatibility.
-    In Supabase, we use a single table with tenant_id column.
+    All tenants share one store, keyed by tenant_id.
     """
     ensure_table()
 
 def insert_dummy_vector(tenant_id: str):
     """Insert a dummy vector for testing purposes."""
-    client = get_supabase_client()
-    
     import random
     dummy_vector = [random.random() for _ in range(768)]
-    
-    data = {
-        "tenant_id": tenant_id,
-        "vector": dummy_vector,
-        "text": "This is a dummy vector",
-        "chunk_index": 0,
-        "source_file": "dummy",
-        "file_type": ".txt",
-        "upload_timestamp": datetime.now().isoformat()
-    }
-    
-    result = client.table("knowledge_vectors").insert(data).execute()
+
+    result = upsert_chunks(
+        tenant_id,
+        ["This is a dummy vector"],
+        [dummy_vector],
+        source_file="dummy",
+        file_type=".txt",
+        upload_timestamp=datetime.now().isoformat()
+    )
     print(f"Inserted dummy vector for tenant {tenant_id}")
     return result
 
 def search_dummy_vector(tenant_id: str):
     """Search using a dummy query vector."""
-    client = get_supabase_client()
-    
     import random
     dummy_query = [random.random() for _ in range(768)]
-    
-    # Use RPC function for vector similarity search
-    # Note: This requires a custom SQL function in Supabase
-    results = client.rpc(
-        "match_knowledge_vectors",
+
+    return get_store().search(tenant_id, dummy_query, 3)
+
+def _content_changed(tenant_id: str) -> None:
+    """Invalidate cached answers after a write to a tenant's vectors."""
+    query_cache.invalidate(tenant_id)
+    semantic_cache.invalidate(tenant_id)
+
+def content_hash(text: str) -> str:
+    """SHA-256 of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(tenant_id: str, source_file: str, chunk_index: int, text: str) -> str:
+    """
+    Deterministic ID for a chunk.
+
+    The same text at the same position of the same document always gets the
+    same ID, so re-uploads and retried jobs hit existing rows instead of
+    duplicating them.
+    """
+    name = f"{tenant_id}\x00{source_file}\x00{chunk_index}\x00{content_hash(text)}"
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, name))
+
+def stored_chunks(tenant_id: str, source_file: str) -> List[Dict]:
+    """id, chunk_index and content_hash of every chunk stored for a document."""
+    return get_store().stored_chunks(tenant_id, source_file)
+
+def reindex_document_chunks(tenant_id: str, source_file: str, moves: List[Dict], delete_ids: List[str],
+                            rows: Iterable[List[Dict]] = ()) -> int:
+    """
+    Insert, renumber and prune a document's stored chunks in one transaction.
+
+    Args:
+        tenant_id: Tenant ID
+        source_file: Document whose chunks change
+        moves: {"old_id", "new_id", "chunk_index"} for chunks whose text is
+            unchanged but whose position moved
+        delete_ids: Chunks that no longer exist in the document
+        rows: Batches of new rows (see chunk_rows), read once
+
+    Returns:
+        Number of chunks deleted
+    """
+    deleted_count = get_store().reindex_document_chunks(tenant_id, source_file, moves, delete_ids, rows)
+    _content_changed(tenant_id)
+    print(f"✓ Renumbered {len(moves)} and removed {deleted_count} chunks for {source_file} (tenant: {tenant_id})")
+    return deleted_count
+
+def chunk_rows(
+    tenant_id: str,
+    chunks: List[str],
+    embeddings,
+    source_file: str,
+    file_type: str,
+    upload_timestamp: str,
+    chunk_indexes: Iterable[int],
+) -> List[Dict]:
+    """Store rows for embedded chunks, keyed by chunk_id()."""
+    # Accept either a float32 matrix from embed_documents or a list of lists
+    if hasattr(embeddings, "tolist"):
+        embeddings = embeddings.tolist()
+    return [
         {
-            "query_embedding": dummy_query,
-            "match_tenant_id": tenant_id,
-            "match_count": 3
+            "id": chunk_id(tenant_id, source_file, i, chunk),
+            "vector": vector,
+            "text": chunk,
+            "content_hash": content_hash(chunk),
+            "chunk_index": i,
+            "source_file": source_file,
+            "file_type": file_type,
+            "upload_timestamp": upload_timestamp
         }
-    ).execute()
-    
-    return results.data if results.data else []
+        for i, chunk, vector in zip(chunk_indexes, chunks, embeddings)
+    ]
 
 def upsert_chunks(
     tenant_id: str,
     chunks: List[str],
-    embeddings: List[List[float]],
+    embeddings,
     source_file: str = "upload",
     file_type: str = ".txt",
-    upload_timestamp: str = None
+    upload_timestamp: str = None,
+    start_index: int = 0,
+    chunk_indexes: Optional[List[int]] = None
 ):
     """
-    Insert document chunks with their embeddings into Supabase.
+    Upsert document chunks with their embeddings into the vector store.
+
+    Rows are keyed by chunk_id(), and chunks that are already stored are
+    left untouched, so storing the same document twice is a no-op.
+
+    start_index is the chunk_index of the first chunk, for callers that
+    store one document in several batches; chunk_indexes gives every
+    chunk's position explicitly when the batch is not contiguous.
     """
-    client = get_supabase_client()
-    
     if not upload_timestamp:
         upload_timestamp = datetime.now().isoformat()
-    
-    # Prepare batch insert data
-    data = []
-    for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-        data.append({
-            "id": str(uuid.uuid4()),
-            "tenant_id": tenant_id,
-            "vector": vector,
-            "text": chunk,
-            "chunk_index": i,
-            "source_file": source_file,
-            "file_type": file_type,
-            "upload_timestamp": upload_timestamp
-        })
-    
-    # Insert all chunks in one batch
-    result = client.table("knowledge_vectors").insert(data).execute()
-    print(f"✓ Upserted {len(data)} chunks for tenant {tenant_id}")
-    return result
+
+    if chunk_indexes is None:
+        chunk_indexes = range(start_index, start_index + len(chunks))
+
+    data = chunk_rows(tenant_id, chunks, embeddings, source_file, file_type, upload_timestamp, chunk_indexes)
+    count = get_store().upsert(tenant_id, data)
+    _content_changed(tenant_id)
+    print(f"✓ Upserted {count} chunks for tenant {tenant_id}")
+    return count
 
 def search(tenant_id: str, query_vector: List[float], limit: int = 5) -> List[Dict]:
     """
-    Search for similar vectors using pgvector cosine similarity.
+    Search for the chunks most similar to a query vector (cosine similarity).
     """
-    client = get_supabase_client()
-    
     try:
-        # Use RPC function for vector similarity search
-        results = client.rpc(
-            "match_knowledge_vectors",
-            {
-                "query_embedding": query_vector,
-                "match_tenant_id": tenant_id,
-                "match_count": limit
-            }
-        ).execute()
-        
-        if not results.data:
-            return []
-        
+        rows = get_store().search(tenant_id, query_vector, limit)
+
         # Format results to match expected output
         formatted_results = []
-        for row in results.data:
+        for row in rows:
             formatted_results.append({
                 "text": row.get("text", ""),
                 "score": row.get("similarity", 0.0),
-                "source": row.get("source_file", "")
+                "source": row.get("source_file", ""),
+                "chunk_index": row.get("chunk_index")
             })
-        
+
         return formatted_results
-    
+
     except Exception as e:
         print(f"Error during search: {e}")
-        print("Make sure you've created the match_knowledge_vectors RPC function in Supabase")
+        if VECTOR_STORE == "supabase":
+            print("Make sure you've created the match_knowledge_vectors RPC function in Supabase")
         return []
 
 def list_files(tenant_id: str) -> List[Dict]:
@@ -158,65 +457,64 @@ def list_files(tenant_id: str) -> List[Dict]:
     List all uploaded files for a tenant.
     Returns file metadata grouped by filename.
     """
-    client = get_supabase_client()
-    
     try:
-        # Query all chunks for this tenant
-        result = client.table("knowledge_vectors")\
-            .select("source_file, file_type, upload_timestamp")\
-            .eq("tenant_id", tenant_id)\
-            .execute()
-        
-        if not result.data:
-            return []
-        
-        # Group by source_file
-        files_dict = {}
-        for row in result.data:
-            filename = row.get("source_file", "unknown")
-            
-            if filename not in files_dict:
-                files_dict[filename] = {
-                    "filename": filename,
-                    "file_type": row.get("file_type", ""),
-                    "upload_date": row.get("upload_timestamp", ""),
-                    "chunk_count": 0
-                }
-            
-            files_dict[filename]["chunk_count"] += 1
-        
-        return list(files_dict.values())
-    
+        return [file_info(entry) for entry in get_store().list_files(tenant_id)]
+
     except Exception as e:
         print(f"Error listing files for {tenant_id}: {e}")
         return []
 
+def record_file(
+    tenant_id: str,
+    source_file: str,
+    file_type: str,
+    chunk_count: int,
+    byte_size: Optional[int] = None,
+    content_hash: Optional[str] = None,
+    timestamp: Optional[str] = None
+) -> None:
+    """
+    Record a document in the file manifest after it has been ingested.
+
+    Args:
+        tenant_id: Tenant ID
+        source_file: Document name
+        file_type: File extension
+        chunk_count: Chunks now stored for the document
+        byte_size: Size of the uploaded file, if known
+        content_hash: SHA-256 of the uploaded file, if known
+        timestamp: Ingestion time (defaults to now)
+    """
+    get_store().record_file(tenant_id, {
+        "source_file": source_file,
+        "file_type": file_type,
+        "chunk_count": chunk_count,
+        "byte_size": byte_size,
+        "content_hash": content_hash,
+        "updated_at": timestamp or datetime.now().isoformat()
+    })
+
+def count_chunks(tenant_id: str, source_file: Optional[str] = None) -> int:
+    """Number of chunks stored for a tenant, or for one of its documents."""
+    return get_store().count(tenant_id, source_file)
+
 def delete_document(tenant_id: str, source_file: str) -> int:
     """
     Delete all chunks for a specific document.
-    
+
     Args:
         tenant_id: Tenant ID
         source_file: Source filename to delete
-    
+
     Returns:
         Number of chunks deleted
     """
-    client = get_supabase_client()
-    
     try:
-        # Delete all chunks for this document
-        result = client.table("knowledge_vectors")\
-            .delete()\
-            .eq("tenant_id", tenant_id)\
-            .eq("source_file", source_file)\
-            .execute()
-        
-        # Count deleted rows (Supabase returns deleted rows)
-        deleted_count = len(result.data) if result.data else 0
+        deleted_count = get_store().delete_document(tenant_id, source_file)
+        _content_changed(tenant_id)
         print(f"✓ Deleted {deleted_count} chunks for {source_file} (tenant: {tenant_id})")
         return deleted_count
-    
+
     except Exception as e:
         print(f"Error deleting document {source_file} for {tenant_id}: {e}")
         raise
@@ -224,26 +522,19 @@ def delete_document(tenant_id: str, source_file: str) -> int:
 def delete_all_documents(tenant_id: str) -> int:
     """
     Delete all documents/chunks for a tenant.
-    
+
     Args:
         tenant_id: Tenant ID
-    
+
     Returns:
         Number of chunks deleted
     """
-    client = get_supabase_client()
-    
     try:
-        # Delete all chunks for this tenant
-        result = client.table("knowledge_vectors")\
-            .delete()\
-            .eq("tenant_id", tenant_id)\
-            .execute()
-        
-        deleted_count = len(result.data) if result.data else 0
+        deleted_count = get_store().delete_all_documents(tenant_id)
+        _content_changed(tenant_id)
         print(f"✓ Deleted {deleted_count} total chunks for tenant {tenant_id}")
         return deleted_count
-    
+
     except Exception as e:
         print(f"Error deleting all documents for {tenant_id}: {e}")
         raise
@@ -0,0 +1,136 @@
+"""
+Startup warm-up and readiness.
+
+The heavy libraries (torch and the embedding model, openai, the parsers,
+boto3) are imported on first use, so the process starts quickly and
+/health answers almost at once. The lifespan then starts warm_up() in the
+background, which loads and exercises everything the first requests
+would otherwise pay for:
+
+- embedder: the model, plus a dummy document batch and a dummy query
+  (first forward passes are much slower than later ones)
+- tokenizer: the tiktoken encoding used for context budgets
+- vector_store: the configured store singleton
+- llm: the openai package and the shared client
+- parse_pool: the parse worker processes, with the parser libraries loaded
+
+/ready answers 503 until every step has succeeded, so a load balancer or
+the container healthcheck only routes traffic to a warm process. A failed
+step is retried every WARMUP_RETRY_SECONDS. With WARMUP_ON_STARTUP=false
+nothing is warmed and the process is ready at once.
+"""
+import asyncio
+import importlib
+import os
+import time
+from typing import Optional
+
+from . import context_builder, embedder, executors, file_parser, llm, vectordb
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+
+_task: Optional[asyncio.Task] = None
+_state = {"ready": False, "started_at": None, "ready_after_s": None, "steps": {}}
+
+
+async def _warm_embedder() -> None:
+    await executors.run_query(embedder.warm_up)
+
+
+async def _warm_tokenizer() -> None:
+    await executors.run_io(context_builder.count_tokens, "warm-up")
+
+
+async def _warm_vector_store() -> None:
+    await executors.run_io(vectordb.get_store)
+
+
+async def _warm_llm() -> None:
+    # Imported off the event loop, then the client is created on it
+    await executors.run_io(importlib.import_module, "openai")
+    llm.get_llm_client()
+
+
+async def _warm_parse_pool() -> None:
+    # One call per worker, so every process gets spawned and loads the parsers
+    await asyncio.gather(*(
+        executors.run_parse(file_parser.preload) for _ in range(executors.PARSE_POOL_SIZE)
+    ))
+
+
+STEPS = {
+    "embedder": _warm_embedder,
+    "tokenizer": _warm_tokenizer,
+    "vector_store": _warm_vector_store,
+    "llm": _warm_llm,
+    "parse_pool": _warm_parse_pool,
+}
+
+
+async def _run_step(name: str) -> bool:
+    started = time.perf_counter()
+    try:
+        await STEPS[name]()
+    except Exception as e:
+        print(f"Warm-up step {name} failed: {e}")
+        _state["steps"][name] = {"status": "error", "error": str(e)}
+        return False
+    seconds = round(time.perf_counter() - started, 3)
+    _state["steps"][name] = {"status": "done", "seconds": seconds}
+    print(f"✓ Warm-up: {name} ({seconds}s)")
+    return True
+
+
+async def warm_up() -> None:
+    """Run every step, retrying failed ones until all have succeeded."""
+    started = time.perf_counter()
+    pending = list(STEPS)
+    for name in pending:
+        _state["steps"][name] = {"status": "pending"}
+    while True:
+        # Concurrently: the steps use different pools
+        results = await asyncio.gather(*(_run_step(name) for name in pending))
+        pending = [name for name, ok in zip(pending, results) if not ok]
+        if not pending:
+            break
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    _state["ready_after_s"] = round(time.perf_counter() - started, 3)
+    _state["ready"] = True
+    print(f"✓ Warm-up complete in {_state['ready_after_s']}s; ready for traffic")
+
+
+def start() -> None:
+    """Start warming up in the background (called from the lifespan)."""
+    global _task
+    _state["started_at"] = time.time()
+    if not WARMUP_ON_STARTUP:
+        _state["ready"] = True
+        return
+    _task = asyncio.create_task(warm_up())
+
+
+async def stop() -> None:
+    """Cancel a warm-up still in progress."""
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+
+def is_ready() -> bool:
+    return _state["ready"]
+
+
+def status() -> dict:
+    return {
+        "ready": _state["ready"],
+        "pid": os.getpid(),
+        "warmup_enabled": WARMUP_ON_STARTUP,
+        "ready_after_s": _state["ready_after_s"],
+        "steps": {name: dict(step) for name, step in _state["steps"].items()},
+    }
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Streaming chunker parity: iter_chunks vs. chunk_text (services/chunker.py).
+
+Uploads are chunked with iter_chunks as the parsed text streams in, and
+chunk IDs are derived from the chunk text, so iter_chunks must yield
+exactly the chunks chunk_text gives for the whole text; any difference
+changes the IDs and breaks re-indexing. Checked over text lengths around
+the chunk boundaries, split into pieces in several ways.
+
+No external services needed. Runs under pytest or directly:
+
+    python tests/test_chunker_streaming.py
+"""
+import random
+import string
+import sys
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / "knowledge_svc"))
+
+from services import chunker
+
+# (chunk_size, overlap): the service default, a small one, and no overlap
+SETTINGS = [(1000, 200), (10, 3), (8, 0)]
+
+
+def boundary_lengths(chunk_size: int, overlap: int) -> list[int]:
+    """Text lengths just around the ends of the first few chunks."""
+    step = chunk_size - overlap
+    lengths = {0, 1}
+    for chunks in range(1, 5):
+        end = chunk_size + (chunks - 1) * step
+        lengths.update(end + delta for delta in (-overlap - 1, -overlap, -1, 0, 1, overlap, overlap + 1))
+    return sorted(n for n in lengths if n >= 0)
+
+
+def splits(text: str, chunk_size: int, rng: random.Random) -> list[list[str]]:
+    """The same text as several piece sequences, including empty pieces."""
+    ways = [
+        [text],
+        list(text),
+        [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)],
+        [text[i:i + chunk_size + 1] for i in range(0, len(text), chunk_size + 1)],
+    ]
+    pieces, i = [], 0
+    while i < len(text):
+        n = rng.randint(0, 2 * chunk_size)
+        pieces.append(text[i:i + n])
+        i += n
+    ways.append(pieces + [""])
+    return ways
+
+
+def check(text: str, chunk_size: int, overlap: int, rng: random.Random) -> None:
+    expected = chunker.chunk_text(text, chunk_size=chunk_size, overlap=overlap)
+    for pieces in splits(text, chunk_size, rng):
+        got = list(chunker.iter_chunks(pieces, chunk_size=chunk_size, overlap=overlap))
+        assert got == expected, (
+            f"len={len(text)} chunk_size={chunk_size} overlap={overlap} pieces={len(pieces)}: "
+            f"{len(got)} chunks streamed, {len(expected)} expected"
+        )
+
+
+def test_iter_chunks_matches_chunk_text_around_boundaries():
+    rng = random.Random(0)
+    for chunk_size, overlap in SETTINGS:
+        for length in boundary_lengths(chunk_size, overlap):
+            # Distinct characters, so a chunk shifted by one doesn't compare equal
+            text = "".join(rng.choice(string.ascii_letters) for _ in range(length))
+            check(text, chunk_size, overlap, rng)
+
+
+def test_iter_chunks_matches_chunk_text_on_fixtures():
+    rng = random.Random(1)
+    for name in ("test_coffee_guide.txt", "test_python.txt"):
+        text = (TESTS_DIR / name).read_text()
+        check(text, 1000, 200, rng)
+        check(text, 300, 50, rng)
+
+
+if __name__ == "__main__":
+    tests = [
+        test_iter_chunks_matches_chunk_text_around_boundaries,
+        test_iter_chunks_matches_chunk_text_on_fixtures,
+    ]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Incremental re-indexing: the chunk-hash diff in services/ingest.py
+(DocumentSync) against an in-memory fake vector store.
+
+After every sync the stored rows of the document must be exactly the new
+version's chunks, each at its position and under its deterministic
+chunk_id, with stored text renumbered rather than embedded again.
+Covered: unchanged, edited, inserted and removed chunks,
+repeated text, random edits, re-uploading the same file through
+update_file(), a failure halfway through leaving the stored version
+untouched, concurrent re-uploads of one file running one at a time, and
+the multi-file pipeline (a failed file writes nothing, a repeated
+filename is ingested once).
+
+No external services or model needed. Runs under pytest or directly:
+
+    python tests/test_document_sync.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / "knowledge_svc"))
+os.environ.setdefault("PARSE_POOL_SIZE", "1")
+os.environ.setdefault("INGEST_LOCK_DIR", tempfile.mkdtemp(prefix="ingest-locks-"))
+
+from services import embedder, executors, ingest, pipeline, vectordb
+
+TENANT = "tenant_sync"
+FILENAME = "doc.txt"
+
+
+class FakeStore(vectordb.VectorStore):
+    """Just the rows and manifests, in dicts."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.rows: dict[str, dict] = {}
+        self.files: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, tenant_id, rows):
+        with self._lock:
+            new = [row for row in rows if row["id"] not in self.rows]
+            for row in new:
+                self.rows[row["id"]] = dict(row, tenant_id=tenant_id)
+        return len(new)
+
+    def record_file(self, tenant_id, entry):
+        self.files[(tenant_id, entry["source_file"])] = dict(entry)
+
+    def stored_chunks(self, tenant_id, source_file):
+        return [
+            {"id": row["id"], "chunk_index": row["chunk_index"], "content_hash": row["content_hash"]}
+            for row in self._document(tenant_id, source_file)
+        ]
+
+    def reindex_document_chunks(self, tenant_id, source_file, moves, delete_ids, rows=()):
+        # Read the staged rows first, so a failure changes nothing
+        rows = [row for batch in rows for row in batch]
+        with self._lock:
+            deleted = sum(self.rows.pop(chunk_id, None) is not None for chunk_id in delete_ids)
+            # All moves read the old rows first: one move's new ID can be another's old one
+            moved = [(self.rows.pop(move["old_id"], None), move) for move in moves]
+            for row, move in moved:
+                if row is not None:
+                    self.rows[move["new_id"]] = dict(row, id=move["new_id"], chunk_index=move["chunk_index"])
+            for row in rows:
+                self.rows.setdefault(row["id"], dict(row, tenant_id=tenant_id))
+        return deleted
+
+    def search(self, tenant_id, query_vector, limit):
+        return [dict(row, similarity=0.0) for row in self._document(tenant_id, None)[:limit]]
+
+    def list_files(self, tenant_id):
+        return [dict(entry) for (tenant, _), entry in sorted(self.files.items()) if tenant == tenant_id]
+
+    def delete_document(self, tenant_id, source_file):
+        with self._lock:
+            rows = self._document(tenant_id, source_file)
+            for row in rows:
+                del self.rows[row["id"]]
+            self.files.pop((tenant_id, source_file), None)
+        return len(rows)
+
+    def delete_all_documents(self, tenant_id):
+        names = {row["source_file"] for row in self._document(tenant_id, None)}
+        names.update(name for tenant, name in list(self.files) if tenant == tenant_id)
+        return sum(self.delete_document(tenant_id, name) for name in names)
+
+    def count(self, tenant_id, source_file=None):
+        return len(self._document(tenant_id, source_file))
+
+    def _document(self, tenant_id, source_file):
+        return [
+            row for row in list(self.rows.values())
+            if row["tenant_id"] == tenant_id and source_file in (None, row["source_file"])
+        ]
+
+
+def install_store() -> FakeStore:
+    vectordb.close_store()
+    store = vectordb._store = FakeStore()
+    return store
+
+
+async def sync(chunks: list[str], batch_size: int = 2) -> dict:
+    """What update_file() does with a document's chunks, minus parsing and the model."""
+    document = ingest.DocumentSync(TENANT, FILENAME)
+    await document.load()
+    staged = ingest.StagedChunks(TENANT, FILENAME, ".txt", "2024-01-01T00:00:00")
+    try:
+        for start in range(0, len(chunks), batch_size):
+            new, indexes = document.new_chunks(chunks[start:start + batch_size], start)
+            if new:
+                await staged.add(new, np.zeros((len(new), 4), dtype=np.float32), indexes)
+        await document.finish(staged)
+    finally:
+        staged.discard()
+    return document.stats()
+
+
+def assert_stored(store: FakeStore, chunks: list[str]) -> None:
+    rows = sorted(store._document(TENANT, FILENAME), key=lambda row: row["chunk_index"])
+    assert [row["chunk_index"] for row in rows] == list(range(len(chunks))), \
+        f"positions {[row['chunk_index'] for row in rows]} for {len(chunks)} chunks"
+    for row, chunk in zip(rows, chunks):
+        assert row["text"] == chunk, f"position {row['chunk_index']}: {row['text']!r} != {chunk!r}"
+        assert row["content_hash"] == vectordb.content_hash(chunk)
+        assert row["id"] == vectordb.chunk_id(TENANT, FILENAME, row["chunk_index"], chunk)
+
+
+def check_sync(store: FakeStore, chunks: list[str], **expected) -> dict:
+    stats = asyncio.run(sync(chunks))
+    assert_stored(store, chunks)
+    got = {key: stats[f"chunks_{key}"] for key in expected}
+    assert got == expected, f"{chunks}: {got} != {expected}"
+    return stats
+
+
+def test_unchanged_edited_inserted_removed():
+    store = install_store()
+    original = [f"paragraph {c}" for c in "ABCDEF"]
+    check_sync(store, original, total=6, embedded=6, unchanged=0, moved=0, deleted=0)
+
+    # Re-upload: nothing to embed or delete
+    check_sync(store, original, total=6, embedded=0, unchanged=6, moved=0, deleted=0)
+
+    # Edit one chunk: only it is embedded, its old row deleted
+    edited = list(original)
+    edited[2] = "paragraph C, revised"
+    check_sync(store, edited, embedded=1, unchanged=5, moved=0, deleted=1)
+
+    # Insert near the start: later chunks are renumbered, not re-embedded
+    inserted = edited[:1] + ["a new paragraph"] + edited[1:]
+    check_sync(store, inserted, embedded=1, unchanged=1, moved=5, deleted=0)
+
+    # Remove one: the rest move back up, one row goes
+    removed = inserted[:2] + inserted[3:]
+    check_sync(store, removed, embedded=0, unchanged=2, moved=4, deleted=1)
+
+    # Append and truncate
+    check_sync(store, removed + ["an appendix"], embedded=1, unchanged=6, moved=0, deleted=0)
+    check_sync(store, removed[:3], embedded=0, unchanged=3, moved=0, deleted=4)
+
+    # Other documents and tenants are untouched
+    assert all(row["source_file"] == FILENAME and row["tenant_id"] == TENANT for row in store.rows.values())
+
+
+def test_repeated_text():
+    store = install_store()
+    check_sync(store, ["A", "B", "C"], embedded=3)
+    # B's old row is borrowed for position 0, then position 1 needs it back
+    check_sync(store, ["B", "B", "C"], embedded=1, unchanged=2, deleted=1)
+    check_sync(store, ["B", "B", "B", "C"], embedded=1, unchanged=2, moved=1, deleted=0)
+    check_sync(store, ["C", "B"], embedded=0, unchanged=1, moved=1, deleted=2)
+    check_sync(store, [], embedded=0, deleted=2)
+
+
+def test_random_edits():
+    rng = random.Random(0)
+    store = install_store()
+    chunks: list[str] = []
+    stored_texts: set[str] = set()
+    for _ in range(300):
+        chunks = list(chunks)
+        for _ in range(rng.randint(1, 3)):
+            op = rng.choice(("insert", "delete", "edit", "swap"))
+            if op == "insert" or not chunks:
+                chunks.insert(rng.randint(0, len(chunks)), rng.choice("ABCDEFGHIJ"))
+            elif op == "delete":
+                del chunks[rng.randrange(len(chunks))]
+            elif op == "edit":
+                chunks[rng.randrange(len(chunks))] = rng.choice("ABCDEFGHIJ")
+            else:
+                i, j = rng.randrange(len(chunks)), rng.randrange(len(chunks))
+                chunks[i], chunks[j] = chunks[j], chunks[i]
+        stats = check_sync(store, chunks)
+        # Text that was not stored before always has to be embedded
+        assert stats["chunks_embedded"] >= len(set(chunks) - stored_texts)
+        stored_texts = set(chunks)
+        # And syncing the same version again is a no-op
+        check_sync(store, chunks, embedded=0, moved=0, deleted=0, unchanged=len(chunks))
+
+
+def write_document(tmp: str, paragraphs: int, tag: str = "") -> str:
+    path = os.path.join(tmp, FILENAME)
+    with open(path, "w") as f:
+        f.write("".join(f"Paragraph {i}{tag}: " + "lorem ipsum " * 40 + "\n" for i in range(paragraphs)))
+    return path
+
+
+def test_reupload_through_update_file():
+    store = install_store()
+    embedded = []
+
+    def fake_embed_documents(chunks):
+        embedded.extend(chunks)
+        return np.zeros((len(chunks), 4), dtype=np.float32)
+
+    real_embed_documents = embedder.embed_documents
+    embedder.embed_documents = fake_embed_documents
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_document(tmp, 12)
+
+            first = asyncio.run(ingest.update_file(TENANT, FILENAME, path))
+            assert first["chunks_embedded"] == first["chunks_total"] > 1
+            assert len(embedded) == first["chunks_total"]
+            rows = dict(store.rows)
+
+            embedded.clear()
+            again = asyncio.run(ingest.update_file(TENANT, FILENAME, path))
+            assert again["chunks_unchanged"] == again["chunks_total"] == first["chunks_total"]
+            assert again["chunks_embedded"] == again["chunks_moved"] == again["chunks_deleted"] == 0
+            assert embedded == []
+            assert store.rows == rows
+            assert store.files[(TENANT, FILENAME)]["chunk_count"] == first["chunks_total"]
+    finally:
+        embedder.embed_documents = real_embed_documents
+        executors.shutdown()
+
+
+def test_failed_update_leaves_stored_version():
+    store = install_store()
+    embedded = []
+
+    def failing_embed_documents(chunks):
+        # Fail in the document's second batch, once the first one is staged
+        if len(embedded) >= ingest.INGEST_BATCH_CHUNKS:
+            raise RuntimeError("embedder crashed")
+        embedded.extend(chunks)
+        return np.zeros((len(chunks), 4), dtype=np.float32)
+
+    real_embed_documents = embedder.embed_documents
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            embedder.embed_documents = lambda chunks: np.zeros((len(chunks), 4), dtype=np.float32)
+            asyncio.run(ingest.update_file(TENANT, FILENAME, write_document(tmp, 12)))
+            rows = dict(store.rows)
+            entry = dict(store.files[(TENANT, FILENAME)])
+
+            embedder.embed_documents = failing_embed_documents
+            path = write_document(tmp, 3 * ingest.INGEST_BATCH_CHUNKS, tag=" (v2)")
+            try:
+                asyncio.run(ingest.update_file(TENANT, FILENAME, path))
+                raise AssertionError("update_file should have failed")
+            except RuntimeError:
+                pass
+            assert len(embedded) == ingest.INGEST_BATCH_CHUNKS
+            assert store.rows == rows, "a failed update must not write or delete rows"
+            assert store.files[(TENANT, FILENAME)] == entry
+    finally:
+        embedder.embed_documents = real_embed_documents
+        executors.shutdown()
+
+
+def test_concurrent_updates_of_one_file_are_serialized():
+    store = install_store()
+    running = []
+    overlapped = []
+
+    def slow_embed_documents(chunks):
+        running.append(1)
+        if len(running) > 1:
+            overlapped.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+        return np.zeros((len(chunks), 4), dtype=np.float32)
+
+    async def upload_both(first: str, second: str):
+        return await asyncio.gather(
+            ingest.update_file(TENANT, FILENAME, first),
+            ingest.update_file(TENANT, FILENAME, second),
+        )
+
+    real_embed_documents = embedder.embed_documents
+    embedder.embed_documents = slow_embed_documents
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "a"))
+            os.makedirs(os.path.join(tmp, "b"))
+            first = write_document(os.path.join(tmp, "a"), 6, tag=" (a)")
+            second = write_document(os.path.join(tmp, "b"), 6, tag=" (b)")
+            a, b = asyncio.run(upload_both(first, second))
+            assert overlapped == [], "two ingestions of one file embedded at the same time"
+            # The second saw the first's rows: everything it replaced was deleted
+            assert b["chunks_deleted"] == a["chunks_total"]
+            assert store.count(TENANT, FILENAME) == b["chunks_total"]
+            assert all("(b)" in row["text"] for row in store.rows.values())
+    finally:
+        embedder.embed_documents = real_embed_documents
+        executors.shutdown()
+
+
+class FakeUpload:
+    """The part of FastAPI's UploadFile that uploads.spool_upload() reads."""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size: int = -1) -> bytes:
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
+def document_bytes(paragraphs: int, tag: str = "") -> bytes:
+    return "".join(f"Paragraph {i}{tag}: " + "lorem ipsum " * 40 + "\n" for i in range(paragraphs)).encode()
+
+
+def test_pipeline_failed_file_writes_nothing():
+    store = install_store()
+
+    def embed_documents(chunks):
+        if any("(broken)" in chunk for chunk in chunks):
+            raise RuntimeError("embedder crashed")
+        return np.zeros((len(chunks), 4), dtype=np.float32)
+
+    real_embed_documents = embedder.embed_documents
+    embedder.embed_documents = embed_documents
+    try:
+        results = asyncio.run(pipeline.ingest_files(TENANT, [
+            ("good.txt", FakeUpload("good.txt", document_bytes(6))),
+            ("bad.txt", FakeUpload("bad.txt", document_bytes(6, tag=" (broken)"))),
+        ]))
+        assert [r["status"] for r in results] == ["success", "error"]
+        assert store.count(TENANT, "good.txt") == results[0]["chunks_created"] > 0
+        assert store.count(TENANT, "bad.txt") == 0, "a failed file must not leave rows behind"
+        assert (TENANT, "bad.txt") not in store.files
+    finally:
+        embedder.embed_documents = real_embed_documents
+        executors.shutdown()
+
+
+def test_pipeline_duplicate_filenames():
+    store = install_store()
+    real_embed_documents = embedder.embed_documents
+    embedder.embed_documents = lambda chunks: np.zeros((len(chunks), 4), dtype=np.float32)
+    try:
+        results = asyncio.run(pipeline.ingest_files(TENANT, [
+            (FILENAME, FakeUpload(FILENAME, document_bytes(6, tag=" (first)"))),
+            (FILENAME, FakeUpload(FILENAME, document_bytes(9, tag=" (second)"))),
+        ]))
+        assert results[0]["status"] == "success"
+        assert results[1]["status"] == "error" and "Duplicate" in results[1]["error"]
+        assert store.count(TENANT, FILENAME) == results[0]["chunks_created"] > 0
+        assert all("(first)" in row["text"] for row in store.rows.values())
+    finally:
+        embedder.embed_documents = real_embed_documents
+        executors.shutdown()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_unchanged_edited_inserted_removed,
+        test_repeated_text,
+        test_random_edits,
+        test_reupload_through_update_file,
+        test_failed_update_leaves_stored_version,
+        test_concurrent_updates_of_one_file_are_serialized,
+        test_pipeline_failed_file_writes_nothing,
+        test_pipeline_duplicate_filenames,
+    ]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failures else 0)
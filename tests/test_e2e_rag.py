@@ -3,6 +3,7 @@
 End-to-end RAG test with real document.
 Tests: file parsing → chunking → embedding → Supabase storage → retrieval → LLM
 """
+import asyncio
 import sys
 import os
 from pathlib import Path
@@ -131,7 +132,7 @@ print()
 # Step 7: Generate answer with LLM
 print("🤖 Step 7: Generating answer with LLM...")
 try:
-    answer = generate_answer(test_query, context)
+    answer = asyncio.run(generate_answer(test_query, context))
     print(f"✅ Answer generated successfully")
     print(f"\n   Question: {test_query}")
     print(f"   Answer: {answer}")
@@ -3,6 +3,7 @@
 Test RAG system with multiple queries to verify no hallucination.
 Tests both questions that CAN and CANNOT be answered from the document.
 """
+import asyncio
 import sys
 import os
 
@@ -76,7 +77,7 @@ for i, test in enumerate(test_queries, 1):
         
         # Build context and generate answer
         context = build_context(results)
-        answer = generate_answer(test['question'], context)
+        answer = asyncio.run(generate_answer(test['question'], context))
         
         print(f"Answer: {answer}")
         print()
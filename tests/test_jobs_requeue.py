@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Interrupted-job recovery in the durable job store (services/jobs.py).
+
+A job left "running" when the process dies is requeued on the next start,
+unless it has used up JOB_MAX_ATTEMPTS: a document that crashes the
+process must end up failed, not requeued on every restart. A clean
+shutdown gives the job back without using up an attempt.
+
+No external services needed. Runs under pytest or directly:
+
+    python tests/test_jobs_requeue.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / "knowledge_svc"))
+
+from services import jobs
+
+
+def new_store(tmp: str) -> jobs.JobStore:
+    return jobs.JobStore(path=os.path.join(tmp, "jobs.sqlite"), spool_dir=os.path.join(tmp, "spool"))
+
+
+def submit_spooled(store: jobs.JobStore, tmp: str) -> dict:
+    upload = os.path.join(tmp, "upload.pdf")
+    with open(upload, "wb") as f:
+        f.write(b"%PDF-1.4")
+    return store.submit("tenant_a", "file", "crash.pdf", {}, upload_path=upload)
+
+
+def crash_and_restart(store: jobs.JobStore, job_id: str) -> dict:
+    """Claim the job, 'die' while it runs, and recover as a new process would."""
+    claimed = store.claim_next()
+    assert claimed is not None and claimed["id"] == job_id
+    assert claimed["status"] == "running"
+    jobs.requeue_interrupted(store)
+    return store.get(job_id)
+
+
+def test_job_interrupted_max_attempts_times_fails():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = new_store(tmp)
+        job = submit_spooled(store, tmp)
+        spooled = os.path.join(store.spool_dir, job["id"])
+
+        for attempt in range(1, jobs.JOB_MAX_ATTEMPTS):
+            job = crash_and_restart(store, job["id"])
+            assert job["status"] == "queued", f"attempt {attempt}: {job['status']}"
+            assert job["attempts"] == attempt
+            assert os.path.exists(spooled)
+
+        job = crash_and_restart(store, job["id"])
+        assert job["status"] == "failed"
+        assert job["attempts"] == jobs.JOB_MAX_ATTEMPTS
+        assert "Interrupted" in job["error"]
+        assert job["finished_at"] is not None
+        assert not os.path.exists(spooled), "the failed job's upload should be discarded"
+
+        # Nothing left to run: the next restart does not bring it back
+        assert store.claim_next() is None
+        jobs.requeue_interrupted(store)
+        assert store.get(job["id"])["status"] == "failed"
+        store.close()
+
+
+def test_requeue_leaves_other_jobs_alone():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = new_store(tmp)
+        queued = store.submit("tenant_a", "s3", "later.pdf", {"s3_bucket": "b", "s3_key": "k"})
+        done = store.submit("tenant_b", "s3", "done.pdf", {"s3_bucket": "b", "s3_key": "k"})
+        store.claim_next()  # tenant_a's job; then tenant_b's
+        store.finish(store.claim_next()["id"], {"chunks_created": 1})
+        store.fail(queued["id"], "transient", retry=True)
+
+        requeued, failed = store.requeue_running()
+        assert (requeued, failed) == (0, [])
+        assert store.get(queued["id"])["status"] == "queued"
+        assert store.get(done["id"])["status"] == "succeeded"
+        store.close()
+
+
+def test_clean_shutdown_refunds_the_attempt():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = new_store(tmp)
+        job = submit_spooled(store, tmp)
+        for _ in range(jobs.JOB_MAX_ATTEMPTS + 1):
+            assert store.claim_next()["id"] == job["id"]
+            store.release(job["id"])
+        job = store.get(job["id"])
+        assert job["status"] == "queued"
+        assert job["attempts"] == 0
+        store.close()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_job_interrupted_max_attempts_times_fails,
+        test_requeue_leaves_other_jobs_alone,
+        test_clean_shutdown_refunds_the_attempt,
+    ]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Parity check: ONNX Runtime embedder backend vs. the PyTorch backend.
+
+Embeds a fixture corpus (the sample documents in this directory, chunked)
+and a set of queries with both backends, then reports per-vector cosine
+drift and whether top-k retrieval still agrees.
+
+Requires an exported model (knowledge_svc/scripts/export_onnx.py).
+
+Usage:
+    python tests/test_onnx_parity.py [--model-file model_quantized.onnx] [--min-cosine 0.99]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / "knowledge_svc"))
+
+from services import embedder, chunker, file_parser
+
+FIXTURES = ["test_coffee_guide.txt", "test_python.txt", "plutonium_overview.docx"]
+
+QUERIES = [
+    "What is the golden ratio for coffee brewing?",
+    "How long does a French press steep?",
+    "How much caffeine is in espresso?",
+    "What is the atomic number of plutonium?",
+    "What spacecraft use plutonium RTGs?",
+    "What is Python used for?",
+    "refund policy?",
+]
+
+
+def load_corpus() -> list[str]:
+    texts = []
+    for name in FIXTURES:
+        path = TESTS_DIR / name
+        if not path.exists():
+            continue
+        text = file_parser.parse_file(name, path.read_bytes())
+        texts.extend(chunker.chunk_text(text, chunk_size=300, overlap=50))
+    return texts
+
+
+def embed(backend, texts: list[str], prefix: str) -> np.ndarray:
+    return embedder._encode([prefix + t for t in texts], embedder.EMBED_BATCH_SIZE, backend)
+
+
+def describe(name: str, cosines: np.ndarray) -> None:
+    print(f"  {name:<10} n={len(cosines):<4} "
+          f"mean={cosines.mean():.5f} min={cosines.min():.5f} "
+          f"p01={np.percentile(cosines, 1):.5f}")
+
+
+def run_parity(model_file: str, min_cosine: float, top_k: int = 5) -> bool:
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} chunks, {len(QUERIES)} queries")
+
+    torch_backend = embedder.TorchBackend()
+    onnx_backend = embedder.OnnxBackend(model_file=model_file)
+    print(f"Reference: {torch_backend.name}")
+    print(f"Candidate: {onnx_backend.name}")
+    print()
+
+    ref_docs = embed(torch_backend, corpus, embedder.DOCUMENT_PREFIX)
+    new_docs = embed(onnx_backend, corpus, embedder.DOCUMENT_PREFIX)
+    ref_queries = embed(torch_backend, QUERIES, embedder.QUERY_INSTRUCTION)
+    new_queries = embed(onnx_backend, QUERIES, embedder.QUERY_INSTRUCTION)
+
+    # Both backends return unit vectors, so the row-wise dot is the cosine
+    doc_cos = np.einsum("ij,ij->i", ref_docs, new_docs)
+    query_cos = np.einsum("ij,ij->i", ref_queries, new_queries)
+
+    print("Cosine similarity (torch vs onnx):")
+    describe("documents", doc_cos)
+    describe("queries", query_cos)
+
+    k = min(top_k, len(corpus))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    new_top = np.argsort(-(new_queries @ new_docs.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, new_top)])
+    top1 = np.mean(ref_top[:, 0] == new_top[:, 0])
+    print(f"Retrieval agreement: top-{k} overlap={overlap:.3f}, top-1 match={top1:.3f}")
+    print()
+
+    worst = min(doc_cos.min(), query_cos.min())
+    if worst < min_cosine:
+        print(f"❌ Drift too high: min cosine {worst:.5f} < {min_cosine}")
+        return False
+    print(f"✅ Parity OK: min cosine {worst:.5f} >= {min_cosine}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX vs torch embedding parity check")
+    parser.add_argument("--model-file", default=embedder.ONNX_MODEL_FILE)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(0 if run_parity(args.model_file, args.min_cosine, args.top_k) else 1)